@@ -1,10 +1,14 @@
 import os
 import sys
 import re
+import signal
+import hashlib
+import functools
 import json
 import time
 import random
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import aiohttp
 import asyncio
 import traceback
@@ -13,7 +17,22 @@ from cogs.support_system import SupportCog
 import logging # 用於記錄錯誤
 from cryptography.fernet import Fernet
 from typing import Optional, List, Dict, Tuple, Literal 
-from utils.config_manager import load_support_config, save_support_config
+from utils.config_manager import load_support_config, save_support_config, flush_configs
+from utils.config_events import CONFIG_EVENTS, ConfigChange
+from utils.command_log import CommandLogBuffer
+from utils.sse import SSE_HEADERS, LogLineBuffer, event_stream, parse_last_event_id
+from utils.log_pipeline import LOG_FORMAT, setup_logging
+from utils.audit_store import CommandAuditStore
+from utils.metrics import REGISTRY as METRICS
+from utils.command_metrics import instrument_tree
+from utils.loop_watchdog import LoopWatchdog
+from utils import profiler
+from utils.interaction_guard import InteractionDeadlineGuard, auto_defer, prepare_private_followup
+from utils.rest_telemetry import RestTelemetry
+from utils.guild_cache import GuildSnapshotCache
+from utils.member_index import MemberIndexRegistry
+from utils.bot_stats import BotStats
+from utils.presence import PresenceCoalescer
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands, ui, Interaction, TextChannel
@@ -70,8 +89,15 @@ TARGET_CHANNEL_ID = "1446781237422198855"
 MIMIC_USER_IDS = [1238436456041676853] 
 
 
+# 網頁模式：async = 直接跑在機器人的事件循環上 (預設)；thread = 原本的 Flask 開發伺服器執行緒；
+# none = 機器人行程不開網頁 (由 gunicorn 負責)；ipc = gunicorn worker 行程，透過 IPC 跟機器人行程溝通
+WEB_MODE = os.getenv("WEB_MODE", "async").lower()
+# ipc 模式下每個 gunicorn worker 都會 import 這個檔案，但不會登入 Discord：
+# 不需要 Token，也不能寫 bot.log、開稽核寫入執行緒 (那些只屬於機器人行程)
+BOT_PROCESS = WEB_MODE != "ipc"
+
 TOKEN = os.getenv("DISCORD_TOKEN") # 確保你的環境變數名稱是對應的
-if not TOKEN:
+if BOT_PROCESS and not TOKEN:
     raise ValueError("找不到 DISCORD_TOKEN 環境變數！")
 
 
@@ -90,26 +116,48 @@ async def log_command(interaction, command_name: str):
     try:
         guild_name = interaction.guild.name if interaction.guild else "DM"
         guild_id = interaction.guild.id if interaction.guild else None
-        entry = {"time": safe_now(), "text": f"{interaction.user} 在 {guild_name}({guild_id}) 執行 {command_name}"}
-        COMMAND_LOGS.append(entry)
-        # keep max 200 logs
-        if len(COMMAND_LOGS) > 200:
-            COMMAND_LOGS.pop(0)
-        print(f"[LOG] {entry['time']} - {entry['text']}")
+        user_id = interaction.user.id
+        entry = {
+            "time": safe_now(),
+            "text": f"{interaction.user} 在 {guild_name}({guild_id}) 執行 {command_name}",
+            "guild_id": str(guild_id) if guild_id else None,
+            "user_id": str(user_id),
+            "command": command_name,
+        }
+        # 環形緩衝區：O(1) 寫入，超過容量自動覆蓋最舊的紀錄
+        COMMAND_LOGS.append(entry, guild_id=guild_id, user_id=user_id)
+        # 永久保存：只丟進佇列，由背景執行緒批次寫入 SQLite
+        COMMAND_AUDIT.record(entry, guild_id=guild_id, user_id=user_id)
+        command_logger.info(f"[LOG] {entry['time']} - {entry['text']}")
     except Exception:
-        print(f"[LOG] {safe_now()} - {command_name} executed (no interaction details).")
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s:%(levelname)s:%(name)s: %(message)s',
-    handlers=[
-        logging.FileHandler(filename='bot.log', encoding='utf-8', mode='a'), # 寫入檔案
-        logging.StreamHandler() # 同時顯示在終端機
-    ]
-)
+        command_logger.info(f"[LOG] {safe_now()} - {command_name} executed (no interaction details).")
+
+# 即時日誌串流用的記憶體緩衝 (供 /get_raw_logs/stream 推播，不必重讀 bot.log)
+LOG_LINES = LogLineBuffer(int(os.getenv("LOG_STREAM_CAPACITY", 1000)))
+
+# 所有 logging / print 只丟進佇列，寫檔、輪替 (bot.log.N.gz) 都在背景執行緒處理
+# gunicorn worker 只輸出到 stderr (交給 gunicorn 收集)：多個行程同時輪替同一個 bot.log 會掉資料
+if BOT_PROCESS:
+    LOG_LISTENER = setup_logging(
+        log_path='bot.log',
+        level=logging.INFO,
+        extra_handlers=[LOG_LINES],
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", 7)),
+        interval=float(os.getenv("LOG_ROTATE_INTERVAL", 86400)),
+    )
+else:
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, stream=sys.__stderr__)
+    LOG_LISTENER = None
+command_logger = logging.getLogger("commands")
 
 # Shared globals
-COMMAND_LOGS: List[Dict] = []
+COMMAND_LOG_CAPACITY = int(os.getenv("COMMAND_LOG_CAPACITY", 5000))
+COMMAND_LOGS = CommandLogBuffer(COMMAND_LOG_CAPACITY)
+# 稽核資料庫只由機器人行程寫入；worker 行程透過 IPC 查詢 (見 AUDIT_SOURCE)
+COMMAND_AUDIT = CommandAuditStore(os.getenv("COMMAND_AUDIT_DB", "data/command_audit.db"))
+if BOT_PROCESS:
+    COMMAND_AUDIT.start()
 SPECIAL_USER_IDS = [1238436456041676853]
 LOG_VIEWER_IDS = [1238436456041676853]
 HUNDRED_PERCENT_IDS = [1343900739407319070,1227927780231090177]
@@ -133,7 +181,41 @@ intents.voice_states = True
 intents.guilds = True
 
 # 🔴 確保 bot 的初始化放在所有 intents 設定的「最後面」
-bot = commands.Bot(command_prefix="!", intents=intents)
+# 📡 Discord REST 呼叫統計：TraceConfig 掛進 bot.http 的 aiohttp session，依路由 / bucket / 呼叫來源記錄
+REST_TELEMETRY = RestTelemetry()
+bot = commands.Bot(command_prefix="!", intents=intents, http_trace=REST_TELEMETRY.trace_config)
+REST_TELEMETRY.instrument(bot.http)
+
+# ⏳ 斜線指令 3 秒回應期限保護：快到期還沒回應就自動 defer，之後的 send_message 自動改走 followup
+# 每個指令用 @auto_defer 決定公開或私人 defer；沒標記的指令用 INTERACTION_AUTO_DEFER (預設 off，不自動 defer)
+DEADLINE_GUARD = InteractionDeadlineGuard(
+    margin=float(os.getenv("INTERACTION_DEFER_MARGIN", 0.6)),
+    default=os.getenv("INTERACTION_AUTO_DEFER", "off"),
+).install(bot.tree)
+
+# 🗂️ 儀表板用的伺服器快照快取 (TTL + Gateway 事件失效)，避免每次開頁面都 fetch_guild
+GUILD_CACHE = GuildSnapshotCache(
+    bot,
+    ttl=float(os.getenv("GUILD_CACHE_TTL", 300)),
+    max_size=int(os.getenv("GUILD_CACHE_SIZE", 1000)),
+).install()
+
+# 👥 成員清單索引 (Gateway 成員快取 + 事件增量更新)，成員頁面的搜尋與分頁都走這裡
+MEMBER_INDEX = MemberIndexRegistry(bot).install()
+
+# 🟢 機器人狀態更新合併：短時間內的多次更新只送出最後一次
+PRESENCE = PresenceCoalescer(bot, min_interval=float(os.getenv("PRESENCE_MIN_INTERVAL", 2)))
+
+# 📣 設定變更紀錄：後台、cog 或手動修改設定檔都會留下一行日誌 (只列欄位名稱，不記內容)
+config_logger = logging.getLogger("config")
+
+def log_config_change(event: ConfigChange):
+    target = f"伺服器 {event.guild_id}" if event.guild_id is not None else event.scope
+    config_logger.info(f"⚙️ {target} 設定已更新 ({event.source}): {', '.join(sorted(event.keys))}")
+
+# 網頁 worker 收到的是機器人行程轉發的同一批事件，機器人行程記過就好
+if BOT_PROCESS:
+    CONFIG_EVENTS.subscribe("", log_config_change)
 
 app = Flask(__name__)
 app.secret_key = FLASK_SECRET_KEY
@@ -343,6 +425,15 @@ class RPSView(ui.View):
 # =========================
 active_games: Dict[int, RPSView] = {}
 
+# 📊 全機器人統計：伺服器數 / 成員總數由 Gateway 事件維護，其他數字都是 O(1) 取值
+BOT_STATS = BotStats(bot, sample_interval=float(os.getenv("BOT_STATS_INTERVAL", 60))).install()
+BOT_STATS.add_source("support_configs", lambda: len(getattr(bot.get_cog("SupportCog"), "support_config", {})))
+BOT_STATS.add_source(
+    "active_games",
+    lambda: len(active_games) + len(getattr(bot.get_cog("MinesweeperTextCog"), "active_games", {})),
+)
+BOT_STATS.add_source("voice_connections", lambda: len(bot.voice_clients))
+
 # =========================
 # COGS (單檔案實作) — 每個 Cog 都以 class 定義並在 on_ready 加入
 # 一些只含一個指令的 Cog（Help, Logs, Ping, ReactionRole）照你要求給完整 Cog
@@ -350,8 +441,7 @@ active_games: Dict[int, RPSView] = {}
 # --- 1. 定義還原確認的 Discord 介面 (Modal) ---
 
 
-# 設定日誌
-logging.basicConfig(level=logging.INFO)
+# 設定日誌 (handler 已由 setup_logging 統一設定)
 logger = logging.getLogger("BackupSystem")
 
 
@@ -390,6 +480,7 @@ class LogsCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    @auto_defer(ephemeral=True)
     @app_commands.command(name="logs", description="在 Discord 訊息中顯示最近的指令紀錄")
     async def logs(self, interaction: Interaction):
         await log_command(interaction, "/logs")
@@ -405,7 +496,7 @@ class LogsCog(commands.Cog):
         if not COMMAND_LOGS:
             logs_text += "目前沒有任何紀錄。"
         else:
-            logs_text += "\n".join([f"`{log['time']}`: {log['text']}" for log in COMMAND_LOGS[-10:]])
+            logs_text += "\n".join([f"`{log['time']}`: {log['text']}" for log in COMMAND_LOGS.latest(10)])
         try:
             await interaction.response.send_message(logs_text, ephemeral=True)
         except Exception:
@@ -677,6 +768,7 @@ class UtilityCog(commands.Cog):
         await target_channel.send(content=message, reference=reply_ref)
         await interaction.followup.send(f"✅ 訊息已發送", ephemeral=True)
 
+    @auto_defer(ephemeral=True)
     @app_commands.command(name="mimic", description=" 模仿他人說話")
     @app_commands.describe(user="要模仿的人", message="要說的話", channel="頻道 (選填)")
     @app_commands.default_permissions(administrator=True)
@@ -726,6 +818,7 @@ class UtilityCog(commands.Cog):
         await target_channel.send(content=mention, embed=embed)
         await interaction.followup.send(f"✅ 公告已發送到 {target_channel.mention}", ephemeral=True)
 
+    @auto_defer()
     @app_commands.command(name="calc", description="簡單計算器")
     async def calc(self, interaction: Interaction, expr: str):
         await log_command(interaction, "/calc")
@@ -849,6 +942,7 @@ class ModerationCog(commands.Cog):
 class FunCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+    @auto_defer()
     @app_commands.command(name="gay", description="測試一個人的隨機同性戀機率 (1-100%)")
     async def gay_probability(self, interaction: discord.Interaction, user: Optional[discord.User] = None):
         # 紀錄指令使用
@@ -916,18 +1010,21 @@ class FunCog(commands.Cog):
         view.message = await interaction.followup.send(embed=embed, view=view)
         active_games[interaction.user.id] = view
 
+    @auto_defer()
     @app_commands.command(name="氣泡紙", description="發送一個巨大的氣泡紙，來戳爆它吧！")
     async def bubble_wrap_command(self, interaction: Interaction):
         await log_command(interaction, "/氣泡紙")
         bubble = "||啪|| " * 200
         await interaction.response.send_message(f"點擊這些氣泡來戳爆它們！\n{bubble}")
 
+    @auto_defer()
     @app_commands.command(name="dice", description="擲一顆 1-6 的骰子")
     async def dice(self, interaction: Interaction):
         await log_command(interaction, "/dice")
         number = random.randint(1, 6)
         await interaction.response.send_message(f"🎲 {interaction.user.mention} 擲出了 **{number}**！")
 
+    @auto_defer()
     @app_commands.command(name="抽籤", description="在多個選項中做出隨機決定。選項之間用逗號（,）分隔")
     async def choose(self, interaction: Interaction, options: str):
         await log_command(interaction, "/抽籤")
@@ -1252,6 +1349,7 @@ class MinesweeperTextCog(commands.Cog):
             )
             view.message = await interaction.original_response()
 
+    @auto_defer()
     @app_commands.command(name="踩地雷", description="開始一個文字版踩地雷遊戲！")
     @app_commands.describe(difficulty="選擇遊戲難度")
     @app_commands.choices(difficulty=[
@@ -1303,6 +1401,8 @@ async def on_app_command_error(interaction: Interaction, error):
             else:
                 print("Unhandled command error:", type(error).__name__, error)
                 msg = f"❌ 指令錯誤：{error}"
+            # 被公開自動 defer 過的話，先收掉公開的「思考中」訊息，錯誤訊息才不會整個頻道都看得到
+            await prepare_private_followup(interaction)
             await interaction.followup.send(msg, ephemeral=True)
             return
     except Exception:
@@ -1334,13 +1434,26 @@ async def on_ready():
     # 標記為已執行
     bot._has_setup_completed = True
     
-    global discord_loop
+    global discord_loop, discord_loop_thread_id
     try:
         discord_loop = asyncio.get_running_loop()
+        discord_loop_thread_id = threading.get_ident()
     except Exception:
         discord_loop = None
 
+    # 📣 設定變更事件從這裡開始在 Discord 事件循環上通知 (之前發生的會補送)
+    if discord_loop is not None:
+        CONFIG_EVENTS.bind_loop(discord_loop)
+
     print(f"[{safe_now()}] Bot logged in as {bot.user} ({bot.user.id})")
+
+    # 🐢 事件循環卡頓偵測：延遲超過門檻時記錄事件循環的堆疊
+    if discord_loop is not None:
+        LoopWatchdog(
+            discord_loop,
+            interval=float(os.getenv("LOOP_WATCHDOG_INTERVAL", 0.25)),
+            threshold=float(os.getenv("LOOP_STALL_THRESHOLD", 0.5)),
+        ).start()
     
     # 💡 這裡就是啟動輪播的核心程式碼！
     if not status_carousel_task.is_running():
@@ -1364,6 +1477,13 @@ async def on_ready():
         except Exception as e:
             print(f"❌ {cog.__name__} 載入失敗: {e}")
 
+    # --- 1.5 替所有斜線指令加上延遲 / 錯誤統計 (/metrics) ---
+    try:
+        count = instrument_tree(bot.tree)
+        print(f"✅ 已為 {count} 個斜線指令加上效能統計")
+    except Exception as e:
+        print(f"❌ 指令統計安裝失敗: {e}")
+
     # --- 2. 註冊持久化 View ---
     try:
         bot.add_view(ReplyView())
@@ -1381,7 +1501,7 @@ async def on_ready():
 
     # --- 4. 設定 Bot 狀態 ---
     try:
-        await bot.change_presence(
+        PRESENCE.update(
             status=discord.Status.online, 
             activity=discord.Game(name="服務中 | /help")
         )
@@ -1393,14 +1513,22 @@ async def on_ready():
 
 import os
 import asyncio
-import requests
 import discord
-from flask import Flask, render_template, session, redirect, url_for, request, jsonify, flash, send_from_directory
+from flask import Flask, render_template, session, redirect, url_for, request, jsonify, flash, send_from_directory, Response
 from werkzeug.utils import secure_filename
 import uuid # 用於生成獨特的檔案名
 import random # 用於隨機邏輯 (儘管在此版本中已棄用)
-from utils.config_manager import load_config, save_config
-from utils.time_utils import safe_now
+from utils.config_manager import config_version, aload_config, aupdate_config, invalidate_config
+from utils.time_utils import safe_now, parse_local_time
+from utils import log_tail
+from utils.async_web import AsyncWebServer, bind_async_views
+from utils.oauth_client import OAuthClient, OAuthError
+from utils.session_store import PRELOADED_SESSION, OAuthAccountStore, ServerSideSessionInterface, SessionStore
+from utils.static_assets import StaticAssets, install_compression
+from utils.rate_limit import RateLimiter
+from utils.ipc import BotBridge, IPCClient, IPCError, IPCServer, RemoteAuditStore, RemoteLogSource
+from utils.guild_cache import GuildSnapshot
+from utils.conditional import ConditionalResponses, Validator, file_version, tree_fingerprint
 
 
 
@@ -1408,6 +1536,104 @@ app = Flask(__name__)
 # 建議使用環境變數設定 FLASK_SECRET_KEY
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "change_this_to_secure_key")
 
+# 🍪 伺服器端 session：Cookie 只放隨機 ID；SESSION_STORE_PATH 設為空字串則只存在記憶體
+# 多個 worker 行程共用同一個 SQLite 檔時 (ipc 模式) 不使用行程內快取，讀寫都直接進資料庫
+SESSION_STORE = SessionStore(
+    os.getenv("SESSION_STORE_PATH", "data/sessions.db"),
+    max_entries=int(os.getenv("SESSION_CACHE_SIZE", 10000)),
+    shared=WEB_MODE == "ipc",
+).start()
+app.session_interface = ServerSideSessionInterface(SESSION_STORE)
+
+# 🗜️ 靜態資源：啟動時最佳化 / 預壓縮並加上內容指紋 (模板用 asset_url() 取得網址，可永久快取)；
+# 模板與 JSON 回應則在送出前動態 gzip
+STATIC_ASSETS = StaticAssets(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"),
+    cache_dir=os.getenv("ASSET_CACHE_DIR", "data/assets"),
+).build().init_app(app)
+install_compression(app, min_size=int(os.getenv("WEB_GZIP_MIN_SIZE", 1024)))
+
+# 🚦 儀表板 API 限流 (依登入使用者與來源 IP)；額度格式 "次數/秒數"，可用環境變數調整
+# 在 Render 等反向代理後面時設定 RATE_LIMIT_PROXY_HOPS=1，才拿得到真正的來源 IP
+RATE_LIMITER = RateLimiter(proxy_hops=int(os.getenv("RATE_LIMIT_PROXY_HOPS", 0)))
+RATE_LIMIT_UPDATE_STATUS = os.getenv("RATE_LIMIT_UPDATE_STATUS", "5/10")
+RATE_LIMIT_BLACKLIST = os.getenv("RATE_LIMIT_BLACKLIST", "10/60")
+RATE_LIMIT_UPLOAD = os.getenv("RATE_LIMIT_UPLOAD", "5/60")
+RATE_LIMIT_LOGS_DATA = os.getenv("RATE_LIMIT_LOGS_DATA", "30/10")
+
+# 🏷️ 條件式 GET：依各頁面依賴的資料版本產生 ETag，沒變就回 304 (不跑模板)；模板或靜態檔改版時全部失效
+# BOOT_ID 每次啟動都不同：記憶體內的序號 (日誌、快照版本) 重啟後會從頭開始，但 session 與瀏覽器快取還在
+BOOT_ID = uuid.uuid4().hex
+RESPONSES = ConditionalResponses(
+    salt=tree_fingerprint(os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+    + STATIC_ASSETS.fingerprint() + BOOT_ID,
+)
+
+# Discord 事件循環 (on_ready 時設定)；async 路由在執行緒模式下會被丟到這個事件循環執行
+discord_loop = None
+discord_loop_thread_id = None
+
+# 🔌 機器人 ↔ 網頁 worker 的 IPC：儀表板路由一律透過 BOT_BRIDGE 取得機器人的資料 / 操作機器人
+# 單一行程 (預設)：BOT_BRIDGE 直接呼叫下面註冊的 handler，不經過 socket
+# 多 worker：機器人行程設 BOT_IPC_ADDRESS=unix:/tmp/flork-bot.sock WEB_MODE=none 執行 python bot.py，
+#            網頁用同樣的 BOT_IPC_ADDRESS 加上 WEB_MODE=ipc 執行 gunicorn -w 4 bot:app
+BOT_IPC_ADDRESS = os.getenv("BOT_IPC_ADDRESS", "")
+# 密鑰：BOT_IPC_TOKEN，沒設定時由 FLASK_SECRET_KEY 推導；兩者都沒有 (或還是預設值) 就拒絕開啟 IPC
+# TCP 位址只接受 loopback，真的要跨主機時設 BOT_IPC_ALLOW_REMOTE=1 (請搭配防火牆 / 私有網路)
+BOT_IPC_TOKEN = os.getenv("BOT_IPC_TOKEN") or hashlib.sha256(f"bot-ipc:{app.secret_key}".encode()).hexdigest()
+BOT_IPC_ALLOW_REMOTE = os.getenv("BOT_IPC_ALLOW_REMOTE", "0") == "1"
+if WEB_MODE == "ipc" and not BOT_IPC_ADDRESS:
+    raise RuntimeError("WEB_MODE=ipc 需要設定 BOT_IPC_ADDRESS")
+if BOT_IPC_ADDRESS and not os.getenv("BOT_IPC_TOKEN") and os.getenv("FLASK_SECRET_KEY") in (None, "", "change_this_to_secure_key"):
+    raise RuntimeError("啟用 IPC (BOT_IPC_ADDRESS) 需要設定 BOT_IPC_TOKEN，或設定非預設值的 FLASK_SECRET_KEY")
+IPC_SERVER = IPCServer(BOT_IPC_ADDRESS if WEB_MODE != "ipc" else None, BOT_IPC_TOKEN, allow_remote=BOT_IPC_ALLOW_REMOTE)
+BOT_BRIDGE = BotBridge(
+    IPC_SERVER,
+    IPCClient(
+        BOT_IPC_ADDRESS,
+        BOT_IPC_TOKEN,
+        pool_size=int(os.getenv("BOT_IPC_POOL_SIZE", 8)),
+        timeout=float(os.getenv("BOT_IPC_TIMEOUT", 10)),
+        allow_remote=BOT_IPC_ALLOW_REMOTE,
+    ) if WEB_MODE == "ipc" else None,
+    local_loop=lambda: discord_loop,
+)
+bind_async_views(app, BOT_BRIDGE.loop)
+
+# 日誌來源：worker 行程換成透過 IPC 讀取機器人行程的緩衝區 / 稽核資料庫
+COMMAND_LOG_SOURCE = RemoteLogSource(BOT_BRIDGE, "commands") if BOT_BRIDGE.remote else COMMAND_LOGS
+LOG_LINE_SOURCE = RemoteLogSource(BOT_BRIDGE, "lines") if BOT_BRIDGE.remote else LOG_LINES
+AUDIT_SOURCE = RemoteAuditStore(BOT_BRIDGE) if BOT_BRIDGE.remote else COMMAND_AUDIT
+
+
+# 📣 設定變更 → 衍生快取失效 (依主題前綴訂閱；事件都來自 config_manager，worker 行程由 relay_config_events 轉發過來)
+def bump_guild_pages(event: ConfigChange):
+    """設定頁面的 ETag 帶有這個伺服器的設定世代，設定一變就不會再回 304。"""
+    if event.guild_id is not None:
+        RESPONSES.invalidate(("guild", event.guild_id))
+
+
+def drop_guild_snapshot(event: ConfigChange):
+    """機器人行程：丟掉伺服器快照，下次開頁面從 Gateway 快取重建；快照版本也是 ETag 的一部分，
+    所以轉發還沒送到的 worker 也會因為 guild_version 改變而重新產生頁面。"""
+    if event.guild_id is not None:
+        GUILD_CACHE.invalidate(event.guild_id, "config")
+
+
+def drop_worker_config(event: ConfigChange):
+    """worker 行程：設定是機器人行程寫的，丟掉本行程的快取，下次讀取回後端確認。"""
+    if event.guild_id is not None:
+        invalidate_config(event.guild_id)
+
+
+for _prefix in ("guild.", "support."):
+    CONFIG_EVENTS.subscribe(_prefix, bump_guild_pages, inline=True)
+    if BOT_PROCESS:
+        # GUILD_CACHE 只能在 Discord 事件循環上操作
+        CONFIG_EVENTS.subscribe(_prefix, drop_guild_snapshot)
+if BOT_BRIDGE.remote:
+    CONFIG_EVENTS.subscribe("guild.", drop_worker_config, inline=True)
+
 
 # ===============================================
 # 🔧 基礎配置與變數
@@ -1423,9 +1649,35 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 DISCORD_CLIENT_ID = os.getenv("DISCORD_CLIENT_ID")
 DISCORD_CLIENT_SECRET = os.getenv("DISCORD_CLIENT_SECRET")
 DISCORD_REDIRECT_URI = os.getenv("DISCORD_REDIRECT_URI")
-DISCORD_API_BASE_URL = "https://discord.com/api/v10"
-TOKEN_URL = f"{DISCORD_API_BASE_URL}/oauth2/token"
-USER_URL = f"{DISCORD_API_BASE_URL}/users/@me"
+DISCORD_API_BASE_URL = os.getenv("DISCORD_API_BASE_URL", "https://discord.com/api/v10")
+
+# 🔐 OAuth 用戶端：共用連線池、記住 refresh token，管理員伺服器清單過期後在背景重新抓取
+# 授權紀錄跟 session 存在同一個資料庫 (依使用者一筆，多個 session 共用)，重啟後與其他 worker 都能繼續更新
+# token 以 Fernet 加密後才寫入：OAUTH_TOKEN_KEY (Fernet.generate_key() 產生)，沒設定時由非預設值的
+# FLASK_SECRET_KEY 推導；兩者都沒有時 token 不寫入磁碟
+def _oauth_token_key() -> Optional[bytes]:
+    key = os.getenv("OAUTH_TOKEN_KEY")
+    if key:
+        return key.encode()
+    secret = os.getenv("FLASK_SECRET_KEY")
+    if secret and secret != "change_this_to_secure_key":
+        return base64.urlsafe_b64encode(hashlib.sha256(f"oauth-token:{secret}".encode()).digest())
+    return None
+
+
+OAUTH = OAuthClient(
+    DISCORD_CLIENT_ID,
+    DISCORD_CLIENT_SECRET,
+    DISCORD_REDIRECT_URI,
+    api_base=DISCORD_API_BASE_URL,
+    required_permissions=ADMINISTRATOR_PERMISSION,
+    guild_ttl=float(os.getenv("OAUTH_GUILD_TTL", 300)),
+    store=OAuthAccountStore(SESSION_STORE.path, shared=SESSION_STORE.shared, key=_oauth_token_key()).start(),
+)
+
+# SSE 推播設定：心跳間隔與每個連線一次最多補送的筆數
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+SSE_CLIENT_BACKLOG = int(os.getenv("SSE_CLIENT_BACKLOG", 200))
 
 # 權限設定 (與您的儀表板邏輯保持一致)
 ADMINISTRATOR_PERMISSION = 0x8
@@ -1464,6 +1716,10 @@ def allowed_file(filename):
 
 # --- 路由: 網頁上傳處理 (完整替換) ---
 @app.route('/upload_web', methods=['GET', 'POST'])
+@RATE_LIMITER.limit(
+    "upload_web", RATE_LIMIT_UPLOAD, methods=("POST",),
+    on_limited=lambda seconds: render_template('upload.html', message=f"❌ 上傳太頻繁，請 {seconds} 秒後再試", status="error"),
+)
 def upload_file_from_web():
     if request.method == 'POST':
         # 1. 檢查是否有檔案上傳
@@ -1539,7 +1795,7 @@ AUTH_URL = (
 )
 
 @app.route("/")
-def index():
+async def index():
     user_data = session.get("discord_user")
     guilds_data = session.get("discord_guilds")
     if not user_data or not guilds_data:
@@ -1567,21 +1823,16 @@ def index():
 # --------------------------
 
 @app.route("/guild/<int:guild_id>")
-def guild_dashboard(guild_id):
+async def guild_dashboard(guild_id):
     user_data = session.get("discord_user")
     guilds_data = session.get("discord_guilds")
     if not user_data or not guilds_data:
         return redirect(url_for('index'))
 
-    guild_found = any(
-        (int(g['id']) == guild_id and (int(g.get('permissions', '0')) & ADMINISTRATOR_PERMISSION) == ADMINISTRATOR_PERMISSION)
-        for g in guilds_data
-    )
-    if not guild_found:
+    if guild_id not in session.admin_guild_ids:
         return "❌ 權限不足：你沒有權限管理這個伺服器。", 403
 
-    global discord_loop
-    if discord_loop is None or not discord_loop.is_running():
+    if not BOT_BRIDGE.available():
         return "❌ 內部錯誤：Discord 機器人事件循環尚未啟動。", 503
 
     # 由於 settings 會執行更嚴格的檢查，這裡保持 redirect
@@ -1589,55 +1840,62 @@ def guild_dashboard(guild_id):
 
     return redirect(url_for('settings', guild_id=guild_id))
 
+def is_guild_admin(guild_id, module=None):
+    """設定頁面的授權檢查 (條件式 GET 先跑這個，未授權不會去查版本)。"""
+    return bool(session.get("discord_user") and session.get("discord_guilds")) and guild_id in session.admin_guild_ids
+
+async def guild_page_version(guild_id, module=None):
+    """設定頁面的版本：伺服器快照版本 + 設定檔版本 (快照還沒進快取時無法事先判斷)。"""
+    guild_version = await BOT_BRIDGE.call("guild_version", guild_id=guild_id)
+    if guild_version is None:
+        return None
+    return Validator((guild_version, config_version(guild_id), RESPONSES.generation(("guild", guild_id))))
+
 # 伺服器設定
 @app.route("/guild/<int:guild_id>/settings", methods=['GET', 'POST'])
 @app.route("/guild/<int:guild_id>/settings/<string:module>", methods=['GET', 'POST'])
-def settings(guild_id, module=None):
+@RESPONSES.conditional("settings", guild_page_version, allow=is_guild_admin)
+async def settings(guild_id, module=None):
     user_data = session.get("discord_user")
     guilds_data = session.get("discord_guilds")
     if not user_data or not guilds_data:
         return redirect(url_for('index'))
 
-    guild_found = any(
-        (int(g['id']) == guild_id and (int(g.get('permissions', '0')) & ADMINISTRATOR_PERMISSION) == ADMINISTRATOR_PERMISSION)
-        for g in guilds_data
-    )
-    if not guild_found:
+    if guild_id not in session.admin_guild_ids:
         return "❌ 你沒有權限管理這個伺服器", 403
 
-    global discord_loop
-    if discord_loop is None or not discord_loop.is_running():
+    if not BOT_BRIDGE.available():
         return "❌ 內部錯誤：Discord 機器人事件循環尚未啟動。", 503
 
-    # ❗ 修正點 1.1: 嘗試從緩存獲取
-    guild_obj = bot.get_guild(guild_id)
-    
-    # ❗ 修正點 1.2: 如果緩存失敗，嘗試異步 API 獲取
-    if guild_obj is None:
-        try:
-            future_guild = asyncio.run_coroutine_threadsafe(bot.fetch_guild(guild_id), discord_loop)
-            # 等待 5 秒鐘 API 響應
-            guild_obj = future_guild.result(timeout=5)
-        except Exception as e:
-            # API 獲取失敗 (例如機器人不在伺服器或超時)
-            guild_obj = None 
-            print(f"API Fetch Guild Error: {e}")
+    # ❗ 修正點 1.1: 從伺服器快照快取獲取 (快取沒有時才會呼叫 API，最多等 5 秒)
+    guild_obj = await get_guild_snapshot(guild_id)
 
     if guild_obj is None:
         return "❌ 錯誤：找不到該伺服器、機器人不在其中，或連線超時。", 404
 
-    config = load_config(guild_id)  # 你自訂的設定讀取函式
-
     if request.method == 'POST':
         if module == 'notifications':
-            config['welcome_channel_id'] = request.form.get('welcome_channel_id', '')
-            config['video_notification_channel_id'] = request.form.get('video_channel_id', '')
-            config['video_notification_message'] = request.form.get('video_message', '')
-            config['live_notification_message'] = request.form.get('live_message', '')
-            save_config(guild_id, config)  # 你自訂的設定存檔函式
+            # 只更新這個表單的欄位，由機器人行程依序套用，不會蓋掉 cog 同時做的修改
+            try:
+                await BOT_BRIDGE.call("config_update", guild_id=guild_id, changes={
+                    'welcome_channel_id': request.form.get('welcome_channel_id', ''),
+                    'video_notification_channel_id': request.form.get('video_channel_id', ''),
+                    'video_notification_message': request.form.get('video_message', ''),
+                    'live_notification_message': request.form.get('live_message', ''),
+                }, durable=BOT_BRIDGE.remote, source="dashboard")
+            except IPCError as e:
+                if e.kind != "TimeoutError":
+                    raise
+                # 機器人行程已經收下設定，只是還沒寫進儲存後端 (之後會重試)
+                return "⚠️ 設定已送出，但尚未寫入儲存空間，請稍後重新整理確認。", 503
+            if BOT_BRIDGE.remote:
+                # 設定是機器人行程寫的，這個 worker 的快取要重新讀取
+                invalidate_config(guild_id)
             return redirect(url_for('settings', guild_id=guild_id, module=module))
         return redirect(url_for('settings', guild_id=guild_id))
 
+    config = await aload_config(guild_id)
+
     context = {
         'guild_obj': guild_obj,
         'user_data': user_data,
@@ -1654,81 +1912,118 @@ def settings(guild_id, module=None):
     else:
         return render_template('settings_main.html', **context)
 
-# 成員列表
-@app.route("/guild/<int:guild_id>/members")
-def members_page(guild_id):
+# 成員列表：頁面只輸出外框，成員由前端依 cursor 分頁串流載入 (資料來自 Gateway 成員快取的排序索引)
+MEMBERS_PAGE_SIZE = 100
+MEMBERS_STREAM_MAX = 1000
+
+
+def _members_access_error(guild_id):
+    """成員頁面與 API 共用的權限 / 狀態檢查，通過時回傳 None。"""
     user_data = session.get("discord_user")
     guilds_data = session.get("discord_guilds")
     if not user_data or not guilds_data:
-        return redirect(url_for('index'))
+        return "❌ 請先登入", 401
 
-    guild_found = any(
-        (int(g['id']) == guild_id and (int(g.get('permissions', '0')) & ADMINISTRATOR_PERMISSION) == ADMINISTRATOR_PERMISSION)
-        for g in guilds_data
-    )
-    if not guild_found:
+    if guild_id not in session.admin_guild_ids:
         return "❌ 你沒有權限管理這個伺服器", 403
 
-    global discord_loop
-    if discord_loop is None or not discord_loop.is_running():
+    if not BOT_BRIDGE.available():
         return "❌ 內部錯誤：Discord 機器人事件循環尚未啟動。", 503
+    return None
 
-    try:
-        # ❗ 修正點 2.1: 嘗試從緩存獲取
-        guild_obj = bot.get_guild(guild_id)
-        if guild_obj is None:
-            # 如果緩存失敗，嘗試異步 API 獲取
-            future_guild = asyncio.run_coroutine_threadsafe(bot.fetch_guild(guild_id), discord_loop)
-            guild_obj = future_guild.result(timeout=5)
-            
-        if not guild_obj:
-            return "❌ 找不到這個伺服器", 404
-
-        # 這裡獲取成員需要異步，保留 run_coroutine_threadsafe
-        future_members = asyncio.run_coroutine_threadsafe(guild_obj.fetch_members(limit=None), discord_loop)
-        members = future_members.result(timeout=10)
-        members_list = [
-            {
-                "id": m.id,
-                "name": m.display_name,
-                "avatar": m.avatar.url if m.avatar else m.default_avatar.url,
-                "joined_at": m.joined_at.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            for m in members
-        ]
-        return render_template('members.html', guild_obj=guild_obj, members=members_list)
-
-    except (discord.Forbidden, discord.HTTPException) as e:
-        return f"❌ Discord 存取錯誤：請檢查機器人是否開啟 **SERVER MEMBERS INTENT** 且擁有伺服器管理權限。錯誤訊息: {e}", 500
-    except TimeoutError:
-        return f"❌ 內部伺服器錯誤：獲取成員清單超時（>10 秒）。", 500
-    except Exception as e:
-        return f"❌ 內部伺服器錯誤：在處理成員資料時發生意外錯誤。錯誤訊息: {e}", 500
+
+@app.route("/guild/<int:guild_id>/members")
+async def members_page(guild_id):
+    if not session.get("discord_user") or not session.get("discord_guilds"):
+        return redirect(url_for('index'))
+    error = _members_access_error(guild_id)
+    if error:
+        return error
+
+    guild_snapshot = await get_guild_snapshot(guild_id)
+    if not guild_snapshot:
+        return "❌ 找不到這個伺服器", 404
+    return render_template(
+        'members.html',
+        guild_obj=guild_snapshot,
+        user=session.get("discord_user"),
+        page_size=MEMBERS_PAGE_SIZE,
+    )
+
+
+@app.route("/guild/<int:guild_id>/members/data")
+async def members_data(guild_id):
+    """一頁成員 (JSON)：q 為名稱或 ID 前綴，cursor 為上一頁回傳的 next_cursor。"""
+    error = _members_access_error(guild_id)
+    if error:
+        return jsonify({"success": False, "message": error[0]}), error[1]
+
+    limit = min(max(request.args.get('limit', MEMBERS_PAGE_SIZE, type=int), 1), MEMBERS_PAGE_SIZE)
+    page = await BOT_BRIDGE.call(
+        "members_page", guild_id=guild_id, query=request.args.get('q', ''),
+        cursor=request.args.get('cursor'), limit=limit,
+    )
+    if page is None:
+        return jsonify({"success": False, "message": "找不到這個伺服器"}), 404
+    return jsonify({"success": True, **page})
+
+
+@app.route("/guild/<int:guild_id>/members/stream")
+async def members_stream(guild_id):
+    """
+    NDJSON 串流：先一行 {"total": N}，接著每位成員一行，最後一行 {"next_cursor": ...}。
+    每輸出一批就讓出事件循環，前端可以邊收邊顯示。
+    """
+    error = _members_access_error(guild_id)
+    if error:
+        return jsonify({"success": False, "message": error[0]}), error[1]
+
+    query = request.args.get('q', '')
+    cursor = request.args.get('cursor')
+    limit = min(max(request.args.get('limit', MEMBERS_STREAM_MAX, type=int), 1), MEMBERS_STREAM_MAX)
+    first = await BOT_BRIDGE.call(
+        "members_page", guild_id=guild_id, query=query, cursor=cursor, limit=min(MEMBERS_PAGE_SIZE, limit))
+    if first is None:
+        return jsonify({"success": False, "message": "找不到這個伺服器"}), 404
+
+    async def generate():
+        yield json.dumps({"total": first["total"]}) + "\n"
+        page, sent = first, 0
+        while True:
+            sent += len(page["members"])
+            yield "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in page["members"])
+            if page["next_cursor"] is None or sent >= limit:
+                break
+            page = await BOT_BRIDGE.call(
+                "members_page", guild_id=guild_id, query=query, cursor=page["next_cursor"],
+                limit=min(MEMBERS_PAGE_SIZE, limit - sent), with_total=False,
+            )
+            if page is None:
+                break
+        yield json.dumps({"next_cursor": page and page["next_cursor"]}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson", headers={"Cache-Control": "no-store"})
 
 # 通知模態
 @app.route("/guild/<int:guild_id>/settings/notifications_modal", methods=['GET'])
-def notifications_modal(guild_id):
-    global discord_loop
-    if discord_loop is None or not discord_loop.is_running():
+@RESPONSES.conditional("notifications_modal", guild_page_version, allow=is_guild_admin)
+async def notifications_modal(guild_id):
+    if not is_guild_admin(guild_id):
+        return "❌ 你沒有權限管理這個伺服器", 403
+
+    if not BOT_BRIDGE.available():
         return "❌ 載入設定失敗！錯誤：Discord 機器人事件循環尚未啟動。", 503
 
     try:
-        # 3.1 嘗試從緩存獲取
-        guild_obj = bot.get_guild(guild_id)
+        # 3.1 從伺服器快照快取獲取 (快取沒有時才會呼叫 API)
+        guild_obj = await get_guild_snapshot(guild_id)
 
-        # 3.2 如果緩存失敗，異步 API 獲取
-        if guild_obj is None:
-            # 使用 fetch_guild
-            future_guild = asyncio.run_coroutine_threadsafe(bot.fetch_guild(guild_id), discord_loop)
-            # 等待結果
-            guild_obj = future_guild.result(timeout=5)
-            
         if guild_obj is None:
             return f"❌ 找不到伺服器 ID **{guild_id}**。機器人可能已離開或 ID 無效。", 404
             
         # ... (從緩存讀取並處理配置的邏輯) ...
         channels = guild_obj.text_channels
-        config = load_config(guild_id)
+        config = await aload_config(guild_id)
         
         video_channel_id = str(config.get('video_notification_channel_id', ''))
         video_message = config.get('video_notification_message', 'New Video from {channel}: {title}\n{link}')
@@ -1766,27 +2061,89 @@ def notifications_modal(guild_id):
 BLACKLIST_USERS = set()
 
 @app.route("/bot/settings")
-def bot_settings_page():
+async def bot_settings_page():
     user_data = session.get("discord_user")
     if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
         return "❌ 權限不足", 403
 
-    # --- 📊 準備數據統計 ---
-    total_guilds = len(bot.guilds)
-    total_users = sum(g.member_count for g in bot.guilds)
+    # --- 📊 準備數據統計 (由 BOT_STATS 增量維護，直接讀取) ---
+    stats = (await BOT_BRIDGE.call("bot_stats"))["current"]
     
     return render_template(
         'bot_settings.html', 
         user=user_data, 
         is_special_user=True,
-        total_guilds=total_guilds, # 傳送數據
-        total_users=total_users,   # 傳送數據
+        total_guilds=stats["guilds"],   # 傳送數據
+        total_users=stats["members"],   # 傳送數據
+        stats=stats,
         DISCORD_CLIENT_ID=DISCORD_CLIENT_ID
     )
 
+@app.route("/bot/settings/stats")
+async def bot_stats_data():
+    """全機器人統計的目前值；history=1 時附上時間序列。"""
+    user_data = session.get("discord_user")
+    if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
+        return jsonify({"success": False, "message": "權限不足"}), 403
+    return jsonify({"success": True, **await BOT_BRIDGE.call("bot_stats", history=request.args.get('history') == '1')})
+
+# --- 🔬 線上效能診斷 (僅限開發者) ---
+# 取樣與 tracemalloc 都在機器人行程執行 (worker 行程透過 IPC 轉送)，分析的是機器人，不是處理請求的 worker
+PROFILE_MAX_SECONDS = 60
+
+@app.route("/bot/settings/profile")
+async def bot_profile():
+    """取樣分析 N 秒，下載 collapsed stack 檔 (可丟給 flamegraph.pl 或 speedscope)。"""
+    user_data = session.get("discord_user")
+    if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
+        return "❌ 權限不足", 403
+
+    seconds = min(max(request.args.get('seconds', 10, type=float), 1), PROFILE_MAX_SECONDS)
+    interval = min(max(request.args.get('interval_ms', 5, type=float), 1), 100) / 1000
+    try:
+        counts = await BOT_BRIDGE.call("profile", timeout=seconds + 10, seconds=seconds, interval=interval,
+                                       loop_only=request.args.get('thread') == 'loop')
+    except IPCError as e:
+        if e.kind != "ProfilerBusy":
+            raise
+        return f"❌ {e}", 409
+
+    filename = f"profile-{int(time.time())}.folded"
+    return Response(
+        profiler.render_collapsed(counts),
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@app.route("/bot/settings/heap")
+async def bot_heap():
+    """比較 N 秒前後的 tracemalloc 快照，列出記憶體成長最多的位置。"""
+    user_data = session.get("discord_user")
+    if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
+        return jsonify({"success": False, "message": "權限不足"}), 403
+
+    seconds = min(max(request.args.get('seconds', 10, type=float), 1), PROFILE_MAX_SECONDS)
+    top = min(max(request.args.get('top', 30, type=int), 1), 200)
+    try:
+        growth = await BOT_BRIDGE.call("heap_growth", timeout=seconds + 10, seconds=seconds, top=top)
+    except IPCError as e:
+        if e.kind != "ProfilerBusy":
+            raise
+        return jsonify({"success": False, "message": str(e)}), 409
+    return jsonify({"success": True, "seconds": seconds, "top": growth})
+
+@app.route("/bot/settings/rest_stats")
+async def bot_rest_stats():
+    """Discord REST 呼叫統計 (依路由樣板與呼叫來源)，後台表格用。"""
+    user_data = session.get("discord_user")
+    if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
+        return jsonify({"success": False, "message": "權限不足"}), 403
+    return jsonify({"success": True, **await BOT_BRIDGE.call("rest_stats")})
+
 # --- 🛡️ 黑名單 API ---
 @app.route("/api/blacklist/add", methods=['POST'])
-def add_to_blacklist():
+@RATE_LIMITER.limit("blacklist_add", RATE_LIMIT_BLACKLIST)
+async def add_to_blacklist():
     user_data = session.get("discord_user")
     if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
         return jsonify({"success": False, "message": "權限不足"}), 403
@@ -1794,28 +2151,94 @@ def add_to_blacklist():
     data = request.json
     target_id = data.get('user_id')
     if target_id and target_id.isdigit():
-        BLACKLIST_USERS.add(int(target_id))
+        await BOT_BRIDGE.call("blacklist_add", user_id=int(target_id))
         return jsonify({"success": True, "message": f"已成功封鎖用戶 ID: {target_id}"})
     return jsonify({"success": False, "message": "請輸入正確的數字 ID"})
 
+RAW_LOG_PATH = "bot.log"  # 👈 這裡要填入你機器人產生日誌的檔名
+
+
+def is_developer():
+    user_data = session.get("discord_user")
+    return bool(user_data) and int(user_data['id']) in SPECIAL_USER_IDS
+
+
+def raw_log_version():
+    version = file_version(RAW_LOG_PATH)
+    return Validator((version,), version[2] / 1e9 if version else None)
+
+
 @app.route("/get_raw_logs")
+@RESPONSES.conditional("get_raw_logs", raw_log_version, allow=is_developer)
 def get_raw_logs():
     user_data = session.get("discord_user")
     # 安全檢查：只有你（開發者）可以看日誌
     if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
         return "權限不足", 403
 
-    log_path = "bot.log"  # 👈 這裡要填入你機器人產生日誌的檔名
+    log_path = RAW_LOG_PATH
     
-    if os.path.exists(log_path):
-        with open(log_path, "r", encoding="utf-8") as f:
-            # 讀取最後 100 行，避免檔案太大讀不動
-            lines = f.readlines()
-            last_lines = lines[-100:] 
-            return "".join(last_lines)
-    else:
+    if not os.path.exists(log_path):
+        return "找不到日誌檔案 (bot.log)，請確認機器人是否有設定 logging 到檔案。"
+
+    # 從檔案尾端往回讀最後 100 行；帶 ?offset= 時只回傳上次之後新增的部分
+    # 下次續讀的游標放在 X-Log-Offset / X-Log-Inode / X-Log-Mtime / X-Log-Check，X-Log-Reset: 1 代表檔案已輪替或截斷
+    offset = request.args.get('offset', type=int)
+    inode = request.args.get('inode', type=int)
+    try:
+        if offset is None:
+            chunk = log_tail.tail(log_path, lines=100)
+        else:
+            chunk = log_tail.read_since(log_path, offset, inode=inode, lines=100,
+                                        mtime=request.args.get('mtime', type=int),
+                                        check=request.args.get('check', type=int))
+    except FileNotFoundError:
         return "找不到日誌檔案 (bot.log)，請確認機器人是否有設定 logging 到檔案。"
 
+    resp = Response(chunk.text, mimetype="text/plain")
+    resp.headers['X-Log-Offset'] = str(chunk.offset)
+    resp.headers['X-Log-Inode'] = str(chunk.inode)
+    resp.headers['X-Log-Mtime'] = str(chunk.mtime)
+    resp.headers['X-Log-Check'] = str(chunk.check)
+    resp.headers['X-Log-Reset'] = '1' if chunk.reset else '0'
+    return resp
+
+def _stream_source(source):
+    """SSE 串流用的 (fetch, wait_for, last_seq)：都在事件循環上執行，worker 行程走 IPC 的 async 版本。"""
+    if BOT_BRIDGE.remote:
+        return source.page_async, source.wait_async, source.last_seq_async
+
+    async def last_seq():
+        return source.last_seq
+
+    return source.page, source.wait_async, last_seq
+
+
+@app.route("/get_raw_logs/stream")
+async def stream_raw_logs():
+    """以 SSE 推播新的日誌行；斷線重連時依 Last-Event-ID 補送。"""
+    user_data = session.get("discord_user")
+    if not user_data or int(user_data['id']) not in SPECIAL_USER_IDS:
+        return "權限不足", 403
+
+    page, wait_for, last_seq_of = _stream_source(LOG_LINE_SOURCE)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_seq = await last_seq_of()
+    cursor = parse_last_event_id(last_id, last_seq)
+    if cursor is None:
+        # 第一次連線：先送最後 100 行
+        cursor = max(0, last_seq - 100)
+
+    stream = event_stream(
+        fetch=lambda seq, limit: page(seq, limit=limit),
+        wait_for=wait_for,
+        cursor=cursor,
+        event="log",
+        heartbeat=SSE_HEARTBEAT_SECONDS,
+        backlog=SSE_CLIENT_BACKLOG,
+    )
+    return Response(stream, mimetype="text/event-stream", headers=SSE_HEADERS)
+
 
 # --- 智慧輪播專用設定 ---
 carousel_words = []
@@ -1837,20 +2260,29 @@ async def status_carousel_task():
     else:
         activity = discord.Game(name=current_word)
         
-    await bot.change_presence(activity=activity)
+    PRESENCE.update(activity=activity)
     carousel_index = (carousel_index + 1) % len(carousel_words)
 
 
 
 
 @app.route("/api/bot/update_status", methods=['POST'])
-def update_bot_status():
-    global carousel_words, is_carousel_enabled, carousel_index, current_activity_type
+@RATE_LIMITER.limit("update_status", RATE_LIMIT_UPDATE_STATUS)
+async def update_bot_status():
     data = request.json
-    status_type = data.get('status')      # online, idle, dnd, offline
-    activity_text = data.get('activity')  # 網頁傳過來用逗號組合的文字
-    activity_type = data.get('type')      # custom 或 game
-    
+    msg = await BOT_BRIDGE.call(
+        "update_presence",
+        status_type=data.get('status'),        # online, idle, dnd, offline
+        activity_text=data.get('activity'),    # 網頁傳過來用逗號組合的文字
+        activity_type=data.get('type'),        # custom 或 game
+    )
+    return jsonify({"success": True, "message": msg})
+
+
+@IPC_SERVER.handler("update_presence")
+async def apply_bot_status(status_type, activity_text, activity_type):
+    """在機器人行程中套用狀態設定 (輪播狀態也存在這裡)，回傳給網頁顯示的訊息。"""
+    global carousel_words, is_carousel_enabled, carousel_index, current_activity_type
     # 轉換燈號
     status_map = {
         'online': discord.Status.online,
@@ -1861,7 +2293,7 @@ def update_bot_status():
     selected_status = status_map.get(status_type, discord.Status.online)
     
     # 把網頁傳過來的多個文字拆解開來
-    words = [w.strip() for w in activity_text.split(',') if w.strip()]
+    words = [w.strip() for w in (activity_text or '').split(',') if w.strip()]
     
     if len(words) > 1:
         # 🌟 超過一個文字框：自動開啟輪播模式！
@@ -1876,10 +2308,7 @@ def update_bot_status():
         else:
             act = discord.Game(name=carousel_words[0])
             
-        asyncio.run_coroutine_threadsafe(
-            bot.change_presence(status=selected_status, activity=act),
-            discord_loop
-        )
+        PRESENCE.update(status=selected_status, activity=act)
         msg = "偵測到多個文字，已自動啟動狀態輪播！"
     else:
         # 🌟 只有一個文字框（或沒填）：關閉輪播，顯示單一狀態
@@ -1891,13 +2320,10 @@ def update_bot_status():
         else:
             act = discord.Game(name=single_text)
             
-        asyncio.run_coroutine_threadsafe(
-            bot.change_presence(status=selected_status, activity=act),
-            discord_loop
-        )
+        PRESENCE.update(status=selected_status, activity=act)
         msg = "狀態已成功更新！"
         
-    return jsonify({"success": True, "message": msg})
+    return msg
 
 # 日誌
 @app.route("/logs/all")
@@ -1911,14 +2337,38 @@ def all_guild_logs():
     can_view_logs = (
         user_id in SPECIAL_USER_IDS or
         user_id in LOG_VIEWER_IDS or
-        any((int(g.get('permissions', '0')) & ADMINISTRATOR_PERMISSION) == ADMINISTRATOR_PERMISSION for g in guilds_data)
+        bool(session.admin_guild_ids)
     )
     if not can_view_logs:
         return "❌ 您沒有權限訪問這個頁面。", 403
 
-    return render_template('all_logs.html', logs=COMMAND_LOGS)
+    return render_template('all_logs.html', last_seq=COMMAND_LOG_SOURCE.last_seq)
+
+# 帶這些參數時 /logs/data 改查永久稽核資料庫
+AUDIT_QUERY_ARGS = ('start', 'end', 'command', 'before')
+
+
+def is_log_viewer():
+    user_data = session.get("discord_user")
+    if not user_data:
+        return False
+    user_id = int(user_data['id'])
+    return user_id in SPECIAL_USER_IDS or user_id in LOG_VIEWER_IDS or bool(session.admin_guild_ids)
+
+
+def logs_data_version():
+    """稽核查詢看資料庫已提交的最後 id (背景批次寫入，比記憶體緩衝晚一點)；即時紀錄看緩衝區序號。"""
+    if any(k in request.args for k in AUDIT_QUERY_ARGS):
+        return Validator(("audit", AUDIT_SOURCE.last_id))
+    if BOT_BRIDGE.remote:
+        # worker 行程的 BOOT_ID 不會隨機器人重啟改變，要帶上機器人行程的
+        return Validator(COMMAND_LOG_SOURCE.version())
+    return Validator((COMMAND_LOG_SOURCE.last_seq,))
+
 
 @app.route("/logs/data")
+@RATE_LIMITER.limit("logs_data", RATE_LIMIT_LOGS_DATA)
+@RESPONSES.conditional("logs_data", logs_data_version, allow=is_log_viewer)
 def logs_data():
     user_data = session.get("discord_user")
     guilds_data = session.get("discord_guilds")
@@ -1929,13 +2379,107 @@ def logs_data():
     can_view_logs = (
         user_id in SPECIAL_USER_IDS or
         user_id in LOG_VIEWER_IDS or
-        any((int(g.get('permissions', '0')) & ADMINISTRATOR_PERMISSION) == ADMINISTRATOR_PERMISSION for g in guilds_data)
+        bool(session.admin_guild_ids)
+    )
+    if not can_view_logs:
+        return jsonify({"error": "您沒有權限訪問此資料"}), 403
+
+    # ?since=<seq> 只回傳該序號之後的新紀錄；?guild=<id> 只看單一伺服器 (guild=dm 代表私訊)；?user=<id> 只看單一使用者
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    guild_arg = request.args.get('guild')
+    filter_guild = bool(guild_arg)
+    guild_id = None
+    if guild_arg and guild_arg != 'dm':
+        if not guild_arg.isdigit():
+            return jsonify({"error": "guild 參數格式錯誤"}), 400
+        guild_id = int(guild_arg)
+    user_id = request.args.get('user', type=int)
+
+    # 帶 start / end / command / before 時改查永久稽核資料庫 (可以查到重啟前的紀錄)
+    # start / end 可用 "2026-01-06"、"2026-01-06 18:00" (UTC+8) 或 Unix 秒數；before 是上一頁的 next_before
+    if any(k in request.args for k in AUDIT_QUERY_ARGS):
+        try:
+            start = parse_local_time(request.args['start']) if request.args.get('start') else None
+            end = parse_local_time(request.args['end']) if request.args.get('end') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        page_size = max(1, min(limit or 100, 1000))
+        entries = AUDIT_SOURCE.query(
+            guild_id=guild_id,
+            dm_only=guild_arg == 'dm',
+            user_id=user_id,
+            command=request.args.get('command') or None,
+            start=start,
+            end=end,
+            before_id=request.args.get('before', type=int),
+            limit=page_size,
+        )
+        return jsonify({
+            "entries": entries,
+            "next_before": entries[-1]["id"] if len(entries) == page_size else None,
+        })
+
+    # last_seq 是下次要帶的 since 游標 (由緩衝區在讀取時一併決定，不會漏掉讀取之間新寫入的紀錄)
+    entries, cursor = COMMAND_LOG_SOURCE.page(since, guild_id=guild_id, user_id=user_id, limit=limit, filter_guild=filter_guild)
+    return jsonify({
+        "entries": entries,
+        "last_seq": cursor,
+        "first_seq": COMMAND_LOG_SOURCE.first_seq,
+    })
+
+@app.route("/logs/stream")
+async def logs_stream():
+    """以 SSE 推播新的指令紀錄，取代 /logs/data 的定時輪詢。"""
+    user_data = session.get("discord_user")
+    guilds_data = session.get("discord_guilds")
+    if not user_data:
+        return jsonify({"error": "請先登入"}), 401
+
+    user_id = int(user_data['id'])
+    can_view_logs = (
+        user_id in SPECIAL_USER_IDS or
+        user_id in LOG_VIEWER_IDS or
+        bool(session.admin_guild_ids)
     )
     if not can_view_logs:
         return jsonify({"error": "您沒有權限訪問此資料"}), 403
 
-    # 🚨 這裡需要確保 COMMAND_LOGS 是在全局範圍內可訪問的
-    return jsonify(COMMAND_LOGS) 
+    guild_arg = request.args.get('guild')
+    filter_guild = bool(guild_arg)
+    guild_id = None
+    if guild_arg and guild_arg != 'dm':
+        if not guild_arg.isdigit():
+            return jsonify({"error": "guild 參數格式錯誤"}), 400
+        guild_id = int(guild_arg)
+
+    page, wait_for, last_seq_of = _stream_source(COMMAND_LOG_SOURCE)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_seq = await last_seq_of()
+    cursor = parse_last_event_id(last_id, last_seq) or 0
+
+    stream = event_stream(
+        fetch=lambda seq, limit: page(seq, guild_id=guild_id, limit=limit, filter_guild=filter_guild),
+        wait_for=wait_for,
+        cursor=cursor,
+        event="command",
+        heartbeat=SSE_HEARTBEAT_SECONDS,
+        backlog=SSE_CLIENT_BACKLOG,
+    )
+    return Response(stream, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+# --------------------------
+# 📈 Prometheus 指標
+# --------------------------
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.route("/metrics")
+def metrics():
+    # 有設定 METRICS_TOKEN 時，抓取端需帶 Authorization: Bearer <token>
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "權限不足", 403
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
 
 
 # --------------------------
@@ -1953,59 +2497,233 @@ def privacy_policy():
 # Discord OAuth2 Callback
 # --------------------------
 @app.route("/callback")
-def callback():
+async def callback():
     code = request.args.get("code")
     if not code:
         return "授權失敗", 400
-    data = {
-        "client_id": DISCORD_CLIENT_ID,
-        "client_secret": DISCORD_CLIENT_SECRET,
-        "grant_type": "authorization_code",
-        "code": code,
-        "redirect_uri": DISCORD_REDIRECT_URI,
-        "scope": "identify guilds guilds.members.read"
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    token_response = requests.post(TOKEN_URL, data=data, headers=headers)
     try:
-        token_response.raise_for_status()
-    except requests.HTTPError as e:
-        return f"授權失敗: {e.response.text}", 400
-
-    tokens = token_response.json()
-    access_token = tokens["access_token"]
-    user_headers = {"Authorization": f"Bearer {access_token}"}
-
-    user_response = requests.get(USER_URL, headers=user_headers)
-    user_response.raise_for_status()
-    user_data = user_response.json()
-
-    guilds_response = requests.get(f"{DISCORD_API_BASE_URL}/users/@me/guilds", headers=user_headers)
-    guilds_response.raise_for_status()
-    all_guilds = guilds_response.json()
-
-    admin_guilds = [
-        g for g in all_guilds
-        if (int(g.get('permissions', '0')) & ADMINISTRATOR_PERMISSION) == ADMINISTRATOR_PERMISSION
-    ]
-
+        user_data, admin_guilds = await OAUTH.login(code)
+    except OAuthError as e:
+        return f"授權失敗: {e.text}", 400
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return f"授權失敗：無法連線到 Discord ({type(e).__name__})", 502
+
+    previous = session.get("discord_user")
+    if previous:
+        # 同一個 session 重新登入：先放掉舊帳號的參考
+        await asyncio.to_thread(OAUTH.release, previous["id"])
+    account = await asyncio.to_thread(OAUTH.account, user_data["id"])
+    session.regenerate()
     session["discord_user"] = user_data
-    session["discord_guilds"] = [
-        {"id": g["id"], "name": g["name"], "icon": g["icon"], "permissions": g.get('permissions', '0')}
-        for g in admin_guilds
-    ]
+    session["discord_guilds"] = admin_guilds
+    session["discord_guilds_version"] = account.version if account else 0
 
     return redirect(url_for("index"))
 
+@app.before_request
+def sync_oauth_guilds():
+    """把背景更新過的管理員伺服器清單同步進 session；清單過期就排一次背景更新。"""
+    user_data = session.get("discord_user")
+    if not user_data:
+        return
+    # async 路由的 preload_request 已經在執行緒裡讀好紀錄，這裡 (事件循環上) 不再查資料庫
+    preloaded = request.environ.get(PRELOADED_OAUTH_ACCOUNT)
+    if preloaded is not None and preloaded[0] == str(user_data['id']):
+        account = preloaded[1]
+    else:
+        account = OAUTH.account(user_data['id'])
+    if account is None:
+        return
+    if account.revoked:
+        # 授權已被撤銷，要求重新登入 (其他 session 之後各自看到 revoked 時也會放掉參考)
+        OAUTH.release_soon(user_data['id'], BOT_BRIDGE.loop())
+        session.pop("discord_user", None)
+        session.pop("discord_guilds", None)
+        session.pop("discord_guilds_version", None)
+        return
+    if session.get("discord_guilds_version") != account.version:
+        session["discord_guilds"] = account.guilds
+        session["discord_guilds_version"] = account.version
+    OAUTH.refresh_if_stale(user_data['id'], BOT_BRIDGE.loop(), account)
+
 # --------------------------
 # 登出
 # --------------------------
 @app.route("/logout")
-def logout():
+async def logout():
+    user_data = session.get("discord_user")
+    if user_data:
+        # 只減少參考計數：同一位使用者其他 session 的背景更新不受影響
+        await asyncio.to_thread(OAUTH.release, user_data['id'])
     session.pop("discord_user", None)
     session.pop("discord_guilds", None)
+    session.pop("discord_guilds_version", None)
     return redirect(url_for("index"))
 
+# =========================
+# 🔌 IPC handler (網頁 → 機器人)
+# =========================
+# 回傳值都必須能轉成 JSON；單一行程模式下路由也是呼叫同一批函式，兩種部署方式行為一致
+
+async def get_guild_snapshot(guild_id) -> Optional[GuildSnapshot]:
+    data = await BOT_BRIDGE.call("guild_snapshot", guild_id=guild_id)
+    return GuildSnapshot.from_dict(data) if data else None
+
+
+@IPC_SERVER.handler("guild_snapshot")
+async def ipc_guild_snapshot(guild_id):
+    snapshot = await GUILD_CACHE.get(guild_id)
+    return snapshot.to_dict() if snapshot else None
+
+
+@IPC_SERVER.handler("guild_version")
+async def ipc_guild_version(guild_id):
+    return GUILD_CACHE.version(guild_id)
+
+
+@IPC_SERVER.handler("members_page")
+async def ipc_members_page(guild_id, query="", cursor=None, limit=MEMBERS_PAGE_SIZE, with_total=True):
+    guild_obj = bot.get_guild(guild_id)
+    if guild_obj is None:
+        return None
+    index = await MEMBER_INDEX.get(guild_obj)
+    members, next_cursor = index.page(query, cursor, limit)
+    return {
+        "members": [m.to_dict() for m in members],
+        "next_cursor": next_cursor,
+        "total": index.count(query) if with_total else None,
+    }
+
+
+@IPC_SERVER.handler("bot_stats")
+async def ipc_bot_stats(history=False):
+    return BOT_STATS.snapshot(history=history)
+
+
+@IPC_SERVER.handler("rest_stats")
+async def ipc_rest_stats():
+    return REST_TELEMETRY.snapshot()
+
+
+@IPC_SERVER.handler("config_update")
+async def ipc_config_update(guild_id, changes=None, remove=(), durable=False, source="dashboard"):
+    return await aupdate_config(guild_id, changes, remove, durable=durable, source=source)
+
+
+@IPC_SERVER.handler("blacklist_add")
+async def ipc_blacklist_add(user_id):
+    BLACKLIST_USERS.add(int(user_id))
+
+
+@IPC_SERVER.handler("profile")
+async def ipc_profile(seconds, interval, loop_only=False):
+    thread_ids = None
+    if loop_only:
+        if discord_loop_thread_id is None:
+            raise IPCError("Discord 機器人事件循環尚未啟動", "Unavailable")
+        thread_ids = [discord_loop_thread_id]
+    try:
+        # 取樣會睡 N 秒，放到執行緒裡，事件循環照常運作 (也才取樣得到)
+        return await asyncio.to_thread(profiler.sample_stacks, seconds, interval=interval, thread_ids=thread_ids)
+    except profiler.ProfilerBusy as e:
+        raise IPCError(str(e), "ProfilerBusy") from None
+
+
+@IPC_SERVER.handler("heap_growth")
+async def ipc_heap_growth(seconds, top=30):
+    try:
+        return await asyncio.to_thread(profiler.heap_growth, seconds, top=top)
+    except profiler.ProfilerBusy as e:
+        raise IPCError(str(e), "ProfilerBusy") from None
+
+
+# 設定變更紀錄：worker 行程用 log_wait / log_page 長輪詢，轉發到自己的 CONFIG_EVENTS
+CONFIG_CHANGE_LOG = CommandLogBuffer(capacity=int(os.getenv("CONFIG_EVENT_BACKLOG", 1000)))
+if BOT_PROCESS:
+    CONFIG_EVENTS.subscribe("", lambda event: CONFIG_CHANGE_LOG.append(event.to_dict(), guild_id=event.guild_id),
+                            inline=True)
+
+# 日誌緩衝區用 wait_async 在事件循環上等待；稽核資料庫查詢會阻塞，放到專用執行緒池 (限制同時查詢數)
+IPC_LOG_SOURCES = {"commands": COMMAND_LOGS, "lines": LOG_LINES, "config": CONFIG_CHANGE_LOG}
+AUDIT_QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("AUDIT_QUERY_WORKERS", 4)),
+                                          thread_name_prefix="audit-query")
+
+
+@IPC_SERVER.handler("log_page")
+async def ipc_log_page(source, seq=0, **filters):
+    entries, cursor = IPC_LOG_SOURCES[source].page(seq, **filters)
+    return [entries, cursor]
+
+
+@IPC_SERVER.handler("log_wait")
+async def ipc_log_wait(source, seq, wait):
+    return await IPC_LOG_SOURCES[source].wait_async(seq, wait)
+
+
+@IPC_SERVER.handler("log_seq")
+async def ipc_log_seq(source):
+    buffer = IPC_LOG_SOURCES[source]
+    return {"last_seq": buffer.last_seq, "first_seq": getattr(buffer, "first_seq", 1), "boot_id": BOOT_ID}
+
+
+@IPC_SERVER.handler("audit_last_id")
+async def ipc_audit_last_id():
+    return COMMAND_AUDIT.last_id
+
+
+@IPC_SERVER.handler("audit_query")
+async def ipc_audit_query(**filters):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(AUDIT_QUERY_EXECUTOR, functools.partial(COMMAND_AUDIT.query, **filters))
+
+
+CONFIG_CHANGE_SOURCE = RemoteLogSource(BOT_BRIDGE, "config")
+_config_relay_lock = threading.Lock()
+_config_relay_pid = None
+
+
+async def relay_config_events():
+    """worker 行程：把機器人行程的設定變更轉發到本行程的 CONFIG_EVENTS (這裡只有 inline 訂閱者)。
+    機器人重啟或 IPC 斷線期間漏掉的變更，由設定快取的定期重新驗證補上。"""
+    cursor, boot_id = None, None
+    while True:
+        try:
+            if cursor is not None and await CONFIG_CHANGE_SOURCE.wait_async(cursor, 25):
+                entries, cursor = await CONFIG_CHANGE_SOURCE.page_async(cursor)
+                for entry in entries:
+                    CONFIG_EVENTS.publish(ConfigChange.from_dict(entry))
+                continue
+            # 第一次或等待逾時：確認機器人行程沒有重啟 (重啟後序號從頭開始)
+            info = await BOT_BRIDGE.call("log_seq", source="config")
+            if cursor is None or info["boot_id"] != boot_id or info["last_seq"] < cursor:
+                cursor, boot_id = info["last_seq"], info["boot_id"]
+        except Exception as e:
+            logger.warning(f"設定變更轉發中斷 ({type(e).__name__}: {e})，5 秒後重試")
+            cursor = None
+            await asyncio.sleep(5)
+
+
+if BOT_BRIDGE.remote:
+    @app.before_request
+    def start_config_relay():
+        # gunicorn 在 import 之後才 fork，每個 worker 行程第一次收到請求時各自啟動一次
+        global _config_relay_pid
+        if _config_relay_pid == os.getpid():
+            return
+        with _config_relay_lock:
+            if _config_relay_pid != os.getpid():
+                _config_relay_pid = os.getpid()
+                asyncio.run_coroutine_threadsafe(relay_config_events(), BOT_BRIDGE.loop())
+
+
+@app.errorhandler(IPCError)
+def ipc_unavailable(e):
+    logger.warning(f"IPC 呼叫失敗 ({e.kind}): {e}")
+    if request.endpoint in ("settings", "members_page", "notifications_modal", "bot_settings_page", "all_guild_logs",
+                            "bot_profile"):
+        return f"❌ 暫時無法連線到機器人：{e}", 503
+    return jsonify({"success": False, "message": f"暫時無法連線到機器人：{e}"}), 503
+
 # =========================
 # ⚡ 執行區塊 (修正版)
 # =========================
@@ -2024,6 +2742,27 @@ def keep_web_alive():
     print("Flask Web 已啟動於背景線程。")
 
 
+# preload_request 讀好的 OAuth 授權紀錄 (user_id, account)，給 sync_oauth_guilds 使用
+PRELOADED_OAUTH_ACCOUNT = "oauth.preloaded_account"
+
+
+def preload_request(environ):
+    """async 路由分派前在執行緒池執行：先讀好 session 與 OAuth 授權紀錄，before_request 就不會在事件循環上查 SQLite。"""
+    app.session_interface.preload(app, environ)
+    preloaded = environ.get(PRELOADED_SESSION)
+    user_data = preloaded[1].get("discord_user") if preloaded and preloaded[1] else None
+    if user_data:
+        environ[PRELOADED_OAUTH_ACCOUNT] = (str(user_data["id"]), OAUTH.account(user_data["id"]))
+
+
+WEB_SERVER = AsyncWebServer(
+    app,
+    port=int(os.getenv("PORT", 10000)),
+    sync_workers=int(os.getenv("WEB_SYNC_WORKERS", 64)),
+    prepare=preload_request,
+)
+
+
 # =========================
 # 📡 精確診斷版啟動函式
 # =========================
@@ -2033,7 +2772,21 @@ async def start_bot_diagnose():
     """
     retry_count = 0
     max_retries = 5
-    
+
+    # B. 握手追蹤：掛在 bot.http 真正使用的 TraceConfig 上 (session 建立後就不能再加，所以只在這裡加一次)
+    async def on_request_start(session, context, params):
+        if not bot.is_ready():
+            logger.info(f"🚀 [步驟 1/3] 發送 HTTP 請求: {params.method} {params.url}")
+
+    async def on_request_exception(session, context, params):
+        logger.error(f"❌ [握手中斷] 請求異常: {params.exception}" if not bot.is_ready()
+                     else f"❌ Discord REST 請求異常: {params.method} {params.url}: {params.exception}")
+
+    trace_config = bot.http.http_trace
+    if trace_config is not None and not trace_config.on_request_start.frozen:
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_exception.append(on_request_exception)
+
     while retry_count < max_retries:
         try:
             # A. 清理舊連線防止 Session 殘留
@@ -2042,18 +2795,6 @@ async def start_bot_diagnose():
             
             logger.info(f"📡 [嘗試 {retry_count + 1}] 開始 Discord 握手流程...")
 
-            # B. 建立 aiohttp 追蹤配置
-            trace_config = aiohttp.TraceConfig()
-            
-            async def on_request_start(session, context, params):
-                logger.info(f"🚀 [步驟 1/3] 發送 HTTP 請求: {params.method} {params.url}")
-            
-            async def on_request_exception(session, context, params):
-                logger.error(f"❌ [握手中斷] 請求異常: {params.exception}")
-            
-            trace_config.on_request_start.append(on_request_start)
-            trace_config.on_request_exception.append(on_request_exception)
-
             # C. Token 驗證階段 (Login)
             logger.info("🔑 [步驟 2/3] 正在驗證 Token...")
             await bot.login(TOKEN)
@@ -2095,17 +2836,43 @@ if __name__ == "__main__":
         logger.critical("❌ 找不到 TOKEN 環境變數，請在 Render 設定中添加。")
         sys.exit(1)
 
-    # 2. 啟動 Flask
-    keep_web_alive() 
+    loop = asyncio.get_event_loop()
+
+    if WEB_MODE == "ipc":
+        logger.critical("❌ WEB_MODE=ipc 只用於網頁 worker (gunicorn bot:app)，機器人行程請改用 WEB_MODE=none。")
+        sys.exit(1)
 
-    # 3. 給環境一點「呼吸時間」以通過 Render 的 Port 檢測
-    time.sleep(5) 
+    # 2. 啟動網頁：async 模式直接在機器人的事件循環上開 port，不需要額外的執行緒
+    if WEB_MODE == "none":
+        logger.info("🌐 WEB_MODE=none：這個行程不開網頁，儀表板由 gunicorn worker 透過 IPC 連線。")
+    elif WEB_MODE == "thread":
+        keep_web_alive() 
+
+        # 3. 給環境一點「呼吸時間」以通過 Render 的 Port 檢測
+        time.sleep(5) 
+    else:
+        loop.run_until_complete(WEB_SERVER.start())
+    loop.run_until_complete(IPC_SERVER.start())
 
     # 4. 執行非同步啟動
-    loop = asyncio.get_event_loop()
+    # 使用你定義的診斷函式取代 bot.run()
+    main_task = loop.create_task(start_bot_diagnose())
+
+    # Render / docker stop 送的是 SIGTERM：預設處理會直接結束行程，finally 與 atexit 都不會執行；
+    # 改成取消啟動任務，讓下面的 finally 照常關閉機器人，並把稽核紀錄、設定檔與日誌寫完
+    def on_sigterm():
+        logger.info("🛑 收到 SIGTERM，正在關閉機器人...")
+        main_task.cancel()
+
     try:
-        # 使用你定義的診斷函式取代 bot.run()
-        loop.run_until_complete(start_bot_diagnose())
+        loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows 的事件循環不支援 add_signal_handler
+
+    try:
+        loop.run_until_complete(main_task)
+    except asyncio.CancelledError:
+        pass
     except KeyboardInterrupt:
         logger.info("🛑 收到停止訊號，正在關閉機器人...")
         loop.run_until_complete(bot.close())
@@ -2116,6 +2883,14 @@ if __name__ == "__main__":
         # 確保清理資源
         if not bot.is_closed():
             loop.run_until_complete(bot.close())
+        loop.run_until_complete(WEB_SERVER.stop())
+        loop.run_until_complete(IPC_SERVER.stop())
+        loop.run_until_complete(OAUTH.close())
         loop.close()
         logger.info("👋 系統已安全退出。")
+        # 等背景寫入執行緒把剩下的稽核紀錄、設定檔與日誌寫完
+        COMMAND_AUDIT.stop()
+        SESSION_STORE.stop()
+        flush_configs()
+        LOG_LISTENER.stop()
 
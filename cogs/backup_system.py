@@ -7,8 +7,7 @@ import io
 import logging
 from cryptography.fernet import Fernet
 
-# 設定日誌
-logging.basicConfig(level=logging.INFO)
+# 設定日誌 (handler 由 bot.py 的 setup_logging 統一設定，這裡不要再呼叫 basicConfig)
 logger = logging.getLogger("BackupSystem")
 
 # =========================
@@ -14,6 +14,7 @@ import json
 # -- 工具與基礎設定
 # =========================
 from utils.time_utils import safe_now
+from utils.config_manager import aupdate_support_config
 
 DATA_STORAGE_CHANNEL_ID = 1518065055466262649  
 # =========================
@@ -256,7 +257,9 @@ class SupportCog(commands.Cog):
                             data = json.loads(file_bytes.decode('utf-8'))
                             
                             # 還原回 int 格式，讓機器人可以正常讀取
-                            self.support_config = {int(k): v for k, v in data.get("support_config", {}).items()}
+                            restored = {int(k): v for k, v in data.get("support_config", {}).items()}
+                            self.support_config = restored
+                            await self._sync_support_config(restored, replace=True, source="restore")
                             self.user_target_guild = {int(k): v for k, v in data.get("user_target_guild", {}).items()}
                             
                             print(f"==== 💾 私人頻道設定還原成功 ====")
@@ -268,6 +271,13 @@ class SupportCog(commands.Cog):
         except Exception as e:
             print(f"❌ 還原雲端設定時發生錯誤: {e}")
      
+    async def _sync_support_config(self, entries, replace: bool = False, source: str = "SupportCog"):
+        # 💡 轉發設定同步寫進 config_manager 的 support_config，由它發出變更事件 (主題 support.channel_id / support.role_id)
+        try:
+            await aupdate_support_config(entries, replace=replace, source=source)
+        except Exception as e:
+            print(f"❌ 同步轉發設定失敗: {e}")
+
     # 📤 雲端備份：將資料包成 JSON 檔，傳送到您的私人頻道
     async def save_config_to_discord(self, guild_id: int) -> tuple[bool, str]:
         """
@@ -383,6 +393,7 @@ class SupportCog(commands.Cog):
                 await conn.execute('CREATE TABLE IF NOT EXISTS user_targets (user_id BIGINT PRIMARY KEY, guild_id BIGINT)')
                 rows = await conn.fetch('SELECT * FROM support_configs')
                 for r in rows: self.support_config[r['guild_id']] = (r['channel_id'], r['role_id'])
+                await self._sync_support_config({r['guild_id']: [r['channel_id'], r['role_id']] for r in rows}, source="database")
                 t_rows = await conn.fetch('SELECT * FROM user_targets')
                 for tr in t_rows: self.user_target_guild[tr['user_id']] = tr['guild_id']
             print("✅ 資料庫初始化成功")
@@ -413,6 +424,7 @@ class SupportCog(commands.Cog):
                 await i.response.defer(ephemeral=True)
                 # 執行覆蓋寫入
                 self.support_config[gid] = [cid, rid]
+                await self._sync_support_config({gid: [cid, rid]})
                 success, err = await self.save_config_to_discord(gid)
                 
                 if success:
@@ -447,6 +459,7 @@ class SupportCog(commands.Cog):
 
         # 💡 如果是第一次設定（無重複檔案），直接執行原本的流程
         self.support_config[gid] = [cid, rid]
+        await self._sync_support_config({gid: [cid, rid]})
         success, err = await self.save_config_to_discord(gid)
         
         if success:
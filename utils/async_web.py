@@ -0,0 +1,252 @@
+# 檔案名稱：utils/async_web.py
+import asyncio
+import contextvars
+import functools
+import inspect
+import io
+import logging
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+from urllib.parse import unquote_to_bytes
+
+from aiohttp import web
+from werkzeug.exceptions import HTTPException
+
+logger = logging.getLogger("AsyncWeb")
+
+# 讓儀表板跑在 Discord 機器人的事件循環上：
+# 用 aiohttp.web 接收請求，轉成 WSGI environ 交給原本的 Flask app。
+# - async def 的路由：直接在事件循環上推入 Flask 請求情境後 await，可以直接 await Discord API，不佔用任何執行緒
+# - 一般 (同步) 路由、靜態檔案：照舊交給 Flask WSGI，在專用執行緒池裡執行
+#   (SSE 這類會長時間等待的串流要寫成 async 路由，否則每條連線都會一直佔著一條執行緒)
+# 也提供執行緒模式 (原本的 app.run) 用的 async_to_sync，讓同一批 async 路由可以在兩種模式下共用。
+# async 路由可以回傳 Response(async_generator)，在事件循環上一塊一塊串流輸出 (執行緒模式下逐塊丟回事件循環取得)。
+# prepare(environ) 會在 async 路由分派前丟到執行緒池執行：推入請求情境時要做的阻塞 I/O (讀 session 等)
+# 先在這裡做完放進 environ，事件循環上就不會碰到 SQLite。
+
+_SENTINEL = object()
+
+
+def run_in_loop(loop: asyncio.AbstractEventLoop, coro, timeout: Optional[float] = None):
+    """從其他執行緒把 coroutine 丟到 loop 執行並等待結果；會帶著呼叫端的 contextvars (Flask 的 request / session)。"""
+    context = contextvars.copy_context()
+    result: Future = Future()
+
+    def start():
+        task = context.run(loop.create_task, coro)
+
+        def done(t: asyncio.Task):
+            if t.cancelled():
+                result.cancel()
+            elif t.exception() is not None:
+                result.set_exception(t.exception())
+            else:
+                result.set_result(t.result())
+
+        task.add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    return result.result(timeout)
+
+
+def _iterate_in_loop(loop: asyncio.AbstractEventLoop, agen, timeout: Optional[float]):
+    """把 async generator 轉成同步 iterator，每一塊都在 loop 上取得。"""
+    try:
+        while True:
+            try:
+                yield run_in_loop(loop, agen.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        if hasattr(agen, "aclose") and loop.is_running():
+            run_in_loop(loop, agen.aclose(), timeout)
+
+
+def bind_async_views(app, get_loop: Callable[[], Optional[asyncio.AbstractEventLoop]], timeout: float = 30.0):
+    """執行緒模式：Flask 遇到 async 路由時改丟到 Discord 事件循環執行 (事件循環還沒啟動就在目前執行緒跑)。"""
+
+    def async_to_sync(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            loop = get_loop()
+            if loop is None or not loop.is_running():
+                return asyncio.run(func(*args, **kwargs))
+            rv = run_in_loop(loop, func(*args, **kwargs), timeout)
+            body = getattr(rv, "response", None)
+            if hasattr(body, "__aiter__"):
+                rv.response = _iterate_in_loop(loop, body, timeout)
+            return rv
+
+        return wrapper
+
+    app.async_to_sync = async_to_sync
+    return app
+
+
+def _build_environ(request: web.Request, body: bytes) -> dict:
+    path = request.raw_path.split("?", 1)[0]
+    host, _, port = request.host.partition(":")
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": unquote_to_bytes(path).decode("latin-1"),
+        "QUERY_STRING": request.query_string,
+        "SERVER_NAME": host,
+        "SERVER_PORT": port or ("443" if request.scheme == "https" else "80"),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": request.remote or "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in request.headers.items():
+        key = name.upper().replace("-", "_")
+        if key == "CONTENT_TYPE" or key == "CONTENT_LENGTH":
+            environ[key] = value
+            continue
+        key = "HTTP_" + key
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class AsyncWebServer:
+    def __init__(self, app, host: str = "0.0.0.0", port: int = 10000, sync_workers: int = 64,
+                 max_body: int = 64 * 1024 * 1024, prepare: Optional[Callable[[dict], None]] = None):
+        self.app = app
+        self.prepare = prepare
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        # 同步路由用的執行緒池 (同步的串流回應每取一塊都要借用一條執行緒)
+        self._executor = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix="web-sync")
+        self._runner: Optional[web.AppRunner] = None
+        self._async_endpoints = {}
+
+    async def start(self):
+        if self._runner is not None:
+            return self
+        server = web.Application(client_max_size=self.max_body)
+        server.router.add_route("*", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(server, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"🌐 儀表板 (async 模式) 已在事件循環上啟動：{self.host}:{self.port}")
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _is_async_view(self, environ: dict) -> bool:
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+        except HTTPException:
+            return False
+        endpoint = rule.endpoint
+        cached = self._async_endpoints.get(endpoint)
+        if cached is None:
+            view = self.app.view_functions.get(endpoint)
+            cached = self._async_endpoints[endpoint] = inspect.iscoroutinefunction(view)
+        return cached
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        environ = _build_environ(request, await request.read())
+        if self._is_async_view(environ):
+            if self.prepare is not None:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self.prepare, environ)
+            return await self._to_aiohttp(request, await self._dispatch_async(environ))
+        return await self._dispatch_wsgi(request, environ)
+
+    async def _dispatch_async(self, environ: dict):
+        """跟 Flask.wsgi_app / full_dispatch_request 相同的流程，只是 view 直接在事件循環上 await。"""
+        app = self.app
+        with app.request_context(environ) as ctx:
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        req = ctx.request
+                        if req.routing_exception is not None:
+                            app.raise_routing_exception(req)
+                        rv = await app.view_functions[req.url_rule.endpoint](**req.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                return app.finalize_request(rv)
+            except Exception as e:
+                return app.handle_exception(e)
+
+    @staticmethod
+    async def _to_aiohttp(request: web.Request, response) -> web.StreamResponse:
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() != "content-length"]
+        body = response.response
+        if not hasattr(body, "__aiter__"):
+            return web.Response(status=response.status_code, headers=headers, body=response.get_data())
+
+        stream = web.StreamResponse(status=response.status_code, headers=headers)
+        try:
+            await stream.prepare(request)
+            async for chunk in body:
+                await stream.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            await stream.write_eof()
+        except ConnectionResetError:
+            pass
+        finally:
+            if hasattr(body, "aclose"):
+                await body.aclose()
+        return stream
+
+    async def _dispatch_wsgi(self, request: web.Request, environ: dict) -> web.StreamResponse:
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        def call_app():
+            iterable = self.app(environ, start_response)
+            headers = dict((k.lower(), v) for k, v in started["headers"])
+            if "content-length" in headers:
+                # 長度已知的回應一次讀完，不用每一塊都切換執行緒
+                try:
+                    return b"".join(iterable), None
+                finally:
+                    getattr(iterable, "close", lambda: None)()
+            return None, iterable
+
+        body, iterable = await loop.run_in_executor(self._executor, call_app)
+        headers = [(k, v) for k, v in started["headers"] if k.lower() != "content-length"]
+        if iterable is None:
+            return web.Response(status=started["status"], headers=headers, body=body)
+
+        # 同步的串流回應：一塊一塊在執行緒池裡取出來送出
+        response = web.StreamResponse(status=started["status"], headers=headers)
+        iterator = iter(iterable)
+        pending = None
+        try:
+            await response.prepare(request)
+            while True:
+                pending = loop.run_in_executor(self._executor, next, iterator, _SENTINEL)
+                chunk = await pending
+                if chunk is _SENTINEL:
+                    break
+                await response.write(chunk)
+            await response.write_eof()
+        except ConnectionResetError:
+            pass
+        finally:
+            # 連線中斷時 next() 可能還在執行緒裡等資料，要等它回來才能關閉產生器
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                if pending is not None and not pending.done():
+                    pending.add_done_callback(lambda _: self._executor.submit(close))
+                else:
+                    self._executor.submit(close)
+        return response
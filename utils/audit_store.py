@@ -0,0 +1,160 @@
+# 檔案名稱：utils/audit_store.py
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("AuditStore")
+
+# 指令稽核紀錄的永久儲存 (SQLite WAL)：
+# log_command 只把紀錄丟進佇列，背景執行緒再以批次交易寫入，指令處理流程不會多任何 I/O。
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS command_audit (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts       REAL    NOT NULL,
+    time     TEXT    NOT NULL,
+    guild_id INTEGER,
+    user_id  INTEGER,
+    command  TEXT,
+    text     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_ts      ON command_audit (ts);
+CREATE INDEX IF NOT EXISTS idx_audit_guild   ON command_audit (guild_id, ts);
+CREATE INDEX IF NOT EXISTS idx_audit_user    ON command_audit (user_id, ts);
+CREATE INDEX IF NOT EXISTS idx_audit_command ON command_audit (command, ts);
+"""
+
+_COLUMNS = ("id", "ts", "time", "guild_id", "user_id", "command", "text")
+
+
+class CommandAuditStore:
+    """以 SQLite 保存所有指令紀錄，支援依伺服器 / 使用者 / 指令 / 時間區間分頁查詢。"""
+
+    def __init__(self, path: str = "data/command_audit.db", batch_size: int = 500, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_id = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM command_audit").fetchone()[0]
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    # ---------- 寫入 (任何執行緒 / 協程都可以呼叫，不會阻塞) ----------
+    def record(self, entry: dict, guild_id: Optional[int] = None, user_id: Optional[int] = None):
+        self._queue.put_nowait((entry["ts"], entry["time"], guild_id, user_id, entry.get("command"), entry.get("text")))
+
+    def _drain(self, first) -> List[Tuple]:
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while not (self._stop.is_set() and self._queue.empty()):
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = self._drain(first)
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO command_audit (ts, time, guild_id, user_id, command, text) VALUES (?, ?, ?, ?, ?, ?)",
+                            batch,
+                        )
+                        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    # 交易提交之後才更新，查詢端看到的 last_id 一定已經查得到
+                    self._last_id = last_id
+                except sqlite3.Error as e:
+                    logger.error(f"寫入指令稽核紀錄失敗 ({len(batch)} 筆): {e}")
+        finally:
+            conn.close()
+
+    def stop(self, timeout: float = 5.0):
+        """把佇列中剩下的紀錄寫完再結束背景執行緒。"""
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    # ---------- 查詢 ----------
+    @property
+    def last_id(self) -> int:
+        """最後一筆已提交的紀錄 id (給 ETag 用；寫入背景執行緒提交新批次後才會變)。"""
+        return self._last_id
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def query(self, guild_id: Optional[int] = None, user_id: Optional[int] = None, command: Optional[str] = None,
+              start: Optional[float] = None, end: Optional[float] = None, before_id: Optional[int] = None,
+              limit: int = 100, dm_only: bool = False) -> List[dict]:
+        """由新到舊分頁查詢；before_id 是上一頁最後一筆的 id (keyset 分頁，不用 OFFSET)。"""
+        clauses, params = [], []
+        if dm_only:
+            clauses.append("guild_id IS NULL")
+        elif guild_id is not None:
+            clauses.append("guild_id = ?")
+            params.append(guild_id)
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if command:
+            clauses.append("command = ?")
+            params.append(command)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+
+        sql = "SELECT id, ts, time, guild_id, user_id, command, text FROM command_audit"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(max(1, min(limit, 1000)))
+
+        rows = self._reader().execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            item = dict(zip(_COLUMNS, row))
+            # Discord ID 超過 JS 的安全整數範圍，一律轉成字串
+            item["guild_id"] = str(item["guild_id"]) if item["guild_id"] is not None else None
+            item["user_id"] = str(item["user_id"]) if item["user_id"] is not None else None
+            results.append(item)
+        return results
@@ -0,0 +1,100 @@
+# 檔案名稱：utils/bot_stats.py
+import time
+from collections import deque
+from typing import Callable, Dict
+
+import discord
+from discord.ext import tasks
+
+from utils.metrics import REGISTRY
+
+# 全機器人統計：伺服器數與成員總數由 Gateway 事件增量維護 (不用每次開頁面都把所有伺服器加總一次)，
+# 其他數字 (客服設定數、進行中的遊戲…) 以 O(1) 的取值函式註冊；
+# 定時取樣一次存成小型時間序列，後台頁面與 JSON API 直接讀取目前的彙總值。
+
+STATS_GAUGE = REGISTRY.gauge("bot_stats", "全機器人統計數字 (伺服器數、成員總數、客服設定數、進行中遊戲…)", ("name",))
+
+
+class BotStats:
+    def __init__(self, bot: discord.Client, sample_interval: float = 60.0, history: int = 1440):
+        self.bot = bot
+        self._member_counts: Dict[int, int] = {}
+        self._member_total = 0
+        self._sources: Dict[str, Callable[[], int]] = {}
+        self.series = deque(maxlen=history)   # [(timestamp, {name: value})]，預設 60 秒一筆、保留一天
+        self._sampler = tasks.loop(seconds=sample_interval)(self._sample)
+        REGISTRY.add_collector(self._export)
+
+    # --- Gateway 事件維護的數字 ---
+    def _set_guild(self, guild: discord.Guild):
+        # member_count 在分塊前或部分事件中可能是 None，改用快取中的成員數
+        count = guild.member_count if guild.member_count is not None else len(guild.members)
+        self._member_total += count - self._member_counts.get(guild.id, 0)
+        self._member_counts[guild.id] = count
+
+    def _drop_guild(self, guild_id: int):
+        self._member_total -= self._member_counts.pop(guild_id, 0)
+
+    def rebuild(self):
+        """全部重新計算一次 (on_ready / 重連後)。"""
+        self._member_counts = {}
+        self._member_total = 0
+        for guild in self.bot.guilds:
+            self._set_guild(guild)
+
+    def add_source(self, name: str, func: Callable[[], int]):
+        """註冊一個額外的統計數字；func 必須是 O(1) (例如 len(某個 dict))。"""
+        self._sources[name] = func
+
+    # --- 讀取 ---
+    def current(self) -> Dict[str, int]:
+        values = {"guilds": len(self._member_counts), "members": self._member_total}
+        for name, func in self._sources.items():
+            try:
+                values[name] = int(func())
+            except Exception:
+                values[name] = 0
+        return values
+
+    def snapshot(self, history: bool = False) -> dict:
+        data = {"current": self.current(), "updated": time.time()}
+        if history:
+            data["series"] = [{"ts": ts, **values} for ts, values in self.series]
+        return data
+
+    async def _sample(self):
+        self.series.append((time.time(), self.current()))
+
+    def _export(self):
+        for name, value in self.current().items():
+            STATS_GAUGE.set(name, value=value)
+
+    def install(self):
+        bot = self.bot
+
+        async def on_ready():
+            self.rebuild()
+            if not self._sampler.is_running():
+                self._sampler.start()
+
+        async def on_guild_join(guild):
+            self._set_guild(guild)
+
+        async def on_guild_available(guild):
+            self._set_guild(guild)
+
+        async def on_guild_remove(guild):
+            self._drop_guild(guild.id)
+
+        async def on_member_join(member):
+            self._set_guild(member.guild)
+
+        async def on_raw_member_remove(payload):
+            guild = bot.get_guild(payload.guild_id)
+            if guild is not None:
+                self._set_guild(guild)
+
+        for listener in (on_ready, on_guild_join, on_guild_available, on_guild_remove,
+                         on_member_join, on_raw_member_remove):
+            bot.add_listener(listener)
+        return self
@@ -0,0 +1,134 @@
+# 檔案名稱：utils/command_log.py
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from utils.sse import AsyncWaiters
+
+
+class CommandLogBuffer:
+    """固定容量的指令紀錄環形緩衝區，每筆紀錄帶有遞增序號，並依伺服器 / 使用者建立索引。"""
+
+    def __init__(self, capacity: int = 5000):
+        if capacity < 1:
+            raise ValueError("capacity 必須大於 0")
+        self.capacity = capacity
+        self._slots: List[Optional[dict]] = [None] * capacity
+        self._last_seq = 0
+        self._lock = threading.Condition()
+        # 索引只存序號，序號遞增，所以每個 deque 天然有序，最舊的一定在最左邊
+        self._by_guild: Dict[Optional[int], Deque[int]] = {}
+        self._by_user: Dict[Optional[int], Deque[int]] = {}
+        self._async_waiters = AsyncWaiters()
+
+    # ---------- 寫入 ----------
+    def append(self, entry: dict, guild_id: Optional[int] = None, user_id: Optional[int] = None) -> dict:
+        """寫入一筆紀錄並回傳 (已附上 seq 的) entry，O(1)。"""
+        with self._lock:
+            self._last_seq += 1
+            seq = self._last_seq
+            entry["seq"] = seq
+            entry.setdefault("ts", time.time())
+            slot = seq % self.capacity
+
+            evicted = self._slots[slot]
+            if evicted is not None:
+                self._unindex(self._by_guild, evicted["_guild"])
+                self._unindex(self._by_user, evicted["_user"])
+
+            entry["_guild"] = guild_id
+            entry["_user"] = user_id
+            self._slots[slot] = entry
+            self._by_guild.setdefault(guild_id, deque()).append(seq)
+            self._by_user.setdefault(user_id, deque()).append(seq)
+            self._lock.notify_all()
+        self._async_waiters.notify()
+        return entry
+
+    @staticmethod
+    def _unindex(index: Dict[Optional[int], Deque[int]], key: Optional[int]):
+        seqs = index.get(key)
+        if seqs:
+            seqs.popleft()
+            if not seqs:
+                del index[key]
+
+    # ---------- 讀取 ----------
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def first_seq(self) -> int:
+        """目前緩衝區中最舊一筆紀錄的序號 (空的時候為 last_seq + 1)。"""
+        return max(1, self._last_seq - self.capacity + 1) if self._last_seq else 1
+
+    def __len__(self) -> int:
+        return min(self._last_seq, self.capacity)
+
+    def __bool__(self) -> bool:
+        return self._last_seq > 0
+
+    def __iter__(self):
+        return iter(self.since(0))
+
+    @staticmethod
+    def _public(entry: dict) -> dict:
+        return {k: v for k, v in entry.items() if not k.startswith("_")}
+
+    def since(self, seq: int = 0, guild_id: Optional[int] = None, user_id: Optional[int] = None,
+              limit: Optional[int] = None, filter_guild: bool = False) -> List[dict]:
+        """回傳序號大於 seq 的紀錄 (由舊到新)，參數同 page()。"""
+        return self.page(seq, guild_id=guild_id, user_id=user_id, limit=limit, filter_guild=filter_guild)[0]
+
+    def page(self, seq: int = 0, guild_id: Optional[int] = None, user_id: Optional[int] = None,
+             limit: Optional[int] = None, filter_guild: bool = False) -> Tuple[List[dict], int]:
+        """回傳 (序號大於 seq 的紀錄, 下次要帶的游標)，只走訪新資料，不會複製整個緩衝區。
+
+        seq > 0 時回傳之後「最舊」的 limit 筆，照游標翻頁不會漏掉中間的紀錄；seq = 0 時回傳最新的 limit 筆。
+        游標在鎖內決定：被 limit 截斷時是最後一筆的序號，否則是當下的 last_seq (跳過被過濾掉的紀錄)。
+        filter_guild=True 時才會以 guild_id 過濾 (guild_id=None 代表私訊)。
+        """
+        with self._lock:
+            cursor = self._last_seq
+            if filter_guild or user_id is not None:
+                if filter_guild:
+                    seqs = self._by_guild.get(guild_id, ())
+                else:
+                    seqs = self._by_user.get(user_id, ())
+                picked = []
+                for s in reversed(seqs):
+                    # 取最新的 limit 筆時夠了就停；取最舊的 limit 筆則要走到 seq 為止
+                    if s <= seq or (seq == 0 and limit is not None and len(picked) >= limit):
+                        break
+                    entry = self._slots[s % self.capacity]
+                    if user_id is not None and entry["_user"] != user_id:
+                        continue
+                    picked.append(entry)
+                picked.reverse()
+                if seq > 0 and limit is not None and len(picked) > limit:
+                    picked = picked[:limit]
+                    cursor = picked[-1]["seq"] if picked else seq
+            else:
+                start, end = max(seq + 1, self.first_seq), self._last_seq
+                if limit is not None and end - start + 1 > limit:
+                    if seq > 0:
+                        end = cursor = start + limit - 1 if limit > 0 else seq
+                    else:
+                        start = end - limit + 1
+                picked = [self._slots[s % self.capacity] for s in range(start, end + 1)]
+            return [self._public(e) for e in picked], cursor
+
+    def latest(self, n: int, guild_id: Optional[int] = None, filter_guild: bool = False) -> List[dict]:
+        """最近 n 筆紀錄 (由舊到新)。"""
+        return self.since(0, guild_id=guild_id, limit=n, filter_guild=filter_guild)
+
+    def wait_for(self, seq: int, timeout: float) -> bool:
+        """阻塞直到有序號大於 seq 的紀錄或逾時，回傳是否有新資料。"""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._last_seq > seq, timeout)
+
+    async def wait_async(self, seq: int, timeout: float) -> bool:
+        """wait_for 的事件循環版本 (SSE 串流在事件循環上等待，不佔用執行緒)。"""
+        return await self._async_waiters.wait(lambda: self._last_seq > seq, timeout)
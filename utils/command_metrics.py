@@ -0,0 +1,151 @@
+# 檔案名稱：utils/command_metrics.py
+import asyncio
+import contextvars
+import functools
+import time
+import weakref
+from typing import Optional
+
+import discord
+from discord import app_commands
+
+from utils.metrics import REGISTRY
+
+# 斜線指令的延遲與結果統計：
+# 包裝 bot.tree 上每個 app_commands.Command 的 callback，並在 InteractionResponse / followup
+# 上掛一次性的鉤子，記錄「多久才 defer / 回應」、「多久才送出第一個 followup」與整體處理時間。
+
+COMMAND_DURATION = REGISTRY.histogram(
+    "bot_command_duration_seconds", "斜線指令處理函式的總執行時間", ("command",))
+COMMAND_ACK = REGISTRY.histogram(
+    "bot_command_ack_seconds", "從處理函式開始到第一次回應 (defer / send_message) 的時間", ("command", "kind"))
+COMMAND_FIRST_FOLLOWUP = REGISTRY.histogram(
+    "bot_command_first_followup_seconds", "從處理函式開始到第一個 followup 送出的時間", ("command",))
+COMMAND_ERRORS = REGISTRY.counter(
+    "bot_command_errors_total", "斜線指令拋出的例外次數 (依例外類型)", ("command", "exception"))
+COMMAND_EXPIRED = REGISTRY.counter(
+    "bot_interaction_expired_total", "回應時互動已過期 (Unknown interaction 10062) 的次數", ("command",))
+
+UNKNOWN_INTERACTION = 10062
+
+
+class CommandCall:
+    """單次指令執行的計時狀態，透過 contextvar 傳給回應鉤子。"""
+    __slots__ = ("command", "started", "acked", "followed_up", "expired")
+
+    def __init__(self, command: str):
+        self.command = command
+        self.started = time.perf_counter()
+        self.acked = False
+        self.followed_up = False
+        self.expired = False
+
+
+current_call: contextvars.ContextVar[Optional[CommandCall]] = contextvars.ContextVar("current_call", default=None)
+
+# Task -> 指令名稱，讓其他執行緒 (例如事件循環卡頓偵測) 也能知道目前在跑哪個指令
+_task_labels: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+
+
+def task_label(task: asyncio.Task) -> Optional[str]:
+    return _task_labels.get(task)
+
+
+def _mark_ack(kind: str):
+    call = current_call.get()
+    if call is not None and not call.acked:
+        call.acked = True
+        COMMAND_ACK.observe(time.perf_counter() - call.started, call.command, kind)
+
+
+def _mark_followup():
+    call = current_call.get()
+    if call is not None and not call.followed_up:
+        call.followed_up = True
+        COMMAND_FIRST_FOLLOWUP.observe(time.perf_counter() - call.started, call.command)
+
+
+def _mark_expired():
+    call = current_call.get()
+    if call is not None and not call.expired:
+        call.expired = True
+        COMMAND_EXPIRED.inc(call.command)
+
+
+def _hook(cls, name: str, before):
+    original = getattr(cls, name)
+    if getattr(original, "__metrics_hooked__", False):
+        return
+
+    @functools.wraps(original)
+    async def hooked(self, *args, **kwargs):
+        before(self)
+        try:
+            return await original(self, *args, **kwargs)
+        except discord.NotFound as e:
+            # 很多指令自己吞掉了回應失敗的例外，所以在這裡就先記下過期次數
+            if e.code == UNKNOWN_INTERACTION:
+                _mark_expired()
+            raise
+
+    hooked.__metrics_hooked__ = True
+    setattr(cls, name, hooked)
+
+
+def _install_response_hooks():
+    _hook(discord.InteractionResponse, "defer", lambda self: _mark_ack("defer"))
+    _hook(discord.InteractionResponse, "send_message", lambda self: _mark_ack("send_message"))
+    _hook(discord.InteractionResponse, "send_modal", lambda self: _mark_ack("send_modal"))
+
+    def on_webhook_send(webhook):
+        # interaction.followup 是 application 類型的 Webhook；一般 Webhook (例如 /mimic) 不算
+        if webhook.type is discord.WebhookType.application:
+            _mark_followup()
+
+    _hook(discord.Webhook, "send", on_webhook_send)
+
+
+def _wrap_callback(command: app_commands.Command):
+    callback = command._callback
+    if getattr(callback, "__metrics_wrapped__", False):
+        return
+    name = f"/{command.qualified_name}"
+    COMMAND_DURATION.prepare(name)
+    COMMAND_FIRST_FOLLOWUP.prepare(name)
+
+    @functools.wraps(callback)
+    async def instrumented(*args, **kwargs):
+        call = CommandCall(name)
+        token = current_call.set(call)
+        task = asyncio.current_task()
+        if task is not None:
+            _task_labels[task] = name
+        try:
+            return await callback(*args, **kwargs)
+        except discord.NotFound as e:
+            if e.code == UNKNOWN_INTERACTION:
+                _mark_expired()
+            COMMAND_ERRORS.inc(name, type(e).__name__)
+            raise
+        except Exception as e:
+            COMMAND_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            COMMAND_DURATION.observe(time.perf_counter() - call.started, name)
+            current_call.reset(token)
+            if task is not None:
+                _task_labels.pop(task, None)
+
+    instrumented.__metrics_wrapped__ = True
+    command._callback = instrumented
+
+
+def instrument_tree(tree: app_commands.CommandTree) -> int:
+    """替 tree 上所有斜線指令 (含 Cog 與群組子指令) 加上統計，回傳包裝的指令數。可重複呼叫。"""
+    _install_response_hooks()
+    count = 0
+    for command in tree.walk_commands():
+        if isinstance(command, app_commands.Command):
+            _wrap_callback(command)
+            count += 1
+    return count
@@ -0,0 +1,167 @@
+# 檔案名稱：utils/conditional.py
+import functools
+import hashlib
+import inspect
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Hashable, NamedTuple, Optional
+
+from flask import Response, make_response, request, session
+
+from utils.metrics import REGISTRY
+
+# 條件式 GET：每個路由提供一個便宜的「版本」函式 (日誌序號、設定檔 mtime、伺服器快照版本…)，
+# 在執行 view / 模板之前先算出 ETag，瀏覽器帶的 If-None-Match (或 If-Modified-Since) 相符就直接回 304。
+# ETag 另外混入模板與靜態資源的指紋、登入 session 與網址，所以改版、換帳號或權限變動後一定會重新產生。
+# 一律使用弱 ETag，送出前被動態 gzip 也不影響比對。
+# 沒有便宜版本可查的資料 (例如設定變更事件) 用 invalidate(key) 累加世代，版本函式把 generation(key) 放進 token。
+
+VALIDATOR_REQUESTS = REGISTRY.counter(
+    "dashboard_conditional_requests_total",
+    "條件式 GET 結果 (hit=回 304 / miss=版本已變 / none=沒帶驗證器 / skip=無法事先算出版本 / denied=未授權)",
+    ("route", "result"),
+)
+
+
+class Validator(NamedTuple):
+    token: tuple                            # 內容依賴的版本 (任何能 repr 的值)
+    last_modified: Optional[float] = None   # Unix 秒數，有的話一併送 Last-Modified
+
+
+def file_version(path: str) -> Optional[tuple]:
+    """檔案的 (inode, 大小, mtime_ns)；檔案不存在回傳 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def tree_fingerprint(*directories: str) -> str:
+    """目錄下所有檔案內容的雜湊 (啟動時算一次，模板改版後 ETag 自動失效)。"""
+    digest = hashlib.sha256()
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, directory).encode())
+                try:
+                    with open(path, "rb") as f:
+                        digest.update(f.read())
+                except OSError:
+                    continue
+    return digest.hexdigest()[:16]
+
+
+class ConditionalResponses:
+    def __init__(self, salt: str = ""):
+        self.salt = salt
+        self._generations: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def generation(self, key: Hashable) -> int:
+        """key 的資料世代 (從 0 開始，每次 invalidate 加一)。"""
+        return self._generations.get(key, 0)
+
+    def invalidate(self, key: Hashable):
+        """讓 token 帶有 generation(key) 的 ETag 全部失效 (任何執行緒都可以呼叫)。"""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _etag(self, name: str, validator: Validator) -> str:
+        # 同一個 session 才會拿到同一個 ETag；discord_guilds_version 讓權限變動後的請求一定重新驗證
+        identity = (getattr(session, "sid", None), session.get("discord_guilds_version"))
+        raw = repr((self.salt, name, request.full_path, identity, validator.token))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+    def _not_modified(self, etag: str, validator: Validator) -> bool:
+        if request.if_none_match:
+            # If-None-Match 優先；有帶就不看 If-Modified-Since
+            return request.if_none_match.contains_weak(etag)
+        since = request.if_modified_since
+        if since is not None and validator.last_modified is not None:
+            return int(validator.last_modified) <= since.timestamp()
+        return False
+
+    @staticmethod
+    def _stamp(response: Response, etag: str, validator: Validator) -> Response:
+        response.set_etag(etag, weak=True)
+        if validator.last_modified is not None:
+            response.last_modified = datetime.fromtimestamp(int(validator.last_modified), tz=timezone.utc)
+        # 允許瀏覽器保存，但每次使用前都要回來驗證 (fetch / XHR 會自動處理 304)
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+        return response
+
+    def conditional(self, name: str, version: Callable[..., Optional[Validator]],
+                    allow: Optional[Callable[..., bool]] = None):
+        """
+        路由裝飾器 (放在 @app.route 下面)。version 接收跟 view 相同的參數，回傳 Validator 或 None (無法事先判斷)；
+        async 路由可以用 async 的 version 函式。只處理 GET / HEAD。
+        allow (同樣的參數) 在 version 之前執行：回傳 False 時不算版本、不帶 ETag，直接交給 view 回應 401 / 403，
+        未授權的請求不會觸發版本查詢 (可能要 IPC / stat)，也無法用 304 探測內容有沒有變。
+        """
+
+        def skip(args, kwargs) -> bool:
+            if request.method not in ("GET", "HEAD"):
+                return True
+            if allow is not None and not allow(*args, **kwargs):
+                VALIDATOR_REQUESTS.inc(name, "denied")
+                return True
+            return False
+
+        def check(validator: Optional[Validator]):
+            if validator is None:
+                VALIDATOR_REQUESTS.inc(name, "skip")
+                return None, None
+            etag = self._etag(name, validator)
+            if self._not_modified(etag, validator):
+                VALIDATOR_REQUESTS.inc(name, "hit")
+                return etag, self._stamp(Response(status=304), etag, validator)
+            VALIDATOR_REQUESTS.inc(name, "miss" if request.if_none_match or request.if_modified_since else "none")
+            return etag, None
+
+        def finish(rv, etag, validator):
+            response = make_response(rv)
+            if response.status_code == 200 and not response.is_streamed:
+                if etag is None and validator is not None:
+                    etag = self._etag(name, validator)
+                if etag is not None:
+                    self._stamp(response, etag, validator)
+            return response
+
+        def decorator(view):
+            if inspect.iscoroutinefunction(view):
+                @functools.wraps(view)
+                async def wrapper(*args, **kwargs):
+                    if skip(args, kwargs):
+                        return await view(*args, **kwargs)
+                    validator = version(*args, **kwargs)
+                    if inspect.isawaitable(validator):
+                        validator = await validator
+                    etag, not_modified = check(validator)
+                    if not_modified is not None:
+                        return not_modified
+                    rv = await view(*args, **kwargs)
+                    if validator is None:
+                        # 第一次 (例如快照還沒進快取) 事後再算一次，下次就能比對
+                        validator = version(*args, **kwargs)
+                        if inspect.isawaitable(validator):
+                            validator = await validator
+                    return finish(rv, etag, validator)
+            else:
+                @functools.wraps(view)
+                def wrapper(*args, **kwargs):
+                    if skip(args, kwargs):
+                        return view(*args, **kwargs)
+                    validator = version(*args, **kwargs)
+                    etag, not_modified = check(validator)
+                    if not_modified is not None:
+                        return not_modified
+                    rv = view(*args, **kwargs)
+                    return finish(rv, etag, validator if validator is not None else version(*args, **kwargs))
+            return wrapper
+
+        return decorator
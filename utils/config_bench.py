@@ -0,0 +1,115 @@
+# 檔案名稱：utils/config_bench.py
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from utils.config_manager import JsonDirectoryBackend, SQLiteBackend
+
+# 設定儲存後端效能比較 (json 目錄 vs. 單一 SQLite 檔)，直接呼叫後端，不經過快取與背景寫入。
+# 用法：python -m utils.config_bench --guilds 10000
+# 在暫存目錄產生假資料，跑完自動刪除；--keep 可保留檔案以便檢查。
+
+
+def _fake_config(i: int, rng: random.Random) -> dict:
+    config = {
+        "welcome_channel_id": str(rng.randrange(10**17, 10**18)) if rng.random() < 0.6 else "",
+        "video_notification_channel_id": str(rng.randrange(10**17, 10**18)) if rng.random() < 0.3 else "",
+        "video_notification_message": "有新影片！{title}",
+        "live_notification_message": "開台囉！{title}",
+        "ytdlp_enabled": bool(i % 2),
+    }
+    if i % 5 == 0:
+        config["youtube_channels"] = [f"UC{rng.getrandbits(64):016x}" for _ in range(3)]
+    return config
+
+
+def _timed(label: str, results: list, func, count: int = 1):
+    start = time.perf_counter()
+    value = func()
+    elapsed = time.perf_counter() - start
+    results.append((label, elapsed, elapsed / count if count > 1 else None))
+    return value
+
+
+def _disk_usage(path: str):
+    """(檔案數, 內容大小, 實際占用的磁碟區塊大小)"""
+    if os.path.isfile(path):
+        # 連同 WAL / shm 一起算
+        files = [p for p in (path, path + "-wal", path + "-shm") if os.path.exists(p)]
+    else:
+        files = [os.path.join(path, name) for name in os.listdir(path)]
+    stats = [os.stat(p) for p in files]
+    return len(files), sum(st.st_size for st in stats), sum(getattr(st, "st_blocks", 0) * 512 for st in stats)
+
+
+def bench_backend(backend, configs: dict, lookups: list, probe_value: str) -> list:
+    results = []
+    keys = list(configs)
+    if isinstance(backend, SQLiteBackend):
+        _timed("寫入 (單一交易)", results, lambda: backend.write_many(configs.items()), len(keys))
+    _timed("寫入 (逐筆)", results, lambda: [backend.write(key, configs[key]) for key in keys], len(keys))
+    _timed("讀取全部", results, lambda: [backend.read(key) for key in keys], len(keys))
+    _timed("隨機讀取", results, lambda: [backend.read(key) for key in lookups], len(lookups))
+    _timed("版本檢查", results, lambda: [backend.version(key) for key in lookups], len(lookups))
+    _timed("列出所有 key", results, backend.keys)
+    found = _timed("查詢：有影片通知頻道", results, lambda: backend.find("video_notification_channel_id"))
+    _timed("查詢：指定歡迎頻道", results, lambda: backend.find("welcome_channel_id", probe_value))
+    _timed("查詢：未索引欄位", results, lambda: backend.find("ytdlp_enabled"))
+    results.append(("查詢結果筆數", len(found), "count"))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比較 json 目錄與 SQLite 設定儲存後端")
+    parser.add_argument("--guilds", type=int, default=10000, help="模擬的伺服器數量")
+    parser.add_argument("--lookups", type=int, default=2000, help="隨機讀取 / 版本檢查次數")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="保留產生的暫存檔")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    configs = {str(10**17 + i): _fake_config(i, rng) for i in range(args.guilds)}
+    lookups = [rng.choice(list(configs)) for _ in range(args.lookups)]
+    probe_value = next(c["welcome_channel_id"] for c in configs.values() if c["welcome_channel_id"])
+
+    root = tempfile.mkdtemp(prefix="config-bench-")
+    try:
+        json_backend = JsonDirectoryBackend(os.path.join(root, "configs"))
+        sqlite_backend = SQLiteBackend(os.path.join(root, "configs.db"))
+        report = {
+            "json": bench_backend(json_backend, configs, lookups, probe_value),
+            "sqlite": bench_backend(sqlite_backend, configs, lookups, probe_value),
+        }
+        migrated = SQLiteBackend(os.path.join(root, "migrated.db"))
+        start = time.perf_counter()
+        migrated.migrate_from(json_backend)
+        migration = time.perf_counter() - start
+
+        print(f"伺服器數量: {args.guilds}，隨機讀取: {args.lookups} 次，暫存目錄: {root}")
+        for name, results in report.items():
+            print(f"\n[{name}]")
+            for label, total, per_op in results:
+                if per_op == "count":
+                    print(f"  {label}: {total}")
+                elif per_op is None:
+                    print(f"  {label}: {total * 1000:.2f} ms")
+                else:
+                    print(f"  {label}: {total * 1000:.2f} ms (每次 {per_op * 1e6:.2f} µs)")
+        sqlite_backend._db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print()
+        for name, path in (("json", json_backend.directory), ("sqlite", sqlite_backend.path)):
+            files, size, allocated = _disk_usage(path)
+            print(f"{name} 占用: {files} 個檔案，內容 {size / 1024:.0f} KiB，磁碟區塊 {allocated / 1024:.0f} KiB")
+        print(f"json → sqlite 匯入: {migration * 1000:.0f} ms")
+    finally:
+        if args.keep:
+            print(f"已保留 {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# 檔案名稱：utils/config_events.py
+import asyncio
+import inspect
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("ConfigEvents")
+
+# 設定變更的行程內 pub/sub：
+# 唯一的發出者是 utils.config_manager：save_config / update_config / update_support_config、快取發現設定被外部修改時，
+# 都會發出一個 ConfigChange，列出哪些欄位從什麼值變成什麼值 (SupportCog 改轉發設定也是透過 update_support_config)。
+# 訂閱以主題前綴過濾，主題是「範圍.欄位」，例如 "guild.welcome_channel_id"、"support.channel_id"
+# (兩種範圍的 guild_id 都是該伺服器的 ID)；
+# "guild.video_notification" 會同時收到頻道與訊息範本的變更，"" 收到全部。
+# 預設在 Discord 事件循環上依發生順序呼叫 (任何執行緒發出都可以，用 call_soon_threadsafe 排入)；
+# 事件循環還沒綁定前的事件會先暫存，綁定後補送。inline=True 的訂閱者在發出事件的執行緒上直接呼叫，
+# 只適合做「丟掉某個快取」這種快速、執行緒安全的動作。
+# 事件可以用 to_dict / from_dict 轉成 JSON，轉發給其他行程 (網頁 worker) 的 bus。
+
+CONFIG_EVENTS_PUBLISHED = REGISTRY.counter(
+    "config_events_published_total", "發出的設定變更事件數", ("scope",))
+CONFIG_EVENT_ERRORS = REGISTRY.counter(
+    "config_event_subscriber_errors_total", "處理設定變更事件時丟出例外的次數")
+
+
+class ConfigChange(NamedTuple):
+    scope: str                                  # "guild" / "support"
+    guild_id: Optional[int]                     # 伺服器 ID (設定檔名稱不是伺服器 ID 時為 None)
+    changes: Mapping[str, Tuple[Any, Any]]      # 欄位 -> (舊值, 新值)；欄位被刪除時新值為 None
+    source: str = "config"                      # 誰改的 (dashboard / SupportCog / external…)
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self.changes)
+
+    @property
+    def topics(self) -> List[str]:
+        return [f"{self.scope}.{key}" for key in self.changes]
+
+    def matches(self, prefix: str) -> bool:
+        return any(topic.startswith(prefix) for topic in self.topics)
+
+    def to_dict(self) -> dict:
+        return {"scope": self.scope, "guild_id": self.guild_id, "source": self.source,
+                "changes": {key: list(values) for key, values in self.changes.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "ConfigChange":
+        return cls(data["scope"], data["guild_id"],
+                   {key: tuple(values) for key, values in data["changes"].items()}, data.get("source", "config"))
+
+
+def diff_config(old: Mapping, new: Mapping) -> Dict[str, Tuple[Any, Any]]:
+    """兩份設定中值不同的頂層欄位。"""
+    return {key: (old.get(key), new.get(key))
+            for key in old.keys() | new.keys()
+            if key not in old or key not in new or old[key] != new[key]}
+
+
+class ConfigEventBus:
+    def __init__(self, backlog: int = 1000):
+        self._subscribers: List[Tuple[str, Callable, bool]] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._backlog: "deque[ConfigChange]" = deque(maxlen=backlog)
+
+    def subscribe(self, prefix: str, callback: Callable[[ConfigChange], Any], inline: bool = False) -> Callable[[], None]:
+        """訂閱主題前綴；callback 可以是一般函式或 coroutine function。回傳取消訂閱的函式。"""
+        if inline and inspect.iscoroutinefunction(callback):
+            raise TypeError("inline 訂閱者不能是 coroutine function")
+        entry = (prefix, callback, inline)
+        with self._lock:
+            self._subscribers = self._subscribers + [entry]
+
+        def unsubscribe():
+            with self._lock:
+                self._subscribers = [s for s in self._subscribers if s is not entry]
+
+        return unsubscribe
+
+    def on(self, prefix: str, inline: bool = False):
+        """subscribe 的裝飾器寫法。"""
+
+        def decorator(callback):
+            self.subscribe(prefix, callback, inline=inline)
+            return callback
+
+        return decorator
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """指定要在哪個事件循環上通知訂閱者 (機器人 on_ready 時呼叫)，並補送之前暫存的事件。"""
+        with self._lock:
+            self._loop = loop
+            backlog = list(self._backlog)
+            self._backlog.clear()
+        for event in backlog:
+            loop.call_soon_threadsafe(self._deliver, event)
+
+    def publish(self, event: ConfigChange):
+        """任何執行緒都可以呼叫；沒有變更的欄位時不發出。"""
+        if not event.changes:
+            return
+        CONFIG_EVENTS_PUBLISHED.inc(event.scope)
+        subscribers = self._subscribers
+        for prefix, callback, inline in subscribers:
+            if inline and event.matches(prefix):
+                self._call(callback, event)
+        if not any(not inline for _, _, inline in subscribers):
+            return
+        with self._lock:
+            loop = self._loop
+            if loop is None or loop.is_closed():
+                self._backlog.append(event)
+                return
+        try:
+            loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:
+            # 事件循環已經關閉 (關機中)
+            pass
+
+    def _deliver(self, event: ConfigChange):
+        for prefix, callback, inline in self._subscribers:
+            if not inline and event.matches(prefix):
+                self._call(callback, event)
+
+    def _call(self, callback, event: ConfigChange):
+        try:
+            result = callback(event)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(self._await(callback, result))
+        except Exception as e:
+            CONFIG_EVENT_ERRORS.inc()
+            logger.error(f"設定變更訂閱者 {getattr(callback, '__qualname__', callback)} 發生錯誤: {type(e).__name__}: {e}")
+
+    async def _await(self, callback, awaitable):
+        try:
+            await awaitable
+        except Exception as e:
+            CONFIG_EVENT_ERRORS.inc()
+            logger.error(f"設定變更訂閱者 {getattr(callback, '__qualname__', callback)} 發生錯誤: {type(e).__name__}: {e}")
+
+
+CONFIG_EVENTS = ConfigEventBus()
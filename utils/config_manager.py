@@ -1,38 +1,635 @@
 # 檔案名稱：utils/config_manager.py
 import os
 import json
+import copy
+import asyncio
+import atexit
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 
-CONFIG_DIR = "configs" 
+from utils.config_events import CONFIG_EVENTS, ConfigChange, diff_config
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("ConfigManager")
+
+# 設定檔讀寫 (每個伺服器一份設定，加上 support_config：客服轉發設定 {伺服器 ID: [頻道 ID, 身分組 ID]})。
+# 儲存後端可以切換 (CONFIG_BACKEND)：
+# - json   ：configs/<guild_id>.json，一個伺服器一個檔案 (預設)
+# - sqlite ：單一資料庫檔 (CONFIG_DB_PATH)，key-value 表 + 常用欄位的索引表，可以跨伺服器查詢；
+#            第一次啟用時會自動把 configs/*.json 匯入一次
+# 讀取走行程內的 LRU 快取：距離上次確認超過 CONFIG_REVALIDATE_SECONDS 秒才向後端查一次版本
+# (檔案的 mtime / 大小，或資料列的版本號)，變了 (例如被手動修改、其他行程寫入) 才重新讀取；存檔時同步更新快取。
+# 呼叫端拿到的都是複本，改了也不會影響快取，要 save 才會生效。
+# 存檔是 write-behind：save 只更新快取並排入背景執行緒，同一份設定在 CONFIG_WRITE_DELAY 秒內的多次存檔只寫最後一次；
+# json 後端先寫暫存檔、fsync 後再 os.replace，當機也不會留下寫一半的設定檔。關閉前呼叫 flush_configs()。
+# update_config 在同一個伺服器的鎖內「讀取 → 只改指定的 key → 存檔」，同時有多個來源 (後台、cog) 修改也不會互相覆蓋。
+# 事件循環上請用 aload_config / asave_config / aupdate_config：快取命中時直接回傳，
+# 需要讀後端時才丟到專用的執行緒池 (CONFIG_IO_WORKERS)，不阻塞 Discord 事件循環。
+# 每次存檔 (以及快取發現設定被外部修改) 都會把變更的欄位發到 utils.config_events.CONFIG_EVENTS。
+
+CONFIG_DIR = "configs"
 SUPPORT_CONFIG_FILE = "support_config.json"
+SUPPORT_CONFIG_KEY = "support_config"
+
+# sqlite 後端會替這些欄位建索引，find_guilds 查詢不需要掃過所有設定
+INDEXED_FIELDS = ("video_notification_channel_id", "welcome_channel_id")
+
+CONFIG_CACHE_REQUESTS = REGISTRY.counter(
+    "config_cache_requests_total", "設定檔快取查詢結果 (hit / miss / reload)", ("result",))
+CONFIG_CACHE_SIZE = REGISTRY.gauge(
+    "config_cache_entries", "設定檔快取中的項目數")
+CONFIG_WRITES = REGISTRY.counter(
+    "config_writes_total", "設定檔寫入結果 (written = 實際寫入磁碟 / coalesced = 被之後的存檔合併掉 / error)", ("result",))
+CONFIG_PENDING = REGISTRY.gauge(
+    "config_writes_pending", "還沒寫入磁碟的設定檔數")
+
+
+def _index_value(value) -> Optional[str]:
+    """索引用的欄位值；空值 (None / "" / 0) 不建索引，等於「沒有設定」。"""
+    if value is None or value == "" or value == 0 or isinstance(value, (dict, list)):
+        return None
+    return str(value)
+
+
+def _atomic_write_json(path: str, config: dict):
+    """寫到同目錄的暫存檔 → fsync → os.replace，讀取端只會看到完整的舊檔或新檔。"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # 目錄也要 fsync，rename 本身才算落地 (Windows 不支援，略過)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class JsonDirectoryBackend:
+    """一份設定一個 JSON 檔 (原本的格式)。"""
+
+    name = "json"
+
+    def __init__(self, directory: str = CONFIG_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def version(self, key: str) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path(key))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def read(self, key: str) -> dict:
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            logger.error(f"設定檔 {path} 格式錯誤，暫時以空設定處理: {e}")
+            return {}
+
+    def write(self, key: str, data: dict):
+        _atomic_write_json(self.path(key), data)
+
+    def keys(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [name[:-5] for name in names if name.endswith(".json")]
+
+    def find(self, field: str, value=None) -> List[str]:
+        # 沒有索引，只能逐一讀檔
+        keys = []
+        for key in self.keys():
+            found = _index_value(self.read(key).get(field))
+            if found is not None and (value is None or found == str(value)):
+                keys.append(key)
+        return keys
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS configs (
+    key     TEXT PRIMARY KEY,
+    data    TEXT    NOT NULL,
+    version INTEGER NOT NULL,
+    updated REAL    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS config_index (
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    key   TEXT NOT NULL,
+    PRIMARY KEY (field, value, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_config_index_key ON config_index (key);
+CREATE TABLE IF NOT EXISTS config_meta (
+    name  TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteBackend:
+    """所有設定放在同一個 SQLite 檔 (WAL)；INDEXED_FIELDS 另外寫進 config_index 供跨伺服器查詢。"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "data/configs.db", indexed_fields: Iterable[str] = INDEXED_FIELDS):
+        self.path = path
+        self.indexed_fields = tuple(indexed_fields)
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 用這個執行緒之後也會用到的連線建立資料表 (sqlite3 的 with 只提交交易，不會關閉連線)
+        self._db().executescript(_SQLITE_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _db(self) -> sqlite3.Connection:
+        # 每個執行緒一條連線
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def version(self, key: str) -> Optional[tuple]:
+        row = self._db().execute("SELECT version FROM configs WHERE key = ?", (key,)).fetchone()
+        return (row[0],) if row is not None else None
+
+    def read(self, key: str) -> dict:
+        row = self._db().execute("SELECT data FROM configs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return {}
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError as e:
+            logger.error(f"資料庫中的設定 {key} 格式錯誤，暫時以空設定處理: {e}")
+            return {}
+
+    def write(self, key: str, data: dict):
+        self.write_many([(key, data)])
+
+    def write_many(self, items: Iterable[Tuple[str, dict]], replace: bool = True):
+        """在同一個交易裡寫入多份設定；replace=False 時已存在的 key 保持不變 (匯入用)。"""
+        conn = self._db()
+        now = time.time()
+        with conn:
+            for key, data in items:
+                if replace:
+                    conn.execute(
+                        "INSERT INTO configs (key, data, version, updated) VALUES (?, ?, 1, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET data = excluded.data, "
+                        "version = configs.version + 1, updated = excluded.updated",
+                        (key, json.dumps(data, ensure_ascii=False), now))
+                else:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO configs (key, data, version, updated) VALUES (?, ?, 1, ?)",
+                        (key, json.dumps(data, ensure_ascii=False), now))
+                    if not cursor.rowcount:
+                        continue
+                conn.execute("DELETE FROM config_index WHERE key = ?", (key,))
+                rows = []
+                for field in self.indexed_fields:
+                    value = _index_value(data.get(field))
+                    if value is not None:
+                        rows.append((field, value, key))
+                if rows:
+                    conn.executemany("INSERT INTO config_index (field, value, key) VALUES (?, ?, ?)", rows)
+
+    def keys(self) -> List[str]:
+        return [row[0] for row in self._db().execute("SELECT key FROM configs")]
+
+    def find(self, field: str, value=None) -> List[str]:
+        conn = self._db()
+        if field in self.indexed_fields:
+            if value is None:
+                rows = conn.execute("SELECT DISTINCT key FROM config_index WHERE field = ?", (field,))
+            else:
+                rows = conn.execute("SELECT key FROM config_index WHERE field = ? AND value = ?", (field, str(value)))
+            return [row[0] for row in rows]
+        keys = []
+        for key, data in conn.execute("SELECT key, data FROM configs"):
+            found = _index_value(json.loads(data).get(field))
+            if found is not None and (value is None or found == str(value)):
+                keys.append(key)
+        return keys
+
+    def migrate_from(self, source: JsonDirectoryBackend) -> Optional[int]:
+        """把 JSON 目錄匯入資料庫 (只做一次，資料庫裡已經有的 key 不覆蓋)；已匯入過回傳 None。"""
+        conn = self._db()
+        marker = f"migrated:{os.path.abspath(source.directory)}"
+        if conn.execute("SELECT 1 FROM config_meta WHERE name = ?", (marker,)).fetchone():
+            return None
+        keys = source.keys()
+        self.write_many(((key, source.read(key)) for key in keys), replace=False)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO config_meta (name, value) VALUES (?, ?)", (marker, str(time.time())))
+        return len(keys)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(kind: Optional[str] = None):
+    kind = (kind or os.getenv("CONFIG_BACKEND", "json")).lower()
+    if kind == "json":
+        return JsonDirectoryBackend(CONFIG_DIR)
+    if kind == "sqlite":
+        backend = SQLiteBackend(os.getenv("CONFIG_DB_PATH", "data/configs.db"))
+        if os.path.isdir(CONFIG_DIR):
+            count = backend.migrate_from(JsonDirectoryBackend(CONFIG_DIR))
+            if count is not None:
+                logger.info(f"已將 {count} 份設定從 {CONFIG_DIR}/ 匯入 {backend.path}")
+        return backend
+    raise ValueError(f"未知的設定儲存後端: {kind!r} (可用: json / sqlite)")
+
+
+def get_backend():
+    """目前使用的儲存後端 (第一次呼叫時依 CONFIG_BACKEND 建立)。"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+class ConfigCache:
+    def __init__(self, max_entries: int = 2048, revalidate_after: float = 2.0):
+        self.max_entries = max_entries
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()   # key -> [資料, 後端版本 或 None, 上次確認時間]
+        self._lock = threading.Lock()
+        REGISTRY.add_collector(lambda: CONFIG_CACHE_SIZE.set(value=len(self._entries)))
+
+    def load(self, key: str) -> dict:
+        # 還沒寫進後端的存檔優先 (後端內容是舊的，不能拿來重新驗證)
+        pending = CONFIG_WRITER.pending(key)
+        if pending is not None:
+            CONFIG_CACHE_REQUESTS.inc("hit")
+            return copy.deepcopy(pending)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now - entry[2] < self.revalidate_after:
+                    CONFIG_CACHE_REQUESTS.inc("hit")
+                    return copy.deepcopy(entry[0])
+        # 在鎖外查版本 / 讀取，不擋住其他伺服器的讀取
+        backend = get_backend()
+        version = backend.version(key)
+        if entry is not None and version == entry[1]:
+            with self._lock:
+                entry[2] = now
+            CONFIG_CACHE_REQUESTS.inc("hit")
+            return copy.deepcopy(entry[0])
+
+        CONFIG_CACHE_REQUESTS.inc("miss" if entry is None else "reload")
+        data = backend.read(key) if version is not None else {}
+        self._store(key, data, version, now)
+        if entry is not None:
+            # 被手動修改或其他行程寫入
+            _publish(key, entry[0], data, "external")
+        return copy.deepcopy(data)
+
+    def store(self, key: str, data: dict):
+        """存檔時呼叫 (write-through)：記下新內容；後端版本等背景寫入完成後由 mark_written 更新。"""
+        self._store(key, data, get_backend().version(key), time.monotonic())
+
+    def peek(self, key: str) -> Optional[dict]:
+        """不碰後端的快速查詢：有排隊中的存檔或快取還在確認期限內才回傳複本，否則回傳 None。"""
+        pending = CONFIG_WRITER.pending(key)
+        if pending is not None:
+            CONFIG_CACHE_REQUESTS.inc("hit")
+            return copy.deepcopy(pending)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] >= self.revalidate_after:
+                return None
+            self._entries.move_to_end(key)
+            data = entry[0]
+        CONFIG_CACHE_REQUESTS.inc("hit")
+        return copy.deepcopy(data)
+
+    def invalidate(self, key: str):
+        """丟掉快取，下次讀取一定回後端確認 (其他行程改過設定時使用)。"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def mark_written(self, key: str, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = version
+
+    def _store(self, key: str, data: dict, version, checked: float):
+        with self._lock:
+            self._entries[key] = [data, version, checked]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ConfigWriter:
+    def __init__(self, delay: float = 0.5):
+        self.delay = delay
+        self._pending = {}              # key -> (世代, 資料)；寫入完成且沒有更新的存檔才移除
+        self._generation = 0
+        self._lock = threading.Condition()
+        self._thread = None
+        self._stop = False
+        REGISTRY.add_collector(lambda: CONFIG_PENDING.set(value=len(self._pending)))
+        atexit.register(self.flush)
+
+    def pending(self, key: str):
+        with self._lock:
+            item = self._pending.get(key)
+        return item[1] if item is not None else None
+
+    def pending_generation(self, key: str):
+        with self._lock:
+            item = self._pending.get(key)
+        return item[0] if item is not None else None
+
+    def pending_items(self) -> Dict[str, dict]:
+        with self._lock:
+            return {key: data for key, (_, data) in self._pending.items()}
+
+    def submit(self, key: str, data: dict):
+        with self._lock:
+            if key in self._pending:
+                CONFIG_WRITES.inc("coalesced")
+            self._generation += 1
+            self._pending[key] = (self._generation, data)
+            self._ensure_thread()
+            self._lock.notify_all()
+
+    def _ensure_thread(self):
+        # 呼叫端需持有 self._lock；執行緒結束前會在鎖內把 _thread 設回 None
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="config-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._stop:
+                    self._lock.wait()
+                if not self._pending and self._stop:
+                    self._stop = False
+                    self._thread = None
+                    return
+                stopping = self._stop
+            if not stopping:
+                # 等一小段時間，讓連續的存檔合併成一次寫入
+                time.sleep(self.delay)
+            with self._lock:
+                batch = list(self._pending.items())
+            backend = get_backend()
+            for key, (generation, data) in batch:
+                try:
+                    backend.write(key, data)
+                    CONFIG_WRITES.inc("written")
+                    CONFIG_CACHE.mark_written(key, backend.version(key))
+                except Exception as e:
+                    CONFIG_WRITES.inc("error")
+                    logger.error(f"寫入設定 {key} 失敗，稍後重試: {type(e).__name__}: {e}")
+                    continue
+                with self._lock:
+                    current = self._pending.get(key)
+                    if current is not None and current[0] == generation:
+                        del self._pending[key]
+                    self._lock.notify_all()
+            with self._lock:
+                if any(self._pending.get(key, (None,))[0] == gen for key, (gen, _) in batch):
+                    # 有寫入失敗的設定：稍等再試，不要一直重試佔滿 CPU
+                    self._lock.wait(1.0)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等所有存檔寫進後端 (關閉前呼叫)；逾時回傳 False。"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if not self._pending:
+                return True
+            self._stop = True       # 讓背景執行緒跳過合併等待，立刻寫入
+            self._ensure_thread()
+            self._lock.notify_all()
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.error(f"關閉前仍有 {len(self._pending)} 份設定沒有寫入")
+                    return False
+                self._lock.wait(remaining)
+            return True
+
+
+CONFIG_WRITER = ConfigWriter(delay=float(os.getenv("CONFIG_WRITE_DELAY", 0.5)))
+
+CONFIG_CACHE = ConfigCache(
+    max_entries=int(os.getenv("CONFIG_CACHE_SIZE", 2048)),
+    revalidate_after=float(os.getenv("CONFIG_REVALIDATE_SECONDS", 2)),
+)
+
+
+CONFIG_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CONFIG_IO_WORKERS", 4)), thread_name_prefix="config-io")
+
+_key_locks: Dict[str, threading.Lock] = {}
+_key_locks_lock = threading.Lock()
+_async_key_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _key_lock(key: str) -> threading.Lock:
+    lock = _key_locks.get(key)
+    if lock is None:
+        with _key_locks_lock:
+            lock = _key_locks.setdefault(key, threading.Lock())
+    return lock
+
+
+def _async_key_lock(key: str) -> asyncio.Lock:
+    # 沒人在用的鎖會自動回收；等待中的協程都持有參考，所以同一個 key 一定拿到同一把鎖
+    lock = _async_key_locks.get(key)
+    if lock is None:
+        lock = _async_key_locks[key] = asyncio.Lock()
+    return lock
+
+
+def _support_fields(entry) -> dict:
+    return {"channel_id": entry[0], "role_id": entry[1]} if entry else {}
+
+
+def _publish(key: str, old: dict, new: dict, source: str):
+    if key == SUPPORT_CONFIG_KEY:
+        # support_config 是 {伺服器 ID: [頻道 ID, 身分組 ID]}，每個伺服器各發一個事件 (support.channel_id / support.role_id)
+        for gid in old.keys() | new.keys():
+            if old.get(gid) != new.get(gid):
+                CONFIG_EVENTS.publish(ConfigChange(
+                    "support", int(gid) if str(gid).isdigit() else None,
+                    diff_config(_support_fields(old.get(gid)), _support_fields(new.get(gid))), source))
+        return
+    guild_id = int(key) if key.isdigit() else None
+    CONFIG_EVENTS.publish(ConfigChange("guild", guild_id, diff_config(old, new), source))
+
+
+def _write(key: str, config: dict, source: str):
+    data = copy.deepcopy(config)
+    with _key_lock(key):
+        old = CONFIG_CACHE.load(key)
+        CONFIG_CACHE.store(key, data)
+        CONFIG_WRITER.submit(key, data)
+        _publish(key, old, data, source)
+
+def flush_configs(timeout: float = 10.0) -> bool:
+    """把還沒寫入的設定全部寫進後端 (機器人關閉前呼叫)。"""
+    return CONFIG_WRITER.flush(timeout)
 
 def get_config_path(guild_id: int):
+    """json 後端的設定檔路徑。"""
     os.makedirs(CONFIG_DIR, exist_ok=True)
     return os.path.join(CONFIG_DIR, f"{guild_id}.json")
 
 def load_config(guild_id: int) -> dict:
-    path = get_config_path(guild_id)
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+    return CONFIG_CACHE.load(str(guild_id))
+
+def config_version(guild_id: int):
+    """設定的後端版本，給條件式 GET 判斷設定有沒有變；還沒有設定時回傳 None。"""
+    key = str(guild_id)
+    generation = CONFIG_WRITER.pending_generation(key)
+    if generation is not None:
+        # 存檔還在排隊，後端是舊的
+        return "pending", generation
+    return get_backend().version(key)
+
+def save_config(guild_id: int, config: dict, source: str = "config"):
+    """整份覆寫；只想改幾個欄位時請用 update_config，才不會蓋掉別人同時做的修改。"""
+    _write(str(guild_id), config, source)
+
+def update_config(guild_id: int, changes: Optional[dict] = None, remove: Iterable[str] = (),
+                  source: str = "config") -> dict:
+    """在伺服器的鎖內讀取最新設定，只改 changes 裡的 key、刪除 remove 裡的 key，其他欄位保持原樣；回傳更新後的設定。"""
+    key = str(guild_id)
+    with _key_lock(key):
+        config = CONFIG_CACHE.load(key)
+        updated = dict(config)
+        updated.update(changes or {})
+        for name in remove:
+            updated.pop(name, None)
+        if updated != config:
+            CONFIG_CACHE.store(key, updated)
+            CONFIG_WRITER.submit(key, updated)
+            _publish(key, config, updated, source)
+    return copy.deepcopy(updated)
 
-def save_config(guild_id: int, config: dict):
-    path = get_config_path(guild_id)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
+def invalidate_config(guild_id: int):
+    CONFIG_CACHE.invalidate(str(guild_id))
+
+def find_guilds(field: str, value=None) -> List[int]:
+    """設定了 field (value 不是 None 時需等於 value) 的伺服器 ID；sqlite 後端對 INDEXED_FIELDS 走索引。"""
+    keys = set(get_backend().find(field, value))
+    # 排隊中的存檔以新內容為準
+    for key, data in CONFIG_WRITER.pending_items().items():
+        found = _index_value(data.get(field))
+        if found is not None and (value is None or found == str(value)):
+            keys.add(key)
+        else:
+            keys.discard(key)
+    return sorted(int(key) for key in keys if key.isdigit())
 
 def load_support_config() -> dict:
-    os.makedirs(CONFIG_DIR, exist_ok=True)
-    path = os.path.join(CONFIG_DIR, SUPPORT_CONFIG_FILE)
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+    return CONFIG_CACHE.load(SUPPORT_CONFIG_KEY)
 
-def save_support_config(config: dict):
-    os.makedirs(CONFIG_DIR, exist_ok=True)
-    path = os.path.join(CONFIG_DIR, SUPPORT_CONFIG_FILE)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
+def save_support_config(config: dict, source: str = "config"):
+    _write(SUPPORT_CONFIG_KEY, config, source)
+
+def update_support_config(entries: Dict[int, Optional[list]], replace: bool = False, source: str = "config") -> dict:
+    """
+    更新客服轉發設定：entries 是 {伺服器 ID: [頻道 ID, 身分組 ID] 或 None (刪除)}；
+    replace=True 時整份換成 entries (從備份還原)。只有真的變動的伺服器會發出事件。
+    """
+    with _key_lock(SUPPORT_CONFIG_KEY):
+        config = CONFIG_CACHE.load(SUPPORT_CONFIG_KEY)
+        updated = {} if replace else dict(config)
+        for gid, entry in entries.items():
+            if entry:
+                updated[str(gid)] = list(entry)
+            else:
+                updated.pop(str(gid), None)
+        if updated != config:
+            CONFIG_CACHE.store(SUPPORT_CONFIG_KEY, updated)
+            CONFIG_WRITER.submit(SUPPORT_CONFIG_KEY, updated)
+            _publish(SUPPORT_CONFIG_KEY, config, updated, source)
+    return copy.deepcopy(updated)
+
+
+# ---------- async API (在事件循環上使用) ----------
+async def _run_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(CONFIG_EXECUTOR, func, *args)
+
+async def aload_config(guild_id: int) -> dict:
+    cached = CONFIG_CACHE.peek(str(guild_id))
+    if cached is not None:
+        return cached
+    return await _run_io(load_config, guild_id)
+
+async def asave_config(guild_id: int, config: dict, source: str = "config"):
+    async with _async_key_lock(str(guild_id)):
+        await _run_io(save_config, guild_id, config, source)
+
+async def aupdate_support_config(entries: Dict[int, Optional[list]], replace: bool = False,
+                                 source: str = "config") -> dict:
+    async with _async_key_lock(SUPPORT_CONFIG_KEY):
+        return await _run_io(update_support_config, dict(entries), replace, source)
+
+async def aupdate_config(guild_id: int, changes: Optional[dict] = None, remove: Iterable[str] = (),
+                         durable: bool = False, source: str = "config") -> dict:
+    """
+    update_config 的 async 版本；同一個伺服器的更新依序執行 (排隊時不佔用執行緒池)。
+    durable=True 時等設定寫進後端才返回 (其他行程馬上要讀取時使用)；逾時沒寫完會丟 TimeoutError
+    (設定仍留在背景寫入佇列，之後會重試，但呼叫端不能假設其他行程已經讀得到)。
+    """
+    async with _async_key_lock(str(guild_id)):
+        config = await _run_io(update_config, guild_id, changes, tuple(remove), source)
+        if durable and not await _run_io(flush_configs):
+            raise TimeoutError(f"伺服器 {guild_id} 的設定還沒寫入儲存後端")
+    return config
@@ -0,0 +1,185 @@
+# 檔案名稱：utils/guild_cache.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import discord
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("GuildCache")
+
+# 儀表板用的伺服器快照快取：
+# 模板只需要伺服器名稱、圖示、文字頻道與身分組，不需要整個 discord.Guild。
+# 快照有 TTL，並由 Gateway 的頻道 / 身分組 / 伺服器更新事件主動失效；
+# bot.get_guild 找不到時才走 REST (fetch_guild + fetch_channels)，同一個伺服器同時間只會打一次 API。
+# 所有操作都在 Discord 事件循環上執行，不需要鎖。快照可以用 to_dict / from_dict 轉成 JSON 傳給網頁 worker 行程。
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "dashboard_guild_cache_requests_total", "伺服器快照快取的查詢次數 (hit / miss / expired)", ("result",))
+CACHE_INVALIDATIONS = REGISTRY.counter(
+    "dashboard_guild_cache_invalidations_total", "伺服器快照因 Gateway 事件失效的次數", ("event",))
+CACHE_SIZE = REGISTRY.gauge(
+    "dashboard_guild_cache_size", "目前快取中的伺服器快照數")
+
+
+class IconSnapshot(NamedTuple):
+    url: str
+
+
+class ChannelSnapshot(NamedTuple):
+    id: int
+    name: str
+    type: discord.ChannelType
+    position: int
+
+
+class RoleSnapshot(NamedTuple):
+    id: int
+    name: str
+    color: int
+    position: int
+    managed: bool
+
+
+class GuildSnapshot(NamedTuple):
+    id: int
+    name: str
+    icon: Optional[IconSnapshot]
+    owner_id: Optional[int]
+    member_count: Optional[int]
+    text_channels: Tuple[ChannelSnapshot, ...]
+    roles: Tuple[RoleSnapshot, ...]
+    created: float
+
+    @classmethod
+    def from_guild(cls, guild: discord.Guild, channels=None) -> "GuildSnapshot":
+        if channels is None:
+            channels = guild.text_channels
+        text_channels = sorted(
+            (c for c in channels if isinstance(c, discord.TextChannel)),
+            key=lambda c: (c.position, c.id),
+        )
+        return cls(
+            id=guild.id,
+            name=guild.name,
+            icon=IconSnapshot(guild.icon.url) if guild.icon else None,
+            owner_id=guild.owner_id,
+            member_count=guild.member_count or guild.approximate_member_count,
+            text_channels=tuple(ChannelSnapshot(c.id, c.name, c.type, c.position) for c in text_channels),
+            roles=tuple(
+                RoleSnapshot(r.id, r.name, r.color.value, r.position, r.managed)
+                for r in sorted(guild.roles, key=lambda r: -r.position)
+            ),
+            created=time.monotonic(),
+        )
+
+    def to_dict(self) -> dict:
+        data = self._asdict()
+        data["icon"] = self.icon.url if self.icon else None
+        data["text_channels"] = [(c.id, c.name, c.type.value, c.position) for c in self.text_channels]
+        data["roles"] = [tuple(r) for r in self.roles]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GuildSnapshot":
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            icon=IconSnapshot(data["icon"]) if data["icon"] else None,
+            owner_id=data["owner_id"],
+            member_count=data["member_count"],
+            text_channels=tuple(
+                ChannelSnapshot(i, n, discord.ChannelType(t), p) for i, n, t, p in data["text_channels"]),
+            roles=tuple(RoleSnapshot(*r) for r in data["roles"]),
+            created=data["created"],
+        )
+
+
+class GuildSnapshotCache:
+    def __init__(self, bot: discord.Client, ttl: float = 300.0, max_size: int = 1000, fetch_timeout: float = 5.0):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_size = max_size
+        self.fetch_timeout = fetch_timeout
+        self._entries: "OrderedDict[int, GuildSnapshot]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        REGISTRY.add_collector(lambda: CACHE_SIZE.set(value=len(self._entries)))
+
+    async def get(self, guild_id: int) -> Optional[GuildSnapshot]:
+        """取得伺服器快照；找不到伺服器 (或 API 失敗 / 超時) 回傳 None。"""
+        snapshot = self._entries.get(guild_id)
+        if snapshot is not None:
+            if time.monotonic() - snapshot.created < self.ttl:
+                CACHE_REQUESTS.inc("hit")
+                self._entries.move_to_end(guild_id)
+                return snapshot
+            CACHE_REQUESTS.inc("expired")
+            del self._entries[guild_id]
+        else:
+            CACHE_REQUESTS.inc("miss")
+
+        # 同一個伺服器的並行請求共用同一次建立
+        pending = self._inflight.get(guild_id)
+        if pending is None:
+            pending = self._inflight[guild_id] = asyncio.ensure_future(self._build(guild_id))
+            pending.add_done_callback(lambda _: self._inflight.pop(guild_id, None))
+        return await asyncio.shield(pending)
+
+    async def _build(self, guild_id: int) -> Optional[GuildSnapshot]:
+        guild = self.bot.get_guild(guild_id)
+        try:
+            if guild is not None:
+                snapshot = GuildSnapshot.from_guild(guild)
+            else:
+                snapshot = await asyncio.wait_for(self._fetch(guild_id), timeout=self.fetch_timeout)
+        except Exception as e:
+            logger.warning(f"建立伺服器 {guild_id} 快照失敗: {type(e).__name__}: {e}")
+            return None
+        self._store(snapshot)
+        return snapshot
+
+    async def _fetch(self, guild_id: int) -> GuildSnapshot:
+        # fetch_guild 不含頻道，要另外抓一次
+        guild = await self.bot.fetch_guild(guild_id, with_counts=True)
+        channels = await guild.fetch_channels()
+        return GuildSnapshot.from_guild(guild, channels)
+
+    def _store(self, snapshot: GuildSnapshot):
+        self._entries[snapshot.id] = snapshot
+        self._entries.move_to_end(snapshot.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def version(self, guild_id: int) -> Optional[float]:
+        """快取中 (未過期) 快照的建立時間，當作條件式 GET 的版本；沒有快取回傳 None。"""
+        snapshot = self._entries.get(guild_id)
+        if snapshot is None or time.monotonic() - snapshot.created >= self.ttl:
+            return None
+        return snapshot.created
+
+    def invalidate(self, guild_id: int, event: str = "manual"):
+        if self._entries.pop(guild_id, None) is not None:
+            CACHE_INVALIDATIONS.inc(event)
+
+    def install(self):
+        """向 bot 註冊 Gateway 事件監聽，頻道 / 身分組 / 伺服器資料變動時讓快照失效。"""
+
+        def by_guild_attr(event: str):
+            async def listener(obj, *_):
+                self.invalidate(obj.guild.id, event)
+            return listener
+
+        def by_guild(event: str):
+            async def listener(guild, *_):
+                self.invalidate(guild.id, event)
+            return listener
+
+        for event in ("on_guild_channel_create", "on_guild_channel_update", "on_guild_channel_delete",
+                      "on_guild_role_create", "on_guild_role_update", "on_guild_role_delete"):
+            self.bot.add_listener(by_guild_attr(event), event)
+        for event in ("on_guild_update", "on_guild_remove", "on_guild_join"):
+            self.bot.add_listener(by_guild(event), event)
+        return self
@@ -0,0 +1,190 @@
+# 檔案名稱：utils/interaction_guard.py
+import asyncio
+import functools
+import logging
+
+import discord
+from discord import app_commands
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("InteractionGuard")
+
+# 互動回應期限保護：Discord 要求 3 秒內回應斜線指令，否則互動直接失效。
+# 在 bot.tree 的 interaction_check 為每個指令排一個計時器，快到期還沒回應就自動 defer，
+# 之後處理函式呼叫的 response.send_message 會自動改走 followup，處理函式不需要任何修改。
+# defer 是公開還是只有自己看得到由每個指令決定 (@auto_defer(ephemeral=...)，存在 command.extras)，
+# 沒有標記的指令使用 default (預設不保護)。公開 defer 後才送出的私人回覆，會先刪掉公開的「思考中」訊息再另外送出，
+# 不會變成整個頻道都看得到。
+
+AUTO_DEFERS = REGISTRY.counter(
+    "bot_interaction_auto_defer_total", "期限保護代替處理函式自動 defer 的次數", ("command",))
+REDIRECTS = REGISTRY.counter(
+    "bot_interaction_redirect_total", "自動 defer 後把 response 呼叫改走 followup 的次數", ("command", "method"))
+
+AUTO_DEFER_EXTRA = "auto_defer"            # command.extras 的 key："public" / "ephemeral" / "off"
+
+_AUTO_DEFER = "_deadline_guard_defer"      # interaction.extras 裡存自動 defer 的 Task
+_DEFER_EPHEMERAL = "_deadline_guard_ephemeral"  # 自動 defer 是不是 ephemeral
+_RESPONDING = "_deadline_guard_responding"  # 處理函式已經開始回應 (請求還在路上)
+
+
+def auto_defer(ephemeral: bool = False, enabled: bool = True):
+    """
+    指令裝飾器 (放在 @app_commands.command 上面或下面都可以)：快到期還沒回應時自動 defer。
+    ephemeral 要跟指令主要回覆一致；enabled=False 則這個指令完全不自動 defer。
+    """
+    mode = ("ephemeral" if ephemeral else "public") if enabled else "off"
+
+    def decorator(command):
+        if isinstance(command, app_commands.Command):
+            command.extras[AUTO_DEFER_EXTRA] = mode
+        else:
+            command.__auto_defer__ = mode
+        return command
+
+    return decorator
+
+
+def _command_mode(interaction: discord.Interaction, default: str) -> str:
+    command = interaction.command
+    if command is None:
+        return default
+    mode = command.extras.get(AUTO_DEFER_EXTRA)
+    if mode is None:
+        mode = getattr(getattr(command, "callback", None), "__auto_defer__", None)
+    return mode or default
+
+
+def _command_name(interaction: discord.Interaction) -> str:
+    command = interaction.command
+    return f"/{command.qualified_name}" if command else "unknown"
+
+
+async def _wait_auto_defer(interaction: discord.Interaction) -> bool:
+    """如果這個互動被自動 defer 過，等它完成並回傳 True。"""
+    task = interaction.extras.get(_AUTO_DEFER)
+    if task is None:
+        return False
+    try:
+        await asyncio.shield(task)
+    except Exception:
+        pass
+    return True
+
+
+def _guard(cls, name: str, redirect):
+    """包裝 InteractionResponse 的方法：先標記「正在回應」，被自動 defer 過的互動改由 redirect 處理。"""
+    original = getattr(cls, name)
+    if getattr(original, "__deadline_guarded__", False):
+        return original
+
+    @functools.wraps(original)
+    async def guarded(self, *args, **kwargs):
+        interaction = self._parent
+        if await _wait_auto_defer(interaction):
+            if redirect is not None:
+                REDIRECTS.inc(_command_name(interaction), name)
+                return await redirect(interaction, *args, **kwargs)
+        else:
+            interaction.extras[_RESPONDING] = True
+        return await original(self, *args, **kwargs)
+
+    guarded.__deadline_guarded__ = True
+    guarded.__wrapped__ = original
+    setattr(cls, name, guarded)
+    return original
+
+
+async def prepare_private_followup(interaction: discord.Interaction):
+    """
+    準備送出 ephemeral followup 前呼叫：如果互動被公開自動 defer 過、原始回應還是「思考中」，先把它刪掉；
+    否則第一個 followup 會直接取代那則公開訊息，ephemeral 不會生效。
+    """
+    if _AUTO_DEFER not in interaction.extras or interaction.extras.get(_DEFER_EPHEMERAL):
+        return
+    await _wait_auto_defer(interaction)
+    try:
+        original = await interaction.original_response()
+        if original.flags.loading:
+            await original.delete()
+    except discord.HTTPException as e:
+        logger.warning(f"刪除 {_command_name(interaction)} 的公開 defer 訊息失敗: {e}")
+
+
+async def _redirect_send_message(interaction: discord.Interaction, *args, **kwargs):
+    # followup 不支援 delete_after
+    delete_after = kwargs.pop("delete_after", None)
+    if kwargs.get("ephemeral"):
+        await prepare_private_followup(interaction)
+    kwargs["wait"] = True
+    message = await interaction.followup.send(*args, **kwargs)
+    if delete_after is not None:
+        await message.delete(delay=delete_after)
+    return message
+
+
+async def _redirect_defer(interaction: discord.Interaction, *args, **kwargs):
+    # 已經代為 defer 過，再 defer 一次只會得到 InteractionResponded
+    return None
+
+
+class InteractionDeadlineGuard:
+    def __init__(self, deadline: float = 3.0, margin: float = 0.6, default: str = "off"):
+        """default：沒有 @auto_defer 標記的指令要用的模式 ("public" / "ephemeral" / "off")。"""
+        if default not in ("public", "ephemeral", "off"):
+            raise ValueError(f"未知的自動 defer 模式: {default!r}")
+        self.deadline = deadline
+        self.margin = margin
+        self.default = default
+        self._raw_defer = None
+        self._installed = False
+
+    def install(self, tree: app_commands.CommandTree):
+        if self._installed:
+            return self
+        self._installed = True
+
+        cls = discord.InteractionResponse
+        self._raw_defer = _guard(cls, "defer", _redirect_defer)
+        _guard(cls, "send_message", _redirect_send_message)
+        _guard(cls, "send_modal", None)
+        _guard(cls, "edit_message", None)
+
+        previous_check = tree.interaction_check
+
+        async def interaction_check(interaction: discord.Interaction) -> bool:
+            if not await previous_check(interaction):
+                return False
+            self.arm(interaction)
+            return True
+
+        tree.interaction_check = interaction_check
+        return self
+
+    def arm(self, interaction: discord.Interaction):
+        """依互動建立時間排定自動 defer；指令 Task 結束時自動取消。"""
+        if interaction.type is not discord.InteractionType.application_command:
+            return
+        mode = _command_mode(interaction, self.default)
+        if mode == "off":
+            return
+        age = max(0.0, (discord.utils.utcnow() - interaction.created_at).total_seconds())
+        delay = max(0.0, self.deadline - self.margin - age)
+        handle = asyncio.get_running_loop().call_later(delay, self._fire, interaction, mode == "ephemeral")
+        task = asyncio.current_task()
+        if task is not None:
+            task.add_done_callback(lambda _: handle.cancel())
+
+    def _fire(self, interaction: discord.Interaction, ephemeral: bool):
+        if interaction.response.is_done() or interaction.extras.get(_RESPONDING):
+            return
+        AUTO_DEFERS.inc(_command_name(interaction))
+        interaction.extras[_DEFER_EPHEMERAL] = ephemeral
+        interaction.extras[_AUTO_DEFER] = asyncio.ensure_future(self._defer(interaction, ephemeral))
+
+    async def _defer(self, interaction: discord.Interaction, ephemeral: bool):
+        try:
+            await self._raw_defer(interaction.response, thinking=True, ephemeral=ephemeral)
+        except discord.HTTPException as e:
+            logger.warning(f"自動 defer {_command_name(interaction)} 失敗: {e}")
@@ -0,0 +1,350 @@
+# 檔案名稱：utils/ipc.py
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import struct
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.async_web import run_in_loop
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("IPC")
+
+# 機器人行程與網頁 worker 行程之間的本機 IPC：
+# - 傳輸：Unix socket ("unix:/tmp/bot.sock") 或本機 TCP ("127.0.0.1:8765")，每個訊框 = 4 bytes 長度 + JSON
+#   TCP 預設只接受 loopback 位址 (allow_remote=True 才能綁定 / 連線到其他主機)
+# - 連線建立後第一個訊框是共用密鑰驗證，之後每個請求 {"method", "params"} 對應一個回應 {"result"} 或 {"error"}
+# - 伺服器端跑在 Discord 事件循環上，handler 就是一般的 async 函式，可以直接使用 bot 與各種快取
+# - 用戶端有連線池與逾時，一條連線同時只處理一個請求；出錯或逾時的連線直接丟掉不放回池子
+# BotBridge 是儀表板路由的統一入口：同一個行程時直接呼叫 handler，gunicorn worker 行程則透過 IPCClient。
+
+IPC_CALLS = REGISTRY.counter(
+    "bot_ipc_calls_total", "IPC 呼叫次數 (依方法與結果)", ("method", "result"))
+IPC_LATENCY = REGISTRY.histogram(
+    "bot_ipc_call_duration_seconds", "IPC 呼叫耗時 (用戶端量測，含排隊與傳輸)", ("method",))
+
+_HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+
+
+class IPCError(Exception):
+    """IPC 呼叫失敗：連不上機器人行程、逾時，或 handler 在機器人行程中丟出例外。"""
+
+    def __init__(self, message: str, kind: str = "IPCError"):
+        super().__init__(message)
+        self.kind = kind
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_address(address: str, allow_remote: bool = False) -> Tuple[str, object]:
+    """"unix:/path" -> ("unix", path)；"host:port" 或 "tcp:host:port" -> ("tcp", (host, port))。
+
+    allow_remote=False 時 TCP 主機必須是 loopback，否則丟 ValueError。
+    """
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    if address.startswith("tcp:"):
+        address = address[4:]
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"IPC 位址格式錯誤: {address!r}")
+    host = host or "127.0.0.1"
+    if not allow_remote and not _is_loopback(host):
+        raise ValueError(f"IPC 只允許本機位址 (127.0.0.1 / ::1 / unix:)，收到 {host!r}；確定要跨主機請明確允許")
+    return "tcp", (host.strip("[]"), int(port))
+
+
+async def _write_frame(writer: asyncio.StreamWriter, payload):
+    data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    writer.write(_HEADER.pack(len(data)) + data)
+    await writer.drain()
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if length > MAX_FRAME:
+        raise IPCError(f"IPC 訊框過大 ({length} bytes)")
+    return json.loads(await reader.readexactly(length))
+
+
+class IPCServer:
+    def __init__(self, address: Optional[str], token: str, allow_remote: bool = False):
+        # address 為空時只當 handler 註冊表使用 (單一行程模式)，start() 不會開 socket
+        self.kind, self.target = parse_address(address, allow_remote) if address else (None, None)
+        self.token = token
+        self.handlers: Dict[str, Callable[..., Awaitable]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def handler(self, name: Optional[str] = None):
+        """註冊 handler：@IPC.handler() async def guild_snapshot(guild_id): ...；回傳值必須能轉成 JSON。"""
+        def decorator(func):
+            self.handlers[name or func.__name__] = func
+            return func
+        return decorator
+
+    async def dispatch(self, method: str, params: dict):
+        func = self.handlers.get(method)
+        if func is None:
+            raise IPCError(f"未知的 IPC 方法: {method}")
+        return await func(**params)
+
+    async def start(self):
+        if self._server is not None or self.kind is None:
+            return self
+        if self.kind == "unix":
+            if os.path.exists(self.target):
+                os.unlink(self.target)   # 上次沒有正常關閉留下的 socket 檔
+            self._server = await asyncio.start_unix_server(self._serve, path=self.target)
+            os.chmod(self.target, 0o600)
+        else:
+            host, port = self.target
+            self._server = await asyncio.start_server(self._serve, host, port)
+        logger.info(f"🔌 IPC 伺服器已啟動：{self.kind} {self.target}")
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if self.kind == "unix" and os.path.exists(self.target):
+                os.unlink(self.target)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            hello = await asyncio.wait_for(_read_frame(reader), timeout=5)
+            if not isinstance(hello, dict) or not hmac.compare_digest(str(hello.get("auth", "")), self.token):
+                logger.warning("IPC 連線驗證失敗，已中斷")
+                return
+            await _write_frame(writer, {"ok": True})
+            while True:
+                request = await _read_frame(reader)
+                try:
+                    result = await self.dispatch(request["method"], request.get("params") or {})
+                    response = {"result": result}
+                except Exception as e:
+                    if not isinstance(e, IPCError):
+                        logger.exception(f"IPC 方法 {request.get('method')} 執行失敗")
+                    response = {"error": {"type": getattr(e, "kind", type(e).__name__), "message": str(e)}}
+                await _write_frame(writer, response)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            logger.warning(f"IPC 連線異常中斷: {type(e).__name__}: {e}")
+        finally:
+            writer.close()
+
+
+class IPCClient:
+    def __init__(self, address: str, token: str, pool_size: int = 8, timeout: float = 10.0,
+                 connect_timeout: float = 3.0, allow_remote: bool = False):
+        self.kind, self.target = parse_address(address, allow_remote)
+        self.token = token
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _connect(self):
+        if self.kind == "unix":
+            opening = asyncio.open_unix_connection(self.target)
+        else:
+            opening = asyncio.open_connection(*self.target)
+        reader, writer = await asyncio.wait_for(opening, timeout=self.connect_timeout)
+        await _write_frame(writer, {"auth": self.token})
+        reply = await asyncio.wait_for(_read_frame(reader), timeout=self.connect_timeout)
+        if not reply.get("ok"):
+            writer.close()
+            raise IPCError("IPC 驗證失敗")
+        return reader, writer
+
+    def _bind_loop(self):
+        # 連線與 Semaphore 都綁定事件循環；換了事件循環 (例如 fork 之後) 就整個重來
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._loop = loop
+
+    async def _roundtrip(self, conn, method: str, params: dict, timeout: float):
+        reader, writer = conn
+        await _write_frame(writer, {"method": method, "params": params})
+        return await asyncio.wait_for(_read_frame(reader), timeout=timeout)
+
+    async def call(self, method: str, timeout: Optional[float] = None, **params):
+        self._bind_loop()
+        started = self._loop.time()
+        result = "error"
+        try:
+            async with self._slots:
+                conn = self._idle.pop() if self._idle else None
+                try:
+                    try:
+                        if conn is None:
+                            conn = await self._connect()
+                        response = await self._roundtrip(conn, method, params, timeout or self.timeout)
+                    except (OSError, asyncio.IncompleteReadError):
+                        # 池子裡的舊連線可能已經被對方關掉 (例如機器人行程重啟)，換一條新連線重試一次
+                        if conn is None:
+                            raise
+                        conn[1].close()
+                        conn = None
+                        conn = await self._connect()
+                        response = await self._roundtrip(conn, method, params, timeout or self.timeout)
+                except asyncio.TimeoutError:
+                    result = "timeout"
+                    if conn is not None:
+                        conn[1].close()
+                    raise IPCError(f"IPC 呼叫 {method} 逾時", "Timeout") from None
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    if conn is not None:
+                        conn[1].close()
+                    raise IPCError(f"無法連線到機器人行程: {type(e).__name__}: {e}", "Unavailable") from None
+                except BaseException:
+                    if conn is not None:
+                        conn[1].close()
+                    raise
+                # handler 丟出的例外也是完整的回應，連線仍然可以重用
+                self._idle.append(conn)
+            if "error" in response:
+                error = response["error"]
+                raise IPCError(error.get("message", ""), error.get("type", "IPCError"))
+            result = "ok"
+            return response.get("result")
+        finally:
+            IPC_CALLS.inc(method, result)
+            IPC_LATENCY.observe(self._loop.time() - started, method)
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class BackgroundLoop:
+    """網頁 worker 行程用的事件循環執行緒 (沒有 Discord 事件循環時，async 路由與 IPC 連線池都跑在這裡)。"""
+
+    def __init__(self, name: str = "web-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> asyncio.AbstractEventLoop:
+        # gunicorn 會在 import 之後 fork，執行緒不會跟過去，所以用 pid 判斷要不要在這個行程重新啟動
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                self._loop, self._pid = loop, os.getpid()
+            return self._loop
+
+
+class BotBridge:
+    """儀表板呼叫機器人的入口：client 為 None 時直接呼叫本行程的 handler，否則透過 IPC。"""
+
+    def __init__(self, server: IPCServer, client: Optional[IPCClient] = None,
+                 local_loop: Callable[[], Optional[asyncio.AbstractEventLoop]] = lambda: None):
+        self.server = server
+        self.client = client
+        self.local_loop = local_loop
+        self.background = BackgroundLoop() if client is not None else None
+
+    @property
+    def remote(self) -> bool:
+        return self.client is not None
+
+    def available(self) -> bool:
+        """worker 行程一律視為可用 (連不上時呼叫會丟 IPCError)；單一行程要等 Discord 事件循環啟動。"""
+        return self.remote or self.loop() is not None
+
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """async 路由與 handler 要跑的事件循環：本行程的 Discord 事件循環，或 worker 的背景事件循環。"""
+        if self.background is not None:
+            return self.background.get()
+        loop = self.local_loop()
+        return loop if loop is not None and loop.is_running() else None
+
+    async def call(self, method: str, timeout: Optional[float] = None, **params):
+        if self.client is not None:
+            return await self.client.call(method, timeout=timeout, **params)
+        return await self.server.dispatch(method, params)
+
+    def call_sync(self, method: str, timeout: Optional[float] = None, **params):
+        """給同步路由用：丟到對應的事件循環執行並等待結果 (不能在該事件循環上呼叫)。"""
+        loop = self.loop()
+        if loop is None:
+            raise IPCError("Discord 機器人事件循環尚未啟動", "Unavailable")
+        wait = (timeout or (self.client.timeout if self.client else 30.0)) + 1
+        return run_in_loop(loop, self.call(method, timeout=timeout, **params), wait)
+
+
+class RemoteLogSource:
+    """CommandLogBuffer / LogLineBuffer 的 IPC 替身，提供 SSE 與 /logs/data 需要的 since / page / wait_for / 序號。
+
+    *_async 版本給事件循環上的 SSE 串流使用 (不能在事件循環上呼叫 call_sync)。
+    """
+
+    def __init__(self, bridge: BotBridge, source: str):
+        self.bridge = bridge
+        self.source = source
+
+    def since(self, seq: int = 0, **filters) -> List[dict]:
+        return self.page(seq, **filters)[0]
+
+    def page(self, seq: int = 0, **filters) -> Tuple[List[dict], int]:
+        entries, cursor = self.bridge.call_sync("log_page", source=self.source, seq=seq, **filters)
+        return entries, cursor
+
+    def wait_for(self, seq: int, timeout: float) -> bool:
+        return self.bridge.call_sync("log_wait", timeout=timeout + 5, source=self.source, seq=seq, wait=timeout)
+
+    async def page_async(self, seq: int = 0, **filters) -> Tuple[List[dict], int]:
+        entries, cursor = await self.bridge.call("log_page", source=self.source, seq=seq, **filters)
+        return entries, cursor
+
+    async def wait_async(self, seq: int, timeout: float) -> bool:
+        return await self.bridge.call("log_wait", timeout=timeout + 5, source=self.source, seq=seq, wait=timeout)
+
+    async def last_seq_async(self) -> int:
+        return (await self.bridge.call("log_seq", source=self.source))["last_seq"]
+
+    @property
+    def last_seq(self) -> int:
+        return self.bridge.call_sync("log_seq", source=self.source)["last_seq"]
+
+    def version(self) -> tuple:
+        """(機器人行程的 boot_id, last_seq)：機器人重啟後序號從 0 開始，要連同 boot_id 才能當 ETag。"""
+        info = self.bridge.call_sync("log_seq", source=self.source)
+        return info.get("boot_id"), info["last_seq"]
+
+    @property
+    def first_seq(self) -> int:
+        return self.bridge.call_sync("log_seq", source=self.source)["first_seq"]
+
+
+class RemoteAuditStore:
+    """CommandAuditStore.query 的 IPC 替身。"""
+
+    def __init__(self, bridge: BotBridge):
+        self.bridge = bridge
+
+    def query(self, **filters) -> List[dict]:
+        return self.bridge.call_sync("audit_query", **filters)
+
+    @property
+    def last_id(self) -> int:
+        return self.bridge.call_sync("audit_last_id")
@@ -0,0 +1,205 @@
+# 檔案名稱：utils/log_pipeline.py
+import atexit
+import gzip
+import io
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from typing import Iterable, List, Optional
+
+# 非阻塞日誌管線：任何執行緒 / 協程只負責把紀錄丟進佇列，
+# 真正的磁碟寫入、輪替與壓縮都在背景執行緒完成，硬碟再慢也不會卡住事件循環的心跳。
+
+LOG_FORMAT = '%(asctime)s:%(levelname)s:%(name)s: %(message)s'
+
+
+def _gzip_rotator(source: str, dest: str):
+    """輪替時把舊的日誌段壓縮成 .gz。"""
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """依大小或時間輪替，舊檔以 gzip 壓縮 (bot.log.1.gz, bot.log.2.gz...)。
+
+    emit 不會每筆 flush，由 BatchingQueueListener 在每批寫完後統一 flush。
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 7,
+                 interval: float = 86400, encoding: str = "utf-8"):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record) -> bool:
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchingQueueListener(threading.Thread):
+    """背景寫入執行緒：一次取出佇列中累積的紀錄 (最多 batch_size 筆) 寫完後才 flush。"""
+
+    _SENTINEL = None
+
+    def __init__(self, log_queue: "queue.SimpleQueue", handlers: Iterable[logging.Handler], batch_size: int = 256):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.handlers: List[logging.Handler] = list(handlers)
+        self.batch_size = batch_size
+        self._stopped = False
+
+    def _handle(self, record: logging.LogRecord):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _flush(self):
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                if item is self._SENTINEL:
+                    self._flush()
+                    return
+                self._handle(item)
+            self._flush()
+
+    def stop(self, timeout: float = 5.0):
+        """送出結束訊號並等待剩下的紀錄寫完。"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.queue.put(self._SENTINEL)
+        self.join(timeout)
+        for handler in self.handlers:
+            try:
+                handler.close()
+            except Exception:
+                pass
+
+
+class StreamToLogger(io.TextIOBase):
+    """把 print 的輸出轉成 logging 紀錄，讓既有的 print 診斷訊息也走非阻塞管線。
+
+    文字寫入才轉成紀錄；fileno / buffer / encoding 沿用原本的 stream，
+    子行程、faulthandler 或直接寫位元組的程式碼仍然拿得到真正的輸出目的地。
+    """
+
+    def __init__(self, logger: logging.Logger, level: int = logging.INFO, stream: Optional[io.TextIOBase] = None):
+        self.logger = logger
+        self.level = level
+        self.stream = stream
+        self._local = threading.local()
+
+    def writable(self) -> bool:
+        return True
+
+    @property
+    def encoding(self) -> str:
+        return getattr(self.stream, "encoding", None) or "utf-8"
+
+    @property
+    def errors(self) -> Optional[str]:
+        return getattr(self.stream, "errors", None)
+
+    @property
+    def buffer(self):
+        if self.stream is None or not hasattr(self.stream, "buffer"):
+            raise AttributeError("buffer")
+        return self.stream.buffer
+
+    def fileno(self) -> int:
+        if self.stream is None:
+            raise io.UnsupportedOperation("fileno")
+        return self.stream.fileno()
+
+    def write(self, text: str) -> int:
+        buf = getattr(self._local, "buf", "") + text
+        *lines, rest = buf.split("\n")
+        self._local.buf = rest
+        for line in lines:
+            if line.strip():
+                self.logger.log(self.level, line)
+        return len(text)
+
+    def flush(self):
+        rest = getattr(self._local, "buf", "")
+        if rest.strip():
+            self._local.buf = ""
+            self.logger.log(self.level, rest)
+        if self.stream is not None:
+            # 直接寫進 buffer 的位元組
+            self.stream.flush()
+
+
+def setup_logging(log_path: str = "bot.log", level: int = logging.INFO,
+                  extra_handlers: Optional[Iterable[logging.Handler]] = None,
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 7,
+                  interval: float = 86400, capture_print: bool = True) -> BatchingQueueListener:
+    """設定全域日誌：root logger 只掛 QueueHandler，檔案 / 終端機輸出交給背景執行緒。"""
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    file_handler = CompressingRotatingFileHandler(log_path, max_bytes=max_bytes,
+                                                  backup_count=backup_count, interval=interval)
+    file_handler.setFormatter(formatter)
+    # 直接寫到原始的 stderr，避免被下面的 print 轉向又繞回 logging
+    console_handler = logging.StreamHandler(sys.__stderr__)
+    console_handler.setFormatter(formatter)
+
+    handlers: List[logging.Handler] = [file_handler, console_handler]
+    for handler in extra_handlers or ():
+        if handler.formatter is None:
+            handler.setFormatter(formatter)
+        handlers.append(handler)
+
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = BatchingQueueListener(log_queue, handlers)
+    listener.start()
+    atexit.register(listener.stop)
+
+    if capture_print:
+        sys.stdout = StreamToLogger(logging.getLogger("stdout"), logging.INFO, stream=sys.stdout)
+
+    return listener
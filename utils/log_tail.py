@@ -0,0 +1,105 @@
+# 檔案名稱：utils/log_tail.py
+import os
+import zlib
+from typing import NamedTuple, Optional, Tuple
+
+# 從檔案尾端往回讀的日誌讀取器：成本只跟要讀的行數 / 新增的位元組有關，跟檔案大小無關
+# 往回讀最多 (行數 + 1) 個區塊，遇到超長的行只回傳它的結尾 (前面加上 …)，不會一路讀回檔案開頭。
+# 續讀的游標除了 offset 與 inode，還帶 mtime 與 offset 前一小段內容的 CRC32：
+# 同一個 inode 被截斷後又寫超過 offset 時大小與 mtime 看起來跟正常追加一樣，只能靠內容比對發現。
+
+CHECK_BYTES = 64
+TRUNCATED_MARK = "…".encode("utf-8")
+
+
+class TailChunk(NamedTuple):
+    text: str          # 這次讀到的內容 (只包含完整的行)
+    offset: int        # 下次續讀用的位元組位置
+    inode: int         # 檔案識別碼，用來偵測日誌輪替
+    reset: bool        # True 代表檔案被輪替 / 截斷，或落後太多，客戶端應該清空畫面重來
+    mtime: int         # 讀取時檔案的 st_mtime_ns
+    check: int         # offset 前面最多 CHECK_BYTES 個位元組的 CRC32
+
+
+def _file_identity(st: os.stat_result) -> int:
+    # Windows 上 st_ino 可能是 0，這時只能靠大小判斷截斷
+    return st.st_ino or 0
+
+
+def _check_before(f, offset: int) -> int:
+    start = max(0, offset - CHECK_BYTES)
+    f.seek(start)
+    return zlib.crc32(f.read(offset - start))
+
+
+def _tail_bytes(f, end: int, n: int, block_size: int) -> Tuple[bytes, int]:
+    """從 end 往前以固定區塊讀取，直到湊滿 n 行或讀了 n + 1 個區塊為止；回傳 (完整的行, 結尾寫到一半的位元組數)。"""
+    if end <= 0:
+        return b"", 0
+    limit = (max(n, 0) + 1) * block_size
+    pos = end
+    chunks = []
+    newlines = 0
+    while pos > 0 and end - pos < limit and (newlines <= n or not chunks):
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        chunk = f.read(step)
+        chunks.append(chunk)
+        newlines += chunk.count(b"\n")
+    data = b"".join(reversed(chunks))
+    # 跟 read_since 一樣只到最後一個換行為止，寫到一半的行留給下一次續讀
+    cut = data.rfind(b"\n") + 1
+    partial = len(data) - cut
+    lines = data[:cut].split(b"\n")[:-1]
+    if n <= 0 or not lines:
+        return b"", partial
+    picked = lines[-n:]
+    if len(picked) == len(lines) and pos > 0:
+        # 掃描在行中間停下：第一行只讀到結尾
+        f.seek(pos - 1)
+        if f.read(1) != b"\n":
+            picked[0] = TRUNCATED_MARK + picked[0]
+    return b"\n".join(picked) + b"\n", partial
+
+
+def _tail_chunk(f, st: os.stat_result, lines: int, block_size: int) -> TailChunk:
+    end = st.st_size
+    data, partial = _tail_bytes(f, end, lines, block_size)
+    offset = end - partial
+    return TailChunk(data.decode("utf-8", errors="replace"), offset, _file_identity(st), True,
+                     st.st_mtime_ns, _check_before(f, offset))
+
+
+def tail(path: str, lines: int = 100, block_size: int = 8192) -> TailChunk:
+    """讀取檔案最後 lines 行 (不含還沒寫完的最後一行)。"""
+    with open(path, "rb") as f:
+        return _tail_chunk(f, os.fstat(f.fileno()), lines, block_size)
+
+
+def read_since(path: str, offset: int, inode: Optional[int] = None, lines: int = 100,
+               max_bytes: int = 256 * 1024, block_size: int = 8192,
+               mtime: Optional[int] = None, check: Optional[int] = None) -> TailChunk:
+    """只讀取 offset 之後新增的內容 (inode / mtime / check 是上次回傳的值)。
+
+    檔案被輪替 (inode 改變)、截斷 (大小小於 offset、mtime 倒退，或 offset 前的內容跟上次不同) 時
+    改為回傳最後 lines 行並標記 reset；新增內容超過 max_bytes 時只回傳最後 lines 行，避免單次請求讀入大量資料。
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        end = st.st_size
+        identity = _file_identity(st)
+        rotated = inode is not None and identity and inode != identity
+        if (rotated or offset < 0 or offset > end or end - offset > max_bytes
+                or (mtime is not None and st.st_mtime_ns < mtime)
+                or (check is not None and _check_before(f, offset) != check)):
+            return _tail_chunk(f, st, lines, block_size)
+
+        f.seek(offset)
+        data = f.read(end - offset)
+        # 只回傳到最後一個換行為止，寫到一半的行留給下一次
+        cut = data.rfind(b"\n") + 1
+        next_check = _check_before(f, offset + cut)
+
+    return TailChunk(data[:cut].decode("utf-8", errors="replace"), offset + cut, identity, False,
+                     st.st_mtime_ns, next_check)
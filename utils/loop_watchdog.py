@@ -0,0 +1,105 @@
+# 檔案名稱：utils/loop_watchdog.py
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from utils.metrics import REGISTRY
+from utils.command_metrics import task_label
+
+logger = logging.getLogger("LoopWatchdog")
+
+# 事件循環卡頓偵測：背景執行緒定期往事件循環丟一個回呼，量測它多久才被執行 (loop lag)。
+# 卡住超過門檻時，直接抓事件循環執行緒當下的堆疊，並標註正在執行的指令 / 事件名稱。
+
+LOOP_LAG = REGISTRY.histogram(
+    "bot_event_loop_lag_seconds", "事件循環延遲 (排程回呼到實際執行的時間)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_LAG_QUANTILES = REGISTRY.gauge(
+    "bot_event_loop_lag_quantile_seconds", "最近一段時間事件循環延遲的百分位數", ("quantile",))
+LOOP_STALLS = REGISTRY.counter(
+    "bot_event_loop_stalls_total", "事件循環延遲超過門檻的次數", ("activity",))
+
+
+def _current_activity(loop: asyncio.AbstractEventLoop) -> str:
+    """事件循環正在執行哪個 Task：指令由 command_metrics 標記，事件則用 discord.py 的 Task 名稱。"""
+    try:
+        task = asyncio.tasks._current_tasks.get(loop)
+    except AttributeError:
+        task = None
+    if task is None:
+        return "(非 Task 回呼)"
+    return task_label(task) or task.get_name()
+
+
+class LoopWatchdog:
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.25, threshold: float = 0.5,
+                 window: int = 2400):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self._samples = deque(maxlen=window)   # 預設約 10 分鐘的樣本，用來算百分位數
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        REGISTRY.add_collector(self._export_quantiles)
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self.loop.call_soon_threadsafe(self._capture_thread_id)
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _capture_thread_id(self):
+        self._loop_thread_id = threading.get_ident()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.loop.is_closed():
+                return
+            done = threading.Event()
+            scheduled = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(done.set)
+            except RuntimeError:
+                return
+
+            reported = False
+            # 等到回呼被執行；超過門檻就先把堆疊記下來，之後繼續等以取得完整的延遲
+            while not done.wait(self.threshold if not reported else 1.0):
+                if self._stop.is_set():
+                    return
+                if not reported:
+                    reported = True
+                    self._report_stall(time.perf_counter() - scheduled)
+            lag = time.perf_counter() - scheduled
+            self._samples.append(lag)
+            LOOP_LAG.observe(lag)
+            if reported:
+                logger.warning(f"⏱️ 事件循環恢復，本次卡頓共 {lag:.3f} 秒")
+
+    def _report_stall(self, lag: float):
+        activity = _current_activity(self.loop)
+        LOOP_STALLS.inc(activity)
+        frame = sys._current_frames().get(self._loop_thread_id) if self._loop_thread_id else None
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(無法取得事件循環執行緒的堆疊)"
+        logger.warning(
+            f"🐢 事件循環已卡住 {lag:.3f} 秒 (門檻 {self.threshold} 秒)，正在執行：{activity}\n{stack}"
+        )
+
+    def _export_quantiles(self):
+        samples = sorted(self._samples)
+        if not samples:
+            return
+        for q in (0.5, 0.9, 0.99, 1.0):
+            index = min(len(samples) - 1, int(q * len(samples)))
+            LOOP_LAG_QUANTILES.set(str(q), value=samples[index])
@@ -0,0 +1,203 @@
+# 檔案名稱：utils/member_index.py
+import asyncio
+import base64
+import bisect
+import json
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import discord
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("MemberIndex")
+
+# 成員清單索引：直接使用 Gateway 的成員快取 (需要 SERVER MEMBERS INTENT)，不再每次用 REST 抓完整成員清單。
+# 每個伺服器第一次查詢時建立兩個排序好的索引 (顯示名稱、ID 字串)，之後由成員加入 / 離開 / 更新事件增量維護，
+# 前綴搜尋與分頁都只需要一次 bisect。所有操作都在 Discord 事件循環上執行。
+
+INDEX_BUILDS = REGISTRY.counter(
+    "dashboard_member_index_builds_total", "成員索引 (重新) 建立的次數")
+INDEX_UPDATES = REGISTRY.counter(
+    "dashboard_member_index_updates_total", "成員索引由 Gateway 事件增量更新的次數", ("event",))
+INDEX_SIZE = REGISTRY.gauge(
+    "dashboard_member_index_members", "成員索引中的成員總數 (所有伺服器)")
+
+
+class MemberEntry(NamedTuple):
+    id: int
+    name: str
+    avatar: str
+    joined_at: str
+
+    def to_dict(self) -> dict:
+        # ID 以字串輸出，避免 JavaScript 的數字精度問題
+        return {"id": str(self.id), "name": self.name, "avatar": self.avatar, "joined_at": self.joined_at}
+
+
+def _entry(member: discord.Member) -> MemberEntry:
+    joined = member.joined_at.strftime("%Y-%m-%d %H:%M:%S") if member.joined_at else ""
+    return MemberEntry(member.id, member.display_name, member.display_avatar.url, joined)
+
+
+def encode_cursor(key: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (str(key[0]), int(key[1]))
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+class GuildMemberIndex:
+    """單一伺服器的成員索引：依 (顯示名稱 casefold, ID) 與 (ID 字串, ID) 排序的兩個串列。"""
+
+    def __init__(self, members=()):
+        self._entries: Dict[int, MemberEntry] = {}
+        self._by_name: List[Tuple[str, int]] = []
+        self._by_id: List[Tuple[str, int]] = []
+        for member in members:
+            self._entries[member.id] = _entry(member)
+        self._by_name = sorted((e.name.casefold(), e.id) for e in self._entries.values())
+        self._by_id = sorted((str(e.id), e.id) for e in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def upsert(self, member: discord.Member):
+        new = _entry(member)
+        old = self._entries.get(member.id)
+        if old == new:
+            return
+        if old is not None:
+            self._remove_keys(old)
+        else:
+            bisect.insort(self._by_id, (str(new.id), new.id))
+        self._entries[new.id] = new
+        bisect.insort(self._by_name, (new.name.casefold(), new.id))
+
+    def remove(self, member_id: int):
+        old = self._entries.pop(member_id, None)
+        if old is None:
+            return
+        self._remove_keys(old)
+        key = (str(old.id), old.id)
+        i = bisect.bisect_left(self._by_id, key)
+        if i < len(self._by_id) and self._by_id[i] == key:
+            del self._by_id[i]
+
+    def _remove_keys(self, old: MemberEntry):
+        key = (old.name.casefold(), old.id)
+        i = bisect.bisect_left(self._by_name, key)
+        if i < len(self._by_name) and self._by_name[i] == key:
+            del self._by_name[i]
+
+    def page(self, query: str = "", cursor: Optional[str] = None, limit: int = 100):
+        """
+        回傳 (成員串列, 下一頁 cursor 或 None)。
+        query 全是數字時依 ID 前綴搜尋，否則依顯示名稱前綴搜尋 (不分大小寫)；cursor 是上一頁最後一筆的排序鍵。
+        """
+        query = query.strip()
+        if query.isdigit():
+            keys, prefix = self._by_id, query
+        else:
+            keys, prefix = self._by_name, query.casefold()
+
+        after = decode_cursor(cursor)
+        if after is not None:
+            start = bisect.bisect_right(keys, after)
+        else:
+            start = bisect.bisect_left(keys, (prefix, -1))
+
+        result = []
+        i = start
+        while i < len(keys) and len(result) < limit:
+            key = keys[i]
+            if not key[0].startswith(prefix):
+                break
+            result.append(self._entries[key[1]])
+            i += 1
+
+        has_more = i < len(keys) and keys[i][0].startswith(prefix)
+        next_cursor = encode_cursor(keys[i - 1]) if has_more and result else None
+        return result, next_cursor
+
+    def count(self, query: str = "") -> int:
+        """符合前綴的成員數 (兩次 bisect)。"""
+        query = query.strip()
+        if not query:
+            return len(self._entries)
+        keys, prefix = (self._by_id, query) if query.isdigit() else (self._by_name, query.casefold())
+        lo = bisect.bisect_left(keys, (prefix, -1))
+        hi = bisect.bisect_left(keys, (prefix + "\U0010ffff", -1))
+        return hi - lo
+
+
+class MemberIndexRegistry:
+    def __init__(self, bot: discord.Client, chunk_timeout: float = 30.0):
+        self.bot = bot
+        self.chunk_timeout = chunk_timeout
+        self._indexes: Dict[int, GuildMemberIndex] = {}
+        self._building: Dict[int, asyncio.Future] = {}
+        REGISTRY.add_collector(lambda: INDEX_SIZE.set(value=sum(len(i) for i in self._indexes.values())))
+
+    async def get(self, guild: discord.Guild) -> GuildMemberIndex:
+        index = self._indexes.get(guild.id)
+        if index is not None:
+            return index
+        pending = self._building.get(guild.id)
+        if pending is None:
+            pending = self._building[guild.id] = asyncio.ensure_future(self._build(guild))
+            pending.add_done_callback(lambda _: self._building.pop(guild.id, None))
+        return await asyncio.shield(pending)
+
+    async def _build(self, guild: discord.Guild) -> GuildMemberIndex:
+        if not guild.chunked:
+            # 啟動時還沒分塊完成的伺服器，先透過 Gateway 要完整成員清單
+            try:
+                await asyncio.wait_for(guild.chunk(cache=True), timeout=self.chunk_timeout)
+            except Exception as e:
+                logger.warning(f"伺服器 {guild.id} 成員分塊失敗，使用目前快取的 {len(guild.members)} 位成員: {e}")
+        index = GuildMemberIndex(guild.members)
+        self._indexes[guild.id] = index
+        INDEX_BUILDS.inc()
+        return index
+
+    def _update(self, guild_id: int, event: str, apply):
+        index = self._indexes.get(guild_id)
+        if index is not None:
+            apply(index)
+            INDEX_UPDATES.inc(event)
+
+    def install(self):
+        """註冊成員事件監聽；索引只在被查詢過之後才會維護。"""
+        bot = self.bot
+
+        async def on_member_join(member):
+            self._update(member.guild.id, "join", lambda i: i.upsert(member))
+
+        async def on_raw_member_remove(payload):
+            self._update(payload.guild_id, "remove", lambda i: i.remove(payload.user.id))
+
+        async def on_member_update(before, after):
+            self._update(after.guild.id, "update", lambda i: i.upsert(after))
+
+        async def on_user_update(before, after):
+            # 使用者名稱 / 頭像變更會影響所有共同伺服器
+            for guild in after.mutual_guilds:
+                member = guild.get_member(after.id)
+                if member is not None:
+                    self._update(guild.id, "user_update", lambda i: i.upsert(member))
+
+        async def on_guild_remove(guild):
+            self._indexes.pop(guild.id, None)
+
+        for listener in (on_member_join, on_raw_member_remove, on_member_update, on_user_update, on_guild_remove):
+            bot.add_listener(listener)
+        return self
@@ -0,0 +1,158 @@
+# 檔案名稱：utils/oauth_check.py
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from aiohttp import web
+from cryptography.fernet import Fernet
+
+from utils.oauth_client import OAuthClient
+from utils.session_store import OAuthAccountStore
+
+# OAuth 用戶端與授權紀錄儲存的自我檢查：在本機開一個 Discord token / @me / guilds 的替身伺服器，
+# 不需要真的 Discord 應用程式。
+# 用法：python -m utils.oauth_check
+# 檢查：伺服器清單過期時的背景更新 (含 refresh token 輪替)、登出只減少參考計數、
+# 授權紀錄加密寫入資料庫並在「重啟」後讀回、重新登入後版本號一定前進。任何一項失敗就以非 0 結束。
+
+USER_ID = "4242"
+
+
+class FakeDiscord:
+    """Discord OAuth API 的替身：每次換 token 都發新的 refresh token，舊的立刻失效 (跟 Discord 一樣)。"""
+
+    def __init__(self):
+        self.issued = 0
+        self.valid_refresh = set()
+        self.guild_requests = 0
+        self.admin_guilds = ["1"]
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/oauth2/token", self.token)
+        app.router.add_get("/users/@me", self.me)
+        app.router.add_get("/users/@me/guilds", self.guilds)
+        return app
+
+    async def token(self, request: web.Request):
+        form = await request.post()
+        if form.get("grant_type") == "refresh_token":
+            if form.get("refresh_token") not in self.valid_refresh:
+                return web.json_response({"error": "invalid_grant"}, status=400)
+            self.valid_refresh.discard(form["refresh_token"])
+        self.issued += 1
+        refresh = f"refresh-{self.issued}"
+        self.valid_refresh.add(refresh)
+        return web.json_response({"access_token": f"access-{self.issued}", "refresh_token": refresh,
+                                  "expires_in": 30})
+
+    async def me(self, request: web.Request):
+        return web.json_response({"id": USER_ID, "username": "tester"})
+
+    async def guilds(self, request: web.Request):
+        self.guild_requests += 1
+        return web.json_response([{"id": gid, "name": f"guild {gid}", "icon": None, "permissions": "8"}
+                                  for gid in self.admin_guilds])
+
+
+def _check(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+    print(f"  ✅ {message}")
+
+
+async def _wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.02)
+    return True
+
+
+async def run_checks(root: str, port: int):
+    fake = FakeDiscord()
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    api_base = f"http://127.0.0.1:{port}"
+    db_path = os.path.join(root, "sessions.db")
+    key = Fernet.generate_key()
+
+    def client(ttl: float = 0.2) -> OAuthClient:
+        store = OAuthAccountStore(db_path, shared=True, key=key).start()
+        return OAuthClient("id", "secret", "http://localhost/callback", api_base=api_base, guild_ttl=ttl, store=store)
+
+    loop = asyncio.get_running_loop()
+    oauth = client()
+    restarted = None
+    try:
+        print("[登入與參考計數]")
+        await oauth.login("code-a")
+        first_version = oauth.account(USER_ID).version
+        await asyncio.sleep(0.01)
+        await oauth.login("code-b")
+        _check(oauth.account(USER_ID).version > first_version, "重新登入後版本號前進 (其他 session 會重新同步)")
+        _check(oauth.release(USER_ID) == 1, "一個 session 登出後紀錄仍保留給另一個 session")
+        _check(oauth.account(USER_ID) is not None, "另一個 session 仍讀得到授權紀錄")
+
+        print("[加密保存與重啟]")
+        with sqlite3.connect(db_path) as conn:
+            raw = conn.execute("SELECT data FROM oauth_accounts WHERE user_id = ?", (USER_ID,)).fetchone()[0]
+        _check("refresh-" not in raw and "access-" not in raw, "資料庫裡沒有明文 token")
+        restarted = client()
+        account = restarted.account(USER_ID)
+        _check(account is not None and account.refresh_token == f"refresh-{fake.issued}",
+               "新的行程 (重啟) 讀回同一份授權紀錄")
+        wrong_key = OAuthAccountStore(db_path, shared=True, key=Fernet.generate_key()).start()
+        _check(wrong_key.get(USER_ID) is None, "金鑰不同時讀不到 (不會拿到錯誤的 token)")
+
+        print("[過期時背景更新]")
+        fake.admin_guilds = ["1", "2"]
+        before = restarted.account(USER_ID)
+        await asyncio.sleep(0.25)
+        requests = fake.guild_requests
+        restarted.refresh_if_stale(USER_ID, loop)
+        restarted.refresh_if_stale(USER_ID, loop)   # 已經排了更新，不會重複
+        _check(await _wait_for(lambda: restarted.account(USER_ID).version != before.version),
+               "伺服器清單過期後在背景重新抓取")
+        after = restarted.account(USER_ID)
+        _check(fake.guild_requests == requests + 1, "同一時間只會送出一次更新")
+        _check([g["id"] for g in after.guilds] == ["1", "2"], "新的管理員伺服器清單已寫回")
+        _check(after.refresh_token != before.refresh_token and after.refresh_token in fake.valid_refresh,
+               "快過期的 access token 已用 refresh token 換新，新的 refresh token 已保存")
+        oauth.refresh_if_stale(USER_ID, loop)       # 另一個 worker 讀到的是剛寫回的新紀錄
+        await asyncio.sleep(0.1)
+        _check(fake.guild_requests == requests + 1, "剛更新過的清單不會被其他行程重複抓取")
+
+        print("[登出]")
+        _check(restarted.release(USER_ID) == 0, "最後一個 session 登出後參考計數歸零")
+        _check(oauth.account(USER_ID) is None, "紀錄已刪除，所有行程都不會再背景更新")
+    finally:
+        await oauth.close()
+        if restarted is not None:
+            await restarted.close()
+        await runner.cleanup()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OAuth 用戶端與授權紀錄儲存的自我檢查")
+    parser.add_argument("--port", type=int, default=18555, help="Discord 替身伺服器使用的本機 port")
+    args = parser.parse_args(argv)
+    root = tempfile.mkdtemp(prefix="oauth-check-")
+    try:
+        asyncio.run(run_checks(root, args.port))
+    except AssertionError as e:
+        print(f"  ❌ {e}")
+        raise SystemExit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    print("全部通過")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# 檔案名稱：utils/oauth_client.py
+import asyncio
+import logging
+import time
+from typing import List, Optional, Set
+
+import aiohttp
+
+from utils.session_store import OAuthAccountStore
+
+logger = logging.getLogger("OAuth")
+
+# Discord OAuth2 用戶端：
+# - 共用一個 keep-alive 的 aiohttp 連線池，登入時 @me 與 @me/guilds 同時抓
+# - 記住每位使用者的 refresh token，管理員伺服器清單過期 (TTL) 時在背景重新抓取，權限變動不用重新登入
+#   授權紀錄存在 OAuthAccountStore (session 資料庫)，重啟後或其他 worker 行程都讀得到；
+#   同一位使用者的多個 session 共用一筆，登出只減少參考計數
+# - access token 過期或被拒 (401) 時自動用 refresh token 換新；refresh 也失敗代表授權已被撤銷
+# api_base 可以指向本機的替身伺服器來測試。
+
+DEFAULT_API_BASE = "https://discord.com/api/v10"
+
+
+class OAuthError(Exception):
+    def __init__(self, status: int, text: str):
+        super().__init__(f"{status}: {text}")
+        self.status = status
+        self.text = text
+
+
+class _Account:
+    __slots__ = ("access_token", "refresh_token", "expires_at", "guilds", "guilds_fetched", "version", "revoked")
+
+    def __init__(self):
+        self.access_token = ""
+        self.refresh_token = ""
+        self.expires_at = 0.0
+        self.guilds: List[dict] = []
+        self.guilds_fetched = 0.0   # Unix 秒數 (跨行程比較，不能用 monotonic)
+        self.version = 0            # 伺服器清單更新時間 (毫秒，嚴格遞增)；重新登入建立的紀錄也一定比舊的大
+        self.revoked = False
+
+    def set_tokens(self, tokens: dict):
+        self.access_token = tokens["access_token"]
+        self.refresh_token = tokens.get("refresh_token", self.refresh_token)
+        self.expires_at = time.time() + float(tokens.get("expires_in", 604800))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_Account":
+        account = cls()
+        for name in cls.__slots__:
+            if name in data:
+                setattr(account, name, data[name])
+        return account
+
+
+class OAuthClient:
+    def __init__(self, client_id: str, client_secret: str, redirect_uri: str, api_base: str = DEFAULT_API_BASE,
+                 scope: str = "identify guilds guilds.members.read", required_permissions: int = 0x8,
+                 guild_ttl: float = 300.0, timeout: float = 15.0, pool_size: int = 20,
+                 store: Optional[OAuthAccountStore] = None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.api_base = api_base.rstrip("/")
+        self.scope = scope
+        self.required_permissions = required_permissions
+        self.guild_ttl = guild_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.pool_size = pool_size
+        self.store = store or OAuthAccountStore()
+        self._refreshing: Set[str] = set()   # 這個行程已經排了背景更新的使用者
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._http_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # --- HTTP ---
+    def _session(self) -> aiohttp.ClientSession:
+        # 連線池綁定建立它的事件循環；事件循環換了 (例如執行緒模式下 Bot 還沒啟動) 就重建
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http.closed or self._http_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._http = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._http_loop = loop
+        return self._http
+
+    async def _request(self, method: str, path: str, **kwargs):
+        async with self._session().request(method, f"{self.api_base}{path}", **kwargs) as response:
+            if response.status >= 400:
+                raise OAuthError(response.status, await response.text())
+            return await response.json()
+
+    async def _token(self, **grant) -> dict:
+        data = {"client_id": self.client_id, "client_secret": self.client_secret, **grant}
+        return await self._request("POST", "/oauth2/token", data=data,
+                                   headers={"Content-Type": "application/x-www-form-urlencoded"})
+
+    async def _get(self, account: _Account, path: str):
+        headers = {"Authorization": f"Bearer {account.access_token}"}
+        return await self._request("GET", path, headers=headers)
+
+    async def close(self):
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+
+    # --- 登入 ---
+    async def login(self, code: str):
+        """用授權碼換 token，並同時抓使用者資料與伺服器清單；回傳 (user, 管理員伺服器清單)。"""
+        tokens = await self._token(grant_type="authorization_code", code=code,
+                                   redirect_uri=self.redirect_uri, scope=self.scope)
+        account = _Account()
+        account.set_tokens(tokens)
+        user, guilds = await asyncio.gather(self._get(account, "/users/@me"),
+                                            self._get(account, "/users/@me/guilds"))
+        self._set_guilds(account, guilds)
+        await asyncio.to_thread(self.store.retain, user["id"], account.to_dict())
+        return user, account.guilds
+
+    def _set_guilds(self, account: _Account, guilds: List[dict]):
+        required = self.required_permissions
+        account.guilds = [
+            {"id": g["id"], "name": g["name"], "icon": g["icon"], "permissions": g.get("permissions", "0")}
+            for g in guilds
+            if (int(g.get("permissions", "0")) & required) == required
+        ]
+        account.guilds_fetched = time.time()
+        # 用時間當版本：同一位使用者重新登入後，其他 session 手上的舊版本號不會剛好相同而漏掉同步
+        account.version = max(account.version + 1, int(account.guilds_fetched * 1000))
+
+    # --- 背景更新 ---
+    def account(self, user_id) -> Optional[_Account]:
+        """目前的授權紀錄快照 (唯讀；要改請透過 store)。"""
+        data = self.store.get(user_id)
+        return _Account.from_dict(data) if data is not None else None
+
+    def release(self, user_id) -> int:
+        """某個 session 登出 (或發現授權已失效)：其他 session 還在用時保留紀錄，回傳剩下的 session 數。"""
+        return self.store.release(user_id)
+
+    def release_soon(self, user_id, loop: Optional[asyncio.AbstractEventLoop]):
+        """release 的非阻塞版本 (給 before_request 用)：在 loop 上丟到執行緒執行；沒有事件循環時直接執行。"""
+        if loop is None or not loop.is_running():
+            self.release(user_id)
+            return
+        loop.call_soon_threadsafe(lambda: asyncio.ensure_future(asyncio.to_thread(self.release, user_id)))
+
+    def refresh_if_stale(self, user_id, loop: Optional[asyncio.AbstractEventLoop],
+                         account: Optional[_Account] = None):
+        """伺服器清單超過 TTL 時，在 loop 上排一次背景更新 (可以從任何執行緒呼叫，不會碰到資料庫)。
+
+        account 是呼叫端已經讀好的紀錄；不傳時才會讀 store。
+        """
+        user_id = str(user_id)
+        if account is None:
+            account = self.account(user_id)
+        if (account is None or account.revoked or user_id in self._refreshing or loop is None
+                or not loop.is_running() or time.time() - account.guilds_fetched < self.guild_ttl):
+            return
+        self._refreshing.add(user_id)
+        loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._refresh_guilds(user_id)))
+
+    async def _refresh_guilds(self, user_id: str):
+        account = None
+        try:
+            # 租約要比一次更新 (最多兩次 token 請求 + 兩次 API 請求) 還長；其他行程正在更新就跳過
+            if not await asyncio.to_thread(self.store.claim, user_id, self.timeout.total * 4):
+                return
+            # 拿到租約之後才讀：其他行程可能剛換過 refresh token
+            data = await asyncio.to_thread(self.store.get, user_id)
+            if data is None:
+                return
+            account = _Account.from_dict(data)
+            if account.expires_at - time.time() < 60:
+                await self._refresh_tokens(account)
+            try:
+                guilds = await self._get(account, "/users/@me/guilds")
+            except OAuthError as e:
+                if e.status != 401:
+                    raise
+                await self._refresh_tokens(account)
+                guilds = await self._get(account, "/users/@me/guilds")
+            self._set_guilds(account, guilds)
+        except OAuthError as e:
+            if e.status in (400, 401):
+                # refresh token 被撤銷或失效：這個授權不能再用，要求重新登入
+                account.revoked = True
+                logger.info(f"OAuth 授權已失效，需要重新登入: {e}")
+            else:
+                logger.warning(f"背景更新伺服器清單失敗: {e}")
+        except Exception as e:
+            logger.warning(f"背景更新伺服器清單失敗: {type(e).__name__}: {e}")
+        finally:
+            self._refreshing.discard(user_id)
+            if account is not None:
+                # 失敗時也更新時間，避免每個請求都重試；寫回時一併釋放租約
+                account.guilds_fetched = max(account.guilds_fetched, time.time() - self.guild_ttl / 2)
+                try:
+                    await asyncio.to_thread(self.store.put, user_id, account.to_dict())
+                except Exception as e:
+                    logger.warning(f"儲存 OAuth 授權紀錄失敗: {type(e).__name__}: {e}")
+
+    async def _refresh_tokens(self, account: _Account):
+        tokens = await self._token(grant_type="refresh_token", refresh_token=account.refresh_token)
+        account.set_tokens(tokens)
@@ -0,0 +1,59 @@
+# 檔案名稱：utils/presence.py
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import discord
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger("Presence")
+
+# 機器人狀態 (presence) 更新合併：
+# 後台按鈕、狀態輪播、on_ready 都只是「登記想要的狀態」，由單一個背景工作送出，
+# 兩次 change_presence 之間至少間隔 min_interval 秒；間隔內的多次登記只會送出最後一次，不浪費 Gateway 額度。
+# 只改活動 (輪播) 時沿用上次設定的燈號，不會被重設成線上。所有操作都在 Discord 事件循環上執行。
+
+PRESENCE_REQUESTS = REGISTRY.counter(
+    "bot_presence_requests_total", "登記的狀態更新次數 (含被合併掉的)")
+PRESENCE_APPLIED = REGISTRY.counter(
+    "bot_presence_updates_total", "實際送到 Gateway 的 change_presence 次數")
+
+_UNSET = object()
+
+
+class PresenceCoalescer:
+    def __init__(self, bot: discord.Client, min_interval: float = 2.0):
+        self.bot = bot
+        self.min_interval = min_interval
+        self.status: Optional[discord.Status] = None
+        self.activity: Optional[discord.BaseActivity] = None
+        self._dirty = False
+        self._last_applied = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, status=_UNSET, activity=_UNSET):
+        """登記新的狀態並立即返回；沒給的欄位沿用上次的值。"""
+        if status is not _UNSET:
+            self.status = status
+        if activity is not _UNSET:
+            self.activity = activity
+        self._dirty = True
+        PRESENCE_REQUESTS.inc()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            wait = self._last_applied + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # 等待期間可能又被登記了好幾次，這裡只取最新的
+            self._dirty = False
+            try:
+                await self.bot.change_presence(status=self.status, activity=self.activity)
+                PRESENCE_APPLIED.inc()
+            except Exception as e:
+                logger.warning(f"更新機器人狀態失敗: {type(e).__name__}: {e}")
+            self._last_applied = time.monotonic()
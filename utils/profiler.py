@@ -0,0 +1,94 @@
+# 檔案名稱：utils/profiler.py
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+# 線上診斷工具：只有在被呼叫的那段時間才會運作，平常完全沒有任何額外負擔。
+# - sample_stacks：定時抓所有執行緒的堆疊，輸出 collapsed stack (flamegraph.pl / speedscope 可直接讀)
+# - heap_growth：前後兩次 tracemalloc 快照，列出這段時間記憶體成長最多的檔案與行號
+
+_busy = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """已經有一個分析正在執行。"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    filename = os.path.basename(code.co_filename)
+    # collapsed 格式以 ; 分隔堆疊、以空白分隔次數
+    return f"{name}@{filename}:{code.co_firstlineno}".replace(";", ":").replace(" ", "_")
+
+
+def _collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(f"thread:{thread_name}".replace(" ", "_"))
+    labels.reverse()
+    return ";".join(labels)
+
+
+def sample_stacks(duration: float, interval: float = 0.005, thread_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """在 duration 秒內每隔 interval 秒取樣一次堆疊，回傳 {collapsed stack: 次數}。"""
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("已經有一個分析正在執行")
+    try:
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (thread_ids is not None and ident not in thread_ids):
+                    continue
+                counts[_collapse(frame, names.get(ident, str(ident)))] += 1
+            time.sleep(interval)
+        return dict(counts)
+    finally:
+        _busy.release()
+
+
+def render_collapsed(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
+def heap_growth(duration: float, top: int = 30, frames: int = 1) -> List[dict]:
+    """比較 duration 秒前後的記憶體配置，回傳成長最多的前 top 個位置 (依檔案與行號)。"""
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("已經有一個分析正在執行")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(frames)
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ]
+        before = tracemalloc.take_snapshot().filter_traces(filters)
+        time.sleep(duration)
+        after = tracemalloc.take_snapshot().filter_traces(filters)
+        stats = after.compare_to(before, "lineno")
+        return [
+            {
+                "file": stat.traceback[0].filename,
+                "line": stat.traceback[0].lineno,
+                "size_diff": stat.size_diff,
+                "size": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in stats[:top]
+        ]
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _busy.release()
@@ -0,0 +1,130 @@
+# 檔案名稱：utils/rate_limit.py
+import functools
+import inspect
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Tuple
+
+from flask import jsonify, request, session
+
+from utils.metrics import REGISTRY
+
+# 儀表板 API 的 token bucket 限流：
+# - 每個 bucket 只存 [剩餘額度, 上次更新時間] 兩個數字，取用時才依經過時間補充額度 (不需要背景計時器)
+# - 所有 bucket 放在同一個 OrderedDict，超過上限時從最久沒用到的開始丟掉 (被丟掉的 bucket 等於額度全滿)
+# - 每個路由各自設定額度 ("次數/秒數")，同時以登入使用者與來源 IP 計算，任一個用完就回 429 + Retry-After
+# sync 與 async 路由都可以使用；async 路由包裝後仍然是 coroutine function，會照舊直接在事件循環上執行。
+
+RATE_LIMITED = REGISTRY.counter(
+    "dashboard_rate_limited_total", "因超過限流額度被拒絕 (429) 的請求數", ("route",))
+
+
+def parse_rate(spec: str) -> Tuple[float, float]:
+    """"10/60" -> (每秒補充 10/60 次, 容量 10)；格式錯誤時丟出 ValueError。"""
+    count, _, seconds = str(spec).partition("/")
+    count, seconds = float(count), float(seconds or 1)
+    if count <= 0 or seconds <= 0:
+        raise ValueError(f"限流額度格式錯誤: {spec!r}")
+    return count / seconds, count
+
+
+class TokenBucketStore:
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, keys: Sequence[str], rate: float, burst: float, cost: float = 1.0) -> float:
+        """
+        從所有 keys 的 bucket 各扣 cost；全部都夠才會扣。
+        回傳 0 代表允許，否則是最早可以再試的秒數 (這次不會扣任何 bucket)。
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            retry_after = 0.0
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = [burst, now]
+                else:
+                    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+                buckets.append((key, bucket))
+                if bucket[0] < cost:
+                    retry_after = max(retry_after, (cost - bucket[0]) / rate)
+            for key, bucket in buckets:
+                if not retry_after:
+                    bucket[0] -= cost
+                self._buckets[key] = bucket
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    def __init__(self, store: Optional[TokenBucketStore] = None, proxy_hops: int = 0):
+        self.store = store or TokenBucketStore()
+        self.proxy_hops = proxy_hops
+
+    def client_ip(self) -> str:
+        # 在反向代理 (Render 等) 後面時，真正的來源 IP 是倒數第 proxy_hops 個 X-Forwarded-For
+        # (最前面幾個是用戶端自己可以偽造的)
+        route = request.access_route
+        if self.proxy_hops and len(route) >= self.proxy_hops:
+            return route[-self.proxy_hops]
+        return request.remote_addr or "-"
+
+    def keys(self, name: str):
+        keys = [f"{name}|ip:{self.client_ip()}"]
+        user = session.get("discord_user")
+        if user:
+            keys.append(f"{name}|user:{user['id']}")
+        return keys
+
+    def limit(self, name: str, spec: str, methods: Optional[Sequence[str]] = None,
+              on_limited: Optional[Callable[[int], object]] = None):
+        """
+        路由裝飾器 (放在 @app.route 下面)。spec 例如 "5/10" = 10 秒內最多 5 次 (可以一次用完)。
+        methods 只限制特定 HTTP 方法；on_limited(retry_after) 可以自訂被拒絕時的回應內容。
+        """
+        rate, burst = parse_rate(spec)
+
+        def check():
+            if methods is not None and request.method not in methods:
+                return None
+            retry_after = self.store.take(self.keys(name), rate, burst)
+            if not retry_after:
+                return None
+            RATE_LIMITED.inc(name)
+            seconds = max(1, math.ceil(retry_after))
+            if on_limited is not None:
+                rv = on_limited(seconds)
+            else:
+                rv = jsonify({"success": False, "message": f"請求太頻繁，請 {seconds} 秒後再試"})
+            return rv, 429, {"Retry-After": str(seconds)}
+
+        def decorator(view):
+            if inspect.iscoroutinefunction(view):
+                @functools.wraps(view)
+                async def wrapper(*args, **kwargs):
+                    limited = check()
+                    if limited is not None:
+                        return limited
+                    return await view(*args, **kwargs)
+            else:
+                @functools.wraps(view)
+                def wrapper(*args, **kwargs):
+                    limited = check()
+                    if limited is not None:
+                        return limited
+                    return view(*args, **kwargs)
+            return wrapper
+
+        return decorator
@@ -0,0 +1,233 @@
+# 檔案名稱：utils/rest_telemetry.py
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from utils.metrics import REGISTRY
+
+# Discord REST 呼叫統計：
+# 包裝 bot.http.request 記下路由樣板 (例如 "POST /channels/{channel_id}/messages") 與呼叫來源 (哪個檔案的哪個函式)，
+# 再用 aiohttp TraceConfig 量測每個實際送出的請求：延遲、狀態碼、速率限制標頭 (bucket / remaining / reset)、429 與 retry-after。
+# interaction followup 等 Webhook 請求不經過 bot.http.request，改由網址推回路由樣板。
+
+REST_DURATION = REGISTRY.histogram(
+    "discord_rest_request_duration_seconds", "Discord REST 請求的延遲 (依路由樣板)", ("route",))
+REST_REQUESTS = REGISTRY.counter(
+    "discord_rest_requests_total", "Discord REST 請求次數", ("route", "status", "source"))
+REST_ERRORS = REGISTRY.counter(
+    "discord_rest_errors_total", "Discord REST 請求在拿到回應前就失敗的次數", ("route", "exception"))
+REST_RATE_LIMITED = REGISTRY.counter(
+    "discord_rest_rate_limited_total", "Discord 回傳 429 的次數", ("route", "bucket", "scope"))
+REST_RETRY_AFTER = REGISTRY.counter(
+    "discord_rest_retry_after_seconds_total", "429 要求等待的秒數總和", ("route", "scope"))
+REST_REMAINING = REGISTRY.gauge(
+    "discord_rest_ratelimit_remaining", "最後一次回應時 bucket 剩餘的請求數", ("bucket",))
+REST_LIMIT = REGISTRY.gauge(
+    "discord_rest_ratelimit_limit", "bucket 每個週期可用的請求數", ("bucket",))
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_SKIP_DIRS = (os.path.join(_ROOT, "utils") + os.sep,)
+
+# (路由樣板, 呼叫來源)，在同一個 Task 裡由 bot.http.request 設定、TraceConfig 讀取
+_current_route: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("rest_route", default=None)
+
+_API_PREFIX = re.compile(r"^/api/v\d+")
+_SNOWFLAKE = re.compile(r"/\d{15,21}(?=/|$)")
+_TOKEN = re.compile(r"(/(?:webhooks|interactions)/\{id\})/[^/]+")
+
+
+def _route_from_url(method: str, url) -> str:
+    """沒有 Route 物件時 (Webhook / followup)，把網址中的 ID 與 token 換成樣板。"""
+    path = _API_PREFIX.sub("", url.path)
+    path = _SNOWFLAKE.sub("/{id}", path)
+    path = _TOKEN.sub(r"\1/{token}", path)
+    return f"{method} {path}"
+
+
+def _caller() -> str:
+    """往上找第一個屬於本專案 (utils 除外) 的堆疊，回傳「模組:函式」；找不到代表是 discord.py 自己發的請求。"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and not filename.startswith(_SKIP_DIRS):
+            module = os.path.relpath(filename, _ROOT)[:-3].replace(os.sep, ".")
+            name = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+            return f"{module}:{name}"
+        frame = frame.f_back
+    return "discord.py"
+
+
+class _RouteStats:
+    __slots__ = ("count", "errors", "statuses", "rate_limited", "retry_after", "total_time", "max_time",
+                 "bucket", "remaining", "limit", "reset_after", "last_seen", "sources")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.statuses: Dict[int, int] = {}
+        self.rate_limited = 0
+        self.retry_after = 0.0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.bucket: Optional[str] = None
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.reset_after: Optional[float] = None
+        self.last_seen = 0.0
+        self.sources: Dict[str, int] = {}
+
+
+class _SourceStats:
+    __slots__ = ("count", "rate_limited", "retry_after", "total_time")
+
+    def __init__(self):
+        self.count = 0
+        self.rate_limited = 0
+        self.retry_after = 0.0
+        self.total_time = 0.0
+
+
+class RestTelemetry:
+    def __init__(self):
+        self._routes: Dict[str, _RouteStats] = {}
+        self._sources: Dict[str, _SourceStats] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._on_request_start)
+        self.trace_config.on_request_end.append(self._on_request_end)
+        self.trace_config.on_request_exception.append(self._on_request_exception)
+
+    def instrument(self, http):
+        """包裝 discord.py 的 HTTPClient.request，讓 TraceConfig 知道每個請求的路由樣板與呼叫來源。"""
+        original = http.request
+        if getattr(original, "__telemetry_wrapped__", False):
+            return http
+
+        async def request(route, **kwargs):
+            token = _current_route.set((f"{route.method} {route.path}", _caller()))
+            try:
+                return await original(route, **kwargs)
+            finally:
+                _current_route.reset(token)
+
+        request.__telemetry_wrapped__ = True
+        http.request = request
+        return http
+
+    # --- aiohttp TraceConfig 回呼 (在發出請求的 Task 裡執行) ---
+    async def _on_request_start(self, session, ctx, params):
+        current = _current_route.get()
+        if current is None:
+            current = (_route_from_url(params.method, params.url), _caller())
+        ctx.route, ctx.source = current
+        ctx.started = time.perf_counter()
+
+    async def _on_request_end(self, session, ctx, params):
+        if not hasattr(ctx, "route"):
+            return
+        self._record(ctx.route, ctx.source, time.perf_counter() - ctx.started, params.response)
+
+    async def _on_request_exception(self, session, ctx, params):
+        if not hasattr(ctx, "route"):
+            return
+        REST_ERRORS.inc(ctx.route, type(params.exception).__name__)
+        with self._lock:
+            self._routes.setdefault(ctx.route, _RouteStats()).errors += 1
+
+    def _record(self, route: str, source: str, elapsed: float, response: aiohttp.ClientResponse):
+        headers = response.headers
+        status = response.status
+        bucket = headers.get("X-RateLimit-Bucket")
+        REST_DURATION.observe(elapsed, route)
+        REST_REQUESTS.inc(route, str(status), source)
+
+        retry_after = 0.0
+        if status == 429:
+            scope = headers.get("X-RateLimit-Scope", "user")
+            try:
+                retry_after = float(headers.get("Retry-After", 0))
+            except ValueError:
+                retry_after = 0.0
+            REST_RATE_LIMITED.inc(route, bucket or "", scope)
+            REST_RETRY_AFTER.inc(route, scope, amount=retry_after)
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        limit = headers.get("X-RateLimit-Limit")
+        if bucket and remaining is not None:
+            REST_REMAINING.set(bucket, value=int(remaining))
+        if bucket and limit is not None:
+            REST_LIMIT.set(bucket, value=int(limit))
+
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = _RouteStats()
+            stats.count += 1
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            stats.last_seen = time.time()
+            stats.sources[source] = stats.sources.get(source, 0) + 1
+            if bucket:
+                stats.bucket = bucket
+            if remaining is not None:
+                stats.remaining = int(remaining)
+            if limit is not None:
+                stats.limit = int(limit)
+            reset_after = headers.get("X-RateLimit-Reset-After")
+            if reset_after is not None:
+                stats.reset_after = float(reset_after)
+
+            by_source = self._sources.get(source)
+            if by_source is None:
+                by_source = self._sources[source] = _SourceStats()
+            by_source.count += 1
+            by_source.total_time += elapsed
+            if status == 429:
+                stats.rate_limited += 1
+                stats.retry_after += retry_after
+                by_source.rate_limited += 1
+                by_source.retry_after += retry_after
+
+    def snapshot(self) -> dict:
+        """給後台表格用：依路由與依呼叫來源的彙總，請求數多的排前面。"""
+        with self._lock:
+            routes = [
+                {
+                    "route": route,
+                    "bucket": s.bucket,
+                    "count": s.count,
+                    "errors": s.errors,
+                    "statuses": {str(k): v for k, v in sorted(s.statuses.items())},
+                    "rate_limited": s.rate_limited,
+                    "retry_after": round(s.retry_after, 3),
+                    "avg_ms": round(s.total_time / s.count * 1000, 1) if s.count else 0,
+                    "max_ms": round(s.max_time * 1000, 1),
+                    "remaining": s.remaining,
+                    "limit": s.limit,
+                    "reset_after": s.reset_after,
+                    "last_seen": s.last_seen,
+                    "sources": dict(sorted(s.sources.items(), key=lambda kv: -kv[1])),
+                }
+                for route, s in self._routes.items()
+            ]
+            sources = [
+                {
+                    "source": source,
+                    "count": s.count,
+                    "rate_limited": s.rate_limited,
+                    "retry_after": round(s.retry_after, 3),
+                    "avg_ms": round(s.total_time / s.count * 1000, 1) if s.count else 0,
+                }
+                for source, s in self._sources.items()
+            ]
+        routes.sort(key=lambda r: (-r["count"], r["route"]))
+        sources.sort(key=lambda r: (-r["count"], r["source"]))
+        return {"since": self.started, "routes": routes, "sources": sources}
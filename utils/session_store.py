@@ -0,0 +1,435 @@
+# 檔案名稱：utils/session_store.py
+import atexit
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.http import parse_cookie
+
+logger = logging.getLogger("SessionStore")
+
+# 伺服器端 session：Cookie 只放一個隨機 ID，使用者資料與管理員伺服器清單都留在伺服器上。
+# 記憶體中以 LRU 保存最近使用的 session；有設定路徑時另外寫入 SQLite (背景執行緒批次寫入)，重啟後還能登入。
+# 每個 session 會預先把 discord_guilds 的伺服器 ID 建成 set，權限檢查只要一次查表。
+# shared=True 給多個 worker 行程共用同一個資料庫時使用：不保留行程內快取，每次讀寫都直接進 SQLite，
+# 避免某個 worker 讀到其他 worker 已經改過的舊資料。
+# 同一個資料庫另外保存 OAuth 授權紀錄 (OAuthAccountStore)，依使用者一筆、以參考計數跟 session 對應。
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id      TEXT PRIMARY KEY,
+    data    TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires);
+"""
+
+_serializer = TaggedJSONSerializer()
+
+# preload() 預先讀好的 session 放在 environ 的這個鍵 (sid, data)
+PRELOADED_SESSION = "session_store.preloaded"
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid: Optional[str] = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+            self._guild_ids = None
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid: Optional[str] = None
+        self._guild_ids: Optional[FrozenSet[int]] = None
+
+    def regenerate(self):
+        """登入時換一個新的 session ID (防止 session fixation)，舊 ID 會在回應時刪除。"""
+        if not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+    @property
+    def admin_guild_ids(self) -> FrozenSet[int]:
+        """這個 session 可以管理的伺服器 ID (discord_guilds 變更時自動重建)。"""
+        if self._guild_ids is None:
+            self._guild_ids = frozenset(int(g['id']) for g in self.get("discord_guilds") or ())
+        return self._guild_ids
+
+
+class SessionStore:
+    def __init__(self, path: Optional[str] = None, max_entries: int = 10000, flush_interval: float = 1.0,
+                 shared: bool = False):
+        self.path = path or None
+        self.shared = shared and self.path is not None
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._pending: Dict[str, Optional[Tuple[str, float]]] = {}   # 還沒寫進 SQLite 的變更 (None = 刪除)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.path is None or self._thread is not None:
+            return self
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------- 讀寫 (任何執行緒都可以呼叫) ----------
+    def get(self, sid: str) -> Optional[dict]:
+        now = time.time()
+        if self.shared:
+            data, expires = self._load(sid)
+            return data if data is not None and expires > now else None
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                data, expires = entry
+                if expires > now:
+                    self._cache.move_to_end(sid)
+                    return data
+                self._forget(sid)
+                return None
+            if sid in self._pending:
+                # 已經排入刪除 (或寫入後被 LRU 擠掉，資料在 _pending 裡)
+                pending = self._pending[sid]
+                if pending is None:
+                    return None
+                data, expires = _serializer.loads(pending[0]), pending[1]
+            else:
+                data, expires = None, 0.0
+        if data is None:
+            data, expires = self._load(sid)
+        if data is None or expires <= now:
+            return None
+        with self._lock:
+            self._remember(sid, data, expires)
+        return data
+
+    def set(self, sid: str, data: dict, expires: float):
+        if self.shared:
+            with self._db() as conn:
+                conn.execute("INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+                             (sid, _serializer.dumps(data), expires))
+            return
+        with self._lock:
+            self._remember(sid, data, expires)
+            if self.path is not None:
+                self._pending[sid] = (_serializer.dumps(data), expires)
+                self._wake.set()
+
+    def delete(self, sid: str):
+        if self.shared:
+            with self._db() as conn:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            return
+        with self._lock:
+            self._forget(sid)
+
+    def _remember(self, sid: str, data: dict, expires: float):
+        self._cache[sid] = (data, expires)
+        self._cache.move_to_end(sid)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _forget(self, sid: str):
+        self._cache.pop(sid, None)
+        if self.path is not None:
+            self._pending[sid] = None
+            self._wake.set()
+
+    def __len__(self):
+        return len(self._cache)
+
+    # ---------- SQLite ----------
+    def _db(self) -> sqlite3.Connection:
+        # 每個執行緒一條讀寫用的連線
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _load(self, sid: str) -> Tuple[Optional[dict], float]:
+        if self.path is None:
+            return None, 0.0
+        row = self._db().execute("SELECT data, expires FROM sessions WHERE id = ?", (sid,)).fetchone()
+        if row is None:
+            return None, 0.0
+        try:
+            return _serializer.loads(row[0]), row[1]
+        except ValueError:
+            return None, 0.0
+
+    def _run(self):
+        conn = self._connect()
+        last_purge = 0.0
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                with self._lock:
+                    pending, self._pending = self._pending, {}
+                upserts = [(sid, v[0], v[1]) for sid, v in pending.items() if v is not None]
+                deletes = [(sid,) for sid, v in pending.items() if v is None]
+                try:
+                    with conn:
+                        if upserts:
+                            conn.executemany("INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)", upserts)
+                        if deletes:
+                            conn.executemany("DELETE FROM sessions WHERE id = ?", deletes)
+                        if time.time() - last_purge > 3600:
+                            conn.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+                            last_purge = time.time()
+                except sqlite3.Error as e:
+                    logger.error(f"寫入 session 失敗 ({len(pending)} 筆): {e}")
+                if self._stop.is_set():
+                    return
+        finally:
+            conn.close()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask SessionInterface：Cookie 裡只有隨機 session ID。"""
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    def preload(self, app, environ: dict):
+        """在執行緒裡先讀出 session (給 AsyncWebServer 的 prepare 用)，open_session 就不必在事件循環上查 SQLite。"""
+        sid = parse_cookie(environ).get(self.get_cookie_name(app))
+        if sid:
+            environ[PRELOADED_SESSION] = (sid, self.store.get(sid))
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            preloaded = request.environ.get(PRELOADED_SESSION)
+            data = preloaded[1] if preloaded is not None and preloaded[0] == sid else self.store.get(sid)
+            if data is not None:
+                return ServerSession(data, sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session: ServerSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            expires = self.get_expiration_time(app, session)
+            lifetime = app.permanent_session_lifetime.total_seconds()
+            self.store.set(session.sid, dict(session), expires.timestamp() if expires else time.time() + lifetime)
+
+        if session.new or (session.modified and session.permanent):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+_ACCOUNT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS oauth_accounts (
+    user_id  TEXT PRIMARY KEY,
+    data     TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    lease    REAL NOT NULL DEFAULT 0,
+    updated  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_oauth_accounts_updated ON oauth_accounts (updated);
+"""
+
+
+class OAuthAccountStore:
+    """OAuth 授權紀錄 (token 與管理員伺服器清單)，依使用者存在 session 資料庫裡，重啟後或其他 worker 都讀得到。
+
+    同一位使用者的多個 session (不同瀏覽器 / 裝置) 共用一筆紀錄，sessions 欄位是參考計數：
+    登入 +1、登出 -1，歸零才刪除。沒有正常登出的 session 留下的紀錄，閒置超過 max_idle 秒後清掉。
+    lease 是背景更新的租約：refresh token 用過就換新，同時只能有一個行程拿去換。
+    有 key (Fernet 金鑰) 時整筆紀錄加密後才寫入資料庫；沒有 key 時 secret_fields 不寫入磁碟，
+    只留在這個行程的記憶體裡 (重啟後要重新登入，shared 模式的其他 worker 也拿不到 token)。
+    沒有路徑時只存在記憶體；shared=True (多個 worker 行程) 時不保留行程內快取。
+    """
+
+    def __init__(self, path: Optional[str] = None, shared: bool = False, max_idle: float = 30 * 86400,
+                 key: Optional[bytes] = None, secret_fields: Iterable[str] = ("access_token", "refresh_token")):
+        self.path = path or None
+        self.shared = shared and self.path is not None
+        self.max_idle = max_idle
+        self.secret_fields = tuple(secret_fields)
+        self._fernet = Fernet(key) if key else None
+        self._cache: Dict[str, list] = {}    # user_id -> [data, sessions, lease]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self):
+        if self.path is None:
+            return self
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._db() as conn:
+            conn.executescript(_ACCOUNT_SCHEMA)
+            conn.execute("DELETE FROM oauth_accounts WHERE updated <= ?", (time.time() - self.max_idle,))
+        if self._fernet is None:
+            logger.warning("沒有設定 OAuth token 加密金鑰：token 只保存在記憶體，重啟後使用者需要重新登入")
+        return self
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _dumps(self, data: dict) -> str:
+        if self._fernet is not None:
+            return self._fernet.encrypt(_serializer.dumps(data).encode("utf-8")).decode("ascii")
+        return _serializer.dumps({k: v for k, v in data.items() if k not in self.secret_fields})
+
+    def _loads(self, text: str) -> Optional[dict]:
+        if self._fernet is None:
+            return _serializer.loads(text)
+        try:
+            return _serializer.loads(self._fernet.decrypt(text.encode("ascii")).decode("utf-8"))
+        except (InvalidToken, ValueError):
+            # 金鑰換過或是加密前留下的舊紀錄：當作沒有授權，使用者重新登入即可
+            logger.warning("OAuth 授權紀錄無法解密，已忽略")
+            return None
+
+    def _load(self, user_id: str) -> Optional[list]:
+        row = self._db().execute("SELECT data, sessions, lease FROM oauth_accounts WHERE user_id = ?",
+                                 (user_id,)).fetchone()
+        if row is None:
+            return None
+        data = self._loads(row[0])
+        return [data, row[1], row[2]] if data is not None else None
+
+    def get(self, user_id) -> Optional[dict]:
+        user_id = str(user_id)
+        with self._lock:
+            entry = None if self.shared else self._cache.get(user_id)
+            if entry is None and self.path is not None:
+                entry = self._load(user_id)
+                if entry is not None and not self.shared:
+                    self._cache[user_id] = entry
+            return dict(entry[0]) if entry is not None else None
+
+    def put(self, user_id, data: dict):
+        """更新紀錄內容並釋放租約，不改變參考計數；紀錄已經被刪除 (所有 session 都登出了) 就不寫。"""
+        user_id = str(user_id)
+        with self._lock:
+            if self.path is not None:
+                with self._db() as conn:
+                    conn.execute("UPDATE oauth_accounts SET data = ?, lease = 0, updated = ? WHERE user_id = ?",
+                                 (self._dumps(data), time.time(), user_id))
+            entry = self._cache.get(user_id)
+            if entry is not None:
+                entry[0], entry[2] = dict(data), 0.0
+
+    def retain(self, user_id, data: dict):
+        """登入：寫入新的授權並把參考計數 +1。"""
+        user_id = str(user_id)
+        with self._lock:
+            if self.path is None:
+                entry = self._cache.get(user_id)
+                self._cache[user_id] = [dict(data), (entry[1] if entry else 0) + 1, 0.0]
+                return
+            with self._db() as conn:
+                conn.execute(
+                    "INSERT INTO oauth_accounts (user_id, data, sessions, lease, updated) VALUES (?, ?, 1, 0, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, sessions = sessions + 1, "
+                    "lease = 0, updated = excluded.updated",
+                    (user_id, self._dumps(data), time.time()),
+                )
+                sessions = conn.execute("SELECT sessions FROM oauth_accounts WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if not self.shared:
+                # 快取保留完整資料 (沒有金鑰時 token 只存在這裡)
+                self._cache[user_id] = [dict(data), sessions, 0.0]
+
+    def release(self, user_id) -> int:
+        """登出：參考計數 -1，歸零時刪除紀錄；回傳剩下的 session 數。"""
+        user_id = str(user_id)
+        with self._lock:
+            if self.path is None:
+                entry = self._cache.get(user_id)
+                if entry is None:
+                    return 0
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._cache[user_id]
+                return max(entry[1], 0)
+            with self._db() as conn:
+                conn.execute("UPDATE oauth_accounts SET sessions = sessions - 1 WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM oauth_accounts WHERE user_id = ? AND sessions <= 0", (user_id,))
+                row = conn.execute("SELECT sessions FROM oauth_accounts WHERE user_id = ?", (user_id,)).fetchone()
+            entry = self._cache.get(user_id)
+            if row is None:
+                self._cache.pop(user_id, None)
+                return 0
+            if entry is not None:
+                entry[1] = row[0]
+            return row[0]
+
+    def claim(self, user_id, seconds: float) -> bool:
+        """取得 seconds 秒的背景更新租約；別人 (其他行程) 正在更新時回傳 False。"""
+        user_id = str(user_id)
+        now = time.time()
+        with self._lock:
+            if self.path is None:
+                entry = self._cache.get(user_id)
+                if entry is None or entry[2] > now:
+                    return False
+                entry[2] = now + seconds
+                return True
+            with self._db() as conn:
+                return conn.execute("UPDATE oauth_accounts SET lease = ? WHERE user_id = ? AND lease < ?",
+                                    (now + seconds, user_id, now)).rowcount == 1
@@ -0,0 +1,159 @@
+# 檔案名稱：utils/sse.py
+import asyncio
+import inspect
+import json
+import logging
+import threading
+from collections import deque
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+# 伺服器推播 (Server-Sent Events) 共用工具：取代儀表板的定時輪詢
+# 串流是事件循環上的 async generator，等待新資料時不佔用任何執行緒：
+# 緩衝區寫入時 (任何執行緒) 透過 AsyncWaiters 用 call_soon_threadsafe 喚醒正在等待的串流。
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # 關閉反向代理 (nginx / Render) 的緩衝，事件才會即時送達
+}
+
+
+def format_event(data, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """把一筆資料編成 SSE 格式的文字。"""
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    for line in payload.splitlines() or [""]:
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(value: Optional[str], last_seq: int) -> Optional[int]:
+    """解析 Last-Event-ID；格式錯誤或大於目前序號 (代表程式重啟過) 時回傳 None。"""
+    if not value or not value.isdigit():
+        return None
+    seq = int(value)
+    return seq if seq <= last_seq else None
+
+
+async def _resolve(value):
+    return await value if inspect.isawaitable(value) else value
+
+
+class AsyncWaiters:
+    """讓事件循環上的協程等待執行緒安全緩衝區的新資料；寫入端在資料寫入後呼叫 notify()。"""
+
+    def __init__(self):
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    def notify(self):
+        with self._lock:
+            waiters, self._waiters = self._waiters, set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # 事件循環已經關閉
+                pass
+
+    async def wait(self, ready: Callable[[], bool], timeout: float) -> bool:
+        """等到 ready() 成立或逾時，回傳 ready() 的結果。"""
+        loop = asyncio.get_running_loop()
+        entry = (loop, loop.create_future())
+        # 先登記再檢查：登記之前就寫入的資料在這裡會看到，之後寫入的一定會喚醒我們
+        with self._lock:
+            self._waiters.add(entry)
+        try:
+            if not ready():
+                await asyncio.wait_for(entry[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(entry)
+        return ready()
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def event_stream(fetch: Callable, wait_for: Callable, cursor: int, event: Optional[str] = None,
+                       heartbeat: float = 15.0, backlog: int = 200) -> AsyncIterator[str]:
+    """通用的 SSE 產生器 (async generator，在事件循環上輸出)。
+
+    fetch(cursor, limit) 回傳 (序號大於 cursor 的最舊 limit 筆資料, 下一個游標)，也就是緩衝區的 page()；
+    每筆需帶 seq，可以是過濾後的結果。wait_for(cursor, timeout) 等到有新資料或逾時，回傳是否有新資料。
+    兩者可以是一般函式或 coroutine function；wait_for 不能阻塞事件循環 (請用緩衝區的 wait_async)。
+    每次最多取 backlog 筆，分批依序送出，不會為單一客戶端堆積記憶體。
+    """
+    yield "retry: 3000\n\n"
+    while True:
+        items, next_cursor = await _resolve(fetch(cursor, backlog))
+        for item in items:
+            yield format_event(item, event=event, event_id=item["seq"])
+        # 游標由緩衝區在鎖內決定；過濾後沒有符合的資料時也會往前推，避免被其他伺服器的紀錄一直喚醒
+        cursor = max(cursor, next_cursor)
+        if items:
+            continue
+        if not await _resolve(wait_for(cursor, heartbeat)):
+            # 心跳：保持連線並讓伺服器及早發現已斷線的客戶端
+            yield ": ping\n\n"
+
+
+class LogLineBuffer(logging.Handler):
+    """把 logging 紀錄格式化後放進固定容量的記憶體緩衝區，供即時日誌串流使用。"""
+
+    def __init__(self, capacity: int = 1000, level=logging.NOTSET):
+        super().__init__(level)
+        self._lines = deque(maxlen=capacity)
+        self._last_seq = 0
+        self._cond = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._cond:
+            self._last_seq += 1
+            self._lines.append({"seq": self._last_seq, "line": line})
+            self._cond.notify_all()
+        self._async_waiters.notify()
+
+    def since(self, seq: int = 0, limit: Optional[int] = None) -> List[dict]:
+        return self.page(seq, limit)[0]
+
+    def page(self, seq: int = 0, limit: Optional[int] = None) -> Tuple[List[dict], int]:
+        """回傳 (序號大於 seq 的日誌行, 下次要帶的游標)；規則同 CommandLogBuffer.page。"""
+        with self._cond:
+            picked = []
+            for item in reversed(self._lines):
+                if item["seq"] <= seq or (seq == 0 and limit is not None and len(picked) >= limit):
+                    break
+                picked.append(item)
+            picked.reverse()
+            cursor = self._last_seq
+            if seq > 0 and limit is not None and len(picked) > limit:
+                picked = picked[:limit]
+                cursor = picked[-1]["seq"] if picked else seq
+            return picked, cursor
+
+    def wait_for(self, seq: int, timeout: float) -> bool:
+        """阻塞直到有序號大於 seq 的紀錄或逾時，回傳是否有新資料。"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_seq > seq, timeout)
+
+    async def wait_async(self, seq: int, timeout: float) -> bool:
+        """wait_for 的事件循環版本，等待時不佔用執行緒。"""
+        return await self._async_waiters.wait(lambda: self._last_seq > seq, timeout)
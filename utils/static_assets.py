@@ -0,0 +1,316 @@
+# 檔案名稱：utils/static_assets.py
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import struct
+import zlib
+from typing import Dict, NamedTuple, Optional
+
+from flask import Response, abort, request, url_for
+
+from utils.metrics import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # 沒裝 brotli 就只提供 gzip
+    brotli = None
+
+logger = logging.getLogger("StaticAssets")
+
+# 不需要建置步驟的靜態資源層：
+# - 啟動時掃描 static/，圖片做一次無損最佳化 (依檔頭判斷實際格式：PNG 去掉文字 / 時間區塊並以最高壓縮重新壓縮 IDAT，
+#   JPEG 去掉 EXIF 等中繼資料，保留色彩描述檔與非預設的旋轉方向)，
+#   文字類檔案預先壓好 gzip (有裝 brotli 時再加 br)；結果依原始檔內容雜湊存在 cache_dir，下次啟動直接讀取
+# - 每個檔案以內容雜湊產生帶指紋的網址 (flork_logo.3f2a9c1b7d.png)，模板用 asset_url('flork_logo.png') 取得
+# - 帶指紋的網址內容永遠不變，回應 Cache-Control: immutable，依 Accept-Encoding 直接送出預壓縮版本
+# 另外提供 install_compression：儀表板 HTML (內嵌 CSS / JS) 與 JSON 回應在送出前動態 gzip。
+
+ASSET_REQUESTS = REGISTRY.counter(
+    "dashboard_asset_requests_total", "帶指紋靜態資源的請求次數", ("encoding",))
+ASSET_BYTES = REGISTRY.counter(
+    "dashboard_asset_bytes_total", "帶指紋靜態資源送出的位元組數", ("encoding",))
+
+# 已經是壓縮格式的檔案再 gzip 沒有意義
+_COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".html", ".txt", ".map", ".ico")
+_IMAGES = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+# 移除後不影響顯示的 PNG 輔助區塊
+_PNG_DROP_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_JPEG_SIGNATURE = b"\xff\xd8\xff"
+# static/ 裡有副檔名與實際格式不符的圖片 (.png 其實是 JPEG)，Content-Type 依檔頭決定
+_SNIFF = ((_PNG_SIGNATURE, "image/png"), (_JPEG_SIGNATURE, "image/jpeg"), (b"GIF8", "image/gif"))
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    for signature, mimetype in _SNIFF:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def optimize_png(data: bytes) -> bytes:
+    """無損最佳化 PNG：移除文字 / 時間區塊，IDAT 以 zlib 最高等級重新壓縮；沒有變小就回傳原檔。"""
+    if not data.startswith(_PNG_SIGNATURE):
+        return data
+    chunks = []
+    idat = []
+    pos = len(_PNG_SIGNATURE)
+    try:
+        while pos < len(data):
+            length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+            body = data[pos + 8:pos + 8 + length]
+            pos += 12 + length
+            if kind == b"IDAT":
+                if not idat:
+                    chunks.append((b"IDAT", None))   # 佔位，之後換成合併後的 IDAT
+                idat.append(body)
+            elif kind not in _PNG_DROP_CHUNKS:
+                chunks.append((kind, body))
+            if kind == b"IEND":
+                break
+        raw = zlib.decompress(b"".join(idat))
+    except (struct.error, zlib.error):
+        return data
+
+    best = b"".join(idat)
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        candidate = compressor.compress(raw) + compressor.flush()
+        if len(candidate) < len(best):
+            best = candidate
+
+    out = [_PNG_SIGNATURE]
+    for kind, body in chunks:
+        if body is None:
+            body = best
+        out.append(struct.pack(">I", len(body)) + kind + body
+                   + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF))
+    result = b"".join(out)
+    return result if len(result) < len(data) else data
+
+
+def _exif_orientation(exif: bytes) -> int:
+    """讀 EXIF (APP1) 裡 IFD0 的 Orientation 標籤；讀不到就當成 1 (不旋轉)。"""
+    try:
+        tiff = exif[6:]   # 跳過 "Exif\0\0"
+        order = "<" if tiff[:2] == b"II" else ">"
+        offset = struct.unpack(order + "I", tiff[4:8])[0]
+        count = struct.unpack(order + "H", tiff[offset:offset + 2])[0]
+        for i in range(count):
+            entry = tiff[offset + 2 + i * 12:offset + 14 + i * 12]
+            tag, _, _, value = struct.unpack(order + "HHI4s", entry)
+            if tag == 0x0112:
+                return struct.unpack(order + "H", value[:2])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def optimize_jpeg(data: bytes) -> bytes:
+    """無損最佳化 JPEG：移除 EXIF / XMP / 註解等中繼資料區段，影像資料原封不動。"""
+    if not data.startswith(_JPEG_SIGNATURE):
+        return data
+    out = [data[:2]]
+    pos = 2
+    try:
+        while pos < len(data):
+            if data[pos] != 0xFF:
+                return data
+            marker = data[pos + 1]
+            if marker == 0xDA:          # SOS 之後是壓縮影像資料，直接整段保留
+                out.append(data[pos:])
+                break
+            length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+            segment = data[pos:pos + 2 + length]
+            pos += 2 + length
+            keep = True
+            if marker == 0xE1:          # APP1 (EXIF / XMP)：只有帶非預設旋轉方向的 EXIF 要留
+                keep = segment[4:10] == b"Exif\0\0" and _exif_orientation(segment[4:]) != 1
+            elif 0xE3 <= marker <= 0xEF or marker == 0xFE:   # 其餘 APPn 與註解 (APP0 JFIF、APP2 色彩描述檔保留)
+                keep = False
+            if keep:
+                out.append(segment)
+    except (IndexError, struct.error):
+        return data
+    result = b"".join(out)
+    return result if len(result) < len(data) else data
+
+
+def optimize_image(data: bytes) -> bytes:
+    mimetype = sniff_image_type(data)
+    if mimetype == "image/png":
+        return optimize_png(data)
+    if mimetype == "image/jpeg":
+        return optimize_jpeg(data)
+    return data
+
+
+class _Asset(NamedTuple):
+    name: str                       # 原始路徑 (相對於 static/)
+    url_name: str                   # 帶指紋的檔名
+    mimetype: str
+    etag: str
+    variants: Dict[str, bytes]      # encoding -> 內容 ("identity" / "gzip" / "br")
+
+
+class StaticAssets:
+    def __init__(self, static_dir: str, cache_dir: Optional[str] = None, url_prefix: str = "/assets",
+                 exclude=("temp_uploads",), max_age: int = 31536000):
+        self.static_dir = static_dir
+        self.cache_dir = cache_dir or None
+        self.url_prefix = url_prefix.rstrip("/")
+        self.exclude = set(exclude)
+        self.max_age = max_age
+        self._by_name: Dict[str, _Asset] = {}
+        self._by_url: Dict[str, _Asset] = {}
+
+    # ---------- 建立 ----------
+    def build(self):
+        """掃描 static_dir，建立所有資源的最佳化 / 壓縮版本與指紋對照表。"""
+        by_name, by_url = {}, {}
+        saved = 0
+        for root, dirs, files in os.walk(self.static_dir):
+            dirs[:] = [d for d in dirs if d not in self.exclude and not d.startswith(".")]
+            for filename in files:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+                try:
+                    with open(path, "rb") as f:
+                        source = f.read()
+                    asset = self._process(name, source)
+                except OSError as e:
+                    logger.warning(f"處理靜態檔案 {name} 失敗: {e}")
+                    continue
+                by_name[name] = asset
+                by_url[asset.url_name] = asset
+                saved += len(source) - len(asset.variants["identity"])
+        self._by_name, self._by_url = by_name, by_url
+        logger.info(f"靜態資源準備完成：{len(by_name)} 個檔案，最佳化節省 {saved} bytes")
+        return self
+
+    def _process(self, name: str, source: bytes) -> _Asset:
+        ext = os.path.splitext(name)[1].lower()
+        variants = self._load_cached(source, ext)
+        if variants is None:
+            body = optimize_image(source) if ext in _IMAGES else source
+            variants = {"identity": body}
+            if ext in _COMPRESSIBLE:
+                gz = gzip.compress(body, compresslevel=9, mtime=0)
+                if len(gz) < len(body):
+                    variants["gzip"] = gz
+                if brotli is not None:
+                    br = brotli.compress(body, quality=11)
+                    if len(br) < len(body):
+                        variants["br"] = br
+            self._store_cached(source, ext, variants)
+
+        digest = hashlib.sha256(variants["identity"]).hexdigest()[:10]
+        stem, _ = os.path.splitext(name)
+        mimetype = (sniff_image_type(variants["identity"]) if ext in _IMAGES else None) \
+            or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return _Asset(name, f"{stem}.{digest}{ext}", mimetype, f'"{digest}"', variants)
+
+    # 快取檔：<原始檔 sha256><副檔名>[.gz|.br]，原始檔沒變就不用重新最佳化
+    def _cache_path(self, source: bytes, ext: str, encoding: str) -> str:
+        suffix = {"identity": "", "gzip": ".gz", "br": ".br"}[encoding]
+        return os.path.join(self.cache_dir, hashlib.sha256(source).hexdigest() + ext + suffix)
+
+    def _load_cached(self, source: bytes, ext: str) -> Optional[Dict[str, bytes]]:
+        if self.cache_dir is None:
+            return None
+        manifest = self._cache_path(source, ext, "identity") + ".json"
+        try:
+            with open(manifest, "r", encoding="utf-8") as f:
+                encodings = json.load(f)
+            if brotli is not None and ext in _COMPRESSIBLE and "br" not in encodings.get("tried", ()):
+                return None
+            variants = {}
+            for encoding in encodings["variants"]:
+                with open(self._cache_path(source, ext, encoding), "rb") as f:
+                    variants[encoding] = f.read()
+            return variants if "identity" in variants else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _store_cached(self, source: bytes, ext: str, variants: Dict[str, bytes]):
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for encoding, body in variants.items():
+                with open(self._cache_path(source, ext, encoding), "wb") as f:
+                    f.write(body)
+            tried = ["gzip"] + (["br"] if brotli is not None else [])
+            with open(self._cache_path(source, ext, "identity") + ".json", "w", encoding="utf-8") as f:
+                json.dump({"variants": list(variants), "tried": tried}, f)
+        except OSError as e:
+            logger.warning(f"寫入靜態資源快取失敗: {e}")
+
+    # ---------- 查詢 ----------
+    def url(self, filename: str) -> str:
+        """模板用：回傳帶指紋的網址；不在對照表裡 (例如執行中才新增的檔案) 就退回一般的 /static 網址。"""
+        asset = self._by_name.get(filename)
+        if asset is None:
+            return url_for("static", filename=filename)
+        return f"{self.url_prefix}/{asset.url_name}"
+
+    def fingerprint(self) -> str:
+        """所有資源指紋的雜湊 (任何靜態檔案變動都會改變)。"""
+        return hashlib.sha256("\n".join(sorted(self._by_url)).encode()).hexdigest()[:16]
+
+    def serve(self, url_name: str):
+        asset = self._by_url.get(url_name)
+        if asset is None:
+            abort(404)
+        encoding = "identity"
+        accept = request.accept_encodings
+        for candidate in ("br", "gzip"):
+            if candidate in asset.variants and accept[candidate]:
+                encoding = candidate
+                break
+        body = asset.variants[encoding]
+        response = Response(body, mimetype=asset.mimetype)
+        response.headers["Cache-Control"] = f"public, max-age={self.max_age}, immutable"
+        response.headers["ETag"] = asset.etag
+        if len(asset.variants) > 1:
+            response.vary.add("Accept-Encoding")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        ASSET_REQUESTS.inc(encoding)
+        ASSET_BYTES.inc(encoding, amount=len(body))
+        return response
+
+    def init_app(self, app):
+        app.add_url_rule(f"{self.url_prefix}/<path:url_name>", "assets", self.serve)
+        app.jinja_env.globals["asset_url"] = self.url
+        return self
+
+
+_DYNAMIC_TYPES = ("text/html", "application/json", "text/plain", "text/css", "application/javascript")
+
+
+def install_compression(app, min_size: int = 1024, level: int = 6):
+    """動態回應 (模板、JSON API) 超過 min_size 且瀏覽器接受 gzip 時，送出前壓縮；串流回應不處理。"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+                or response.mimetype not in _DYNAMIC_TYPES or not request.accept_encodings["gzip"]):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    return compress_response
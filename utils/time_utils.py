@@ -5,3 +5,19 @@ def safe_now():
     """獲取本地時區的格式化時間字串 (亞洲/台北 UTC+8)"""
     tz = timezone(timedelta(hours=8))
     return datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parse_local_time(text: str) -> float:
+    """把 "YYYY-MM-DD"、"YYYY-MM-DD HH:MM[:SS]" (亞洲/台北 UTC+8) 或 Unix 秒數轉成時間戳。"""
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    tz = timezone(timedelta(hours=8))
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).replace(tzinfo=tz).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"無法解析時間: {text}")